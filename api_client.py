@@ -1,17 +1,171 @@
 """API客户端模块"""
 
-from openai import OpenAI
+import asyncio
+import importlib.util
+import threading
+from types import SimpleNamespace
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+import config
+import retry_policy
+
+# 客户端池：同一 (api_key, base_url) 复用同一个OpenAI实例，
+# 所有实例共用一个httpx连接池（保持连接，避免重复的TCP/TLS握手）。
+# 重试由 retry_policy 负责，OpenAI实例自身不再重试（max_retries=0）
+_client_pool = {}
+_async_client_pool = {}
+_pool_lock = threading.Lock()
+_http_client = None
+_async_http_client = None
+
+
+def _http2_available():
+    """是否安装了h2（httpx的HTTP/2支持依赖它）"""
+    return config.HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+
+
+def _http_client_options():
+    """httpx客户端的公共参数（连接池、超时、HTTP/2）"""
+    return {
+        "http2": _http2_available(),
+        "timeout": httpx.Timeout(config.HTTP_READ_TIMEOUT,
+                                 connect=config.HTTP_CONNECT_TIMEOUT,
+                                 write=config.HTTP_WRITE_TIMEOUT,
+                                 pool=config.HTTP_POOL_TIMEOUT),
+        "limits": httpx.Limits(max_connections=config.HTTP_MAX_CONNECTIONS,
+                               max_keepalive_connections=config.HTTP_MAX_KEEPALIVE,
+                               keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY),
+    }
+
+
+def get_http_client():
+    """共享的httpx客户端（首次调用时创建）"""
+    global _http_client
+    with _pool_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(**_http_client_options())
+        return _http_client
+
+
+def get_async_http_client():
+    """共享的异步httpx客户端（只能在同一个事件循环中使用）"""
+    global _async_http_client
+    with _pool_lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(**_http_client_options())
+        return _async_http_client
+
+
+def get_openai_client(api_key, base_url):
+    """从客户端池获取 (api_key, base_url) 对应的OpenAI实例"""
+    key = (api_key, base_url.rstrip('/'))
+    http_client = get_http_client()
+    with _pool_lock:
+        client = _client_pool.get(key)
+        if client is None:
+            client = OpenAI(api_key=api_key, base_url=key[1], http_client=http_client,
+                            max_retries=0)
+            _client_pool[key] = client
+        return client
+
+
+def get_async_openai_client(api_key, base_url):
+    """从客户端池获取 (api_key, base_url) 对应的AsyncOpenAI实例"""
+    key = (api_key, base_url.rstrip('/'))
+    http_client = get_async_http_client()
+    with _pool_lock:
+        client = _async_client_pool.get(key)
+        if client is None:
+            client = AsyncOpenAI(api_key=api_key, base_url=key[1], http_client=http_client,
+                                 max_retries=0)
+            _async_client_pool[key] = client
+        return client
+
+
+def prefix_completion_base_url(base_url):
+    """DeepSeek对话前缀续写的端点，不是DeepSeek官方端点时返回None"""
+    url = base_url.rstrip('/')
+    if "api.deepseek.com" not in url:
+        return None
+    if url.endswith(config.DEEPSEEK_PREFIX_COMPLETION_PATH):
+        return url
+    if url.endswith("/v1"):
+        url = url[:-3]
+    return url + config.DEEPSEEK_PREFIX_COMPLETION_PATH
+
+
+def _resume_params(params, partial_answer):
+    """续传中断的流式回答：把已收到的回答作为前缀，让模型接着生成"""
+    messages = list(params["messages"])
+    messages.append({"role": "assistant", "content": partial_answer, "prefix": True})
+    return dict(params, messages=messages)
+
+
+def _chunk_delta(chunk):
+    """chunk中的增量，没有时返回None"""
+    return chunk.choices[0].delta if chunk.choices else None
+
+
+def _text_chunk(content=None, reasoning_content=None, usage=None):
+    """构造一个与API返回的chunk结构相同的对象"""
+    delta = SimpleNamespace(content=content, reasoning_content=reasoning_content)
+    return SimpleNamespace(usage=usage, choices=[SimpleNamespace(delta=delta)])
+
+
+def _title_params(messages, model, use_chat_model):
+    """生成标题的请求参数"""
+    # 如果使用reasoner模型，临时切换到chat模型生成标题
+    if use_chat_model:
+        model = "deepseek-chat"
+    return {
+        "model": model,
+        "messages": messages,
+        "max_tokens": 50,
+        "temperature": 0.7,
+        "stream": False
+    }
+
+
+def _summary_params(conversation_text, previous_summary, max_tokens):
+    """生成（或更新）对话摘要的请求参数"""
+    instruction = ("请将以下对话压缩为简洁的摘要，保留用户的需求、重要的事实、结论和未解决的问题，"
+                   "使用第三人称，只返回摘要内容。")
+    if previous_summary:
+        instruction += "已有之前对话的摘要，请将其与新的对话合并为一份摘要。"
+        content = f"之前的摘要：\n{previous_summary}\n\n新的对话：\n{conversation_text}"
+    else:
+        content = conversation_text
+    return {
+        "model": "deepseek-chat",
+        "messages": [{"role": "system", "content": instruction},
+                     {"role": "user", "content": content}],
+        "max_tokens": max_tokens,
+        "temperature": 0.3,
+        "stream": False
+    }
+
+
+def _connection_test_params(model, max_tokens, temperature):
+    """测试连接的请求参数"""
+    return {
+        "model": model,
+        "messages": [{"role": "user", "content": "你好！请回复'连接成功'"}],
+        "max_tokens": max_tokens,
+        "temperature": temperature
+    }
 
 
 class DeepSeekAPIClient:
-    """DeepSeek API客户端封装"""
+    """DeepSeek API客户端封装（同步，用于在发送线程中生成摘要；
+    对话、标题和连接测试使用 AsyncDeepSeekAPIClient）"""
     
     def __init__(self, api_key, base_url):
-        """初始化，但此时不创建客户端，因为base_url可能变化"""
+        """初始化，客户端从客户端池获取，重复连接或切换端点时不会新建连接池"""
         self.api_key = api_key
         self.default_base_url = base_url
-        # 先创建一个默认客户端，后续可根据需要创建新的
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.client = get_openai_client(api_key, base_url)
     
     def build_params(self, model, messages, max_tokens, temperature, stream, 
                     is_reasoner_model, thinking_enabled):
@@ -23,6 +177,9 @@ class DeepSeekAPIClient:
             "temperature": temperature,
             "stream": stream
         }
+        # 流式响应的最后一个chunk返回本次用量
+        if stream:
+            params["stream_options"] = {"include_usage": True}
         
         # 思考模式参数处理
         # 如果是 deepseek-chat 模型且启用了思考模式，添加 thinking 参数
@@ -33,47 +190,139 @@ class DeepSeekAPIClient:
         return params
 
     def _get_client(self, base_url=None):
-        """获取指定base_url的客户端实例"""
-        if base_url and base_url != getattr(self.client, '_base_url', None):
-            # 如果base_url变化，创建新的客户端实例
-            return OpenAI(api_key=self.api_key, base_url=base_url)
+        """获取指定base_url的客户端实例（来自客户端池）"""
+        if base_url and base_url != self.default_base_url:
+            return get_openai_client(self.api_key, base_url)
         return self.client
     
-    def create_completion(self, base_url=None, **params):
-        """创建对话完成（非流式）"""
+    def create_completion(self, base_url=None, on_retry=None, **params):
+        """创建对话完成（非流式），暂时性错误自动重试
+
+        on_retry(第几次重试, 等待秒数, 错误) 在每次重试前调用（在请求线程中）。
+        """
         client = self._get_client(base_url)
-        return client.chat.completions.create(**params)
+        return retry_policy.call_with_retry(
+            lambda: client.chat.completions.create(**params), on_retry)
     
-    def create_completion_stream(self, base_url=None, **params):
-        """创建对话完成（流式）"""
+    def summarize_conversation(self, conversation_text, previous_summary=None,
+                               max_tokens=500, base_url=None):
+        """生成（或更新）对话摘要，使用chat模型，返回摘要文本"""
+        response = self.create_completion(
+            base_url=base_url, **_summary_params(conversation_text, previous_summary, max_tokens))
+        return response.choices[0].message.content
+
+
+class AsyncDeepSeekAPIClient(DeepSeekAPIClient):
+    """DeepSeek API异步客户端（基于AsyncOpenAI）
+
+    除 build_params 外的方法都是协程，需要在 async_bridge.AsyncLoopThread
+    的事件循环中运行（共享的异步连接池属于该循环）。
+    """
+
+    def __init__(self, api_key, base_url):
+        """初始化，客户端从异步客户端池获取"""
+        self.api_key = api_key
+        self.default_base_url = base_url
+        self.client = get_async_openai_client(api_key, base_url)
+
+    def _get_client(self, base_url=None):
+        """获取指定base_url的异步客户端实例（来自客户端池）"""
+        if base_url and base_url != self.default_base_url:
+            return get_async_openai_client(self.api_key, base_url)
+        return self.client
+
+    async def create_completion(self, base_url=None, on_retry=None, **params):
+        """创建对话完成（非流式），暂时性错误自动重试
+
+        on_retry(第几次重试, 等待秒数, 错误) 在每次重试前调用（在事件循环线程中）。
+        """
         client = self._get_client(base_url)
-        return client.chat.completions.create(**params)
-    
-    def test_connection(self, model, base_url=None, max_tokens=10, temperature=0.1):
+        return await retry_policy.call_with_retry_async(
+            lambda: client.chat.completions.create(**params), on_retry)
+
+    async def create_completion_stream(self, base_url=None, on_retry=None, **params):
+        """创建对话完成（流式），返回异步可迭代的流
+
+        连接失败或流在中途断开时自动重试。已经收到部分回答时，用DeepSeek的
+        对话前缀续写接着生成，已收到的内容保留且不会重复。
+        """
+        return self._resilient_stream(base_url, on_retry, params)
+
+    async def _resilient_stream(self, base_url, on_retry, params):
+        """逐个产生chunk的异步生成器，负责限速、重试和续传"""
+        client = self._get_client(base_url)
+        request_params = params
+        answer = []  # 已收到的回答片段
+        has_reasoning = False
+        resumed = False
+        resumes = 0
+        attempt = 0
+        while True:
+            await retry_policy.rate_limiter.acquire_async()
+            stream = None
+            try:
+                stream = await client.chat.completions.create(**request_params)
+                async for chunk in stream:
+                    delta = _chunk_delta(chunk)
+                    if delta is not None:
+                        reasoning = getattr(delta, 'reasoning_content', None)
+                        content = getattr(delta, 'content', None)
+                        if resumed and reasoning:
+                            # 续写时只接回答，思考过程已经显示过
+                            if not content:
+                                continue
+                            chunk = _text_chunk(content, usage=getattr(chunk, 'usage', None))
+                            reasoning = None
+                        if content:
+                            answer.append(content)
+                        if reasoning:
+                            has_reasoning = True
+                        if content or reasoning:
+                            attempt = 0  # 有新内容，重新计算重试次数
+                    yield chunk
+                return
+            except Exception as e:
+                delay = retry_policy.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                if answer:
+                    # 已有部分回答：续写（不支持前缀续写的端点无法续传）
+                    resume_url = prefix_completion_base_url(base_url or self.default_base_url)
+                    if resume_url is None or resumes >= config.API_MAX_STREAM_RESUMES:
+                        raise
+                    resumes += 1
+                    resumed = True
+                    client = self._get_client(resume_url)
+                    request_params = _resume_params(params, ''.join(answer))
+                elif has_reasoning:
+                    # 只收到了思考过程：重新生成，在已显示的思考过程后加上说明
+                    has_reasoning = False
+                    yield _text_chunk(reasoning_content="\n\n（连接中断，重新思考）\n\n")
+                attempt += 1
+                retry_policy.notify_retry(on_retry, attempt, delay, e)
+                await asyncio.sleep(delay)
+            finally:
+                if stream is not None:
+                    try:
+                        await stream.close()
+                    except Exception:
+                        pass
+
+    async def test_connection(self, model, base_url=None, max_tokens=10, temperature=0.1):
         """测试API连接"""
         client = self._get_client(base_url)
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": "你好！请回复'连接成功'"}],
-            max_tokens=max_tokens,
-            temperature=temperature
-        )
+        response = await client.chat.completions.create(
+            **_connection_test_params(model, max_tokens, temperature))
         return response.choices[0].message.content
-    
-    def generate_title(self, messages, model, use_chat_model=False):
+
+    async def generate_title(self, messages, model, use_chat_model=False):
         """生成对话标题"""
-        # 如果使用reasoner模型，临时切换到chat模型生成标题
-        if use_chat_model:
-            model = "deepseek-chat"
-        
-        api_params = {
-            "model": model,
-            "messages": messages,
-            "max_tokens": 50,
-            "temperature": 0.7,
-            "stream": False
-        }
-        
-        response = self.client.chat.completions.create(**api_params)
-        return response
+        return await self.create_completion(**_title_params(messages, model, use_chat_model))
+
+    async def summarize_conversation(self, conversation_text, previous_summary=None,
+                                     max_tokens=500, base_url=None):
+        """生成（或更新）对话摘要，使用chat模型，返回摘要文本"""
+        response = await self.create_completion(
+            base_url=base_url, **_summary_params(conversation_text, previous_summary, max_tokens))
+        return response.choices[0].message.content
 
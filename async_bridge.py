@@ -0,0 +1,102 @@
+"""asyncio与Tk的桥接模块
+
+AsyncLoopThread 在一个后台线程中运行asyncio事件循环，所有异步API请求都在
+这个循环上并发执行，不需要为每个请求创建线程。TkAsyncBridge 把协程的结果
+放入队列，由UI线程通过 after 定时取出并调用回调，回调总是在UI线程中执行。
+"""
+
+import asyncio
+import queue
+import threading
+
+import config
+
+
+class AsyncLoopThread:
+    """运行asyncio事件循环的后台线程"""
+
+    def __init__(self):
+        """初始化（调用 start() 后才会运行）"""
+        self.loop = asyncio.new_event_loop()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动后台线程（重复调用无效果）"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """后台线程函数"""
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """在事件循环中运行协程，返回 concurrent.futures.Future
+
+        取消返回的Future会取消对应的任务。
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        """停止事件循环"""
+        if self._thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class TkAsyncBridge:
+    """把事件循环中协程的结果交给Tk的UI线程"""
+
+    def __init__(self, root, loop_thread, poll_ms=config.ASYNC_BRIDGE_POLL_MS):
+        """初始化"""
+        self.root = root
+        self.loop_thread = loop_thread
+        self.poll_ms = poll_ms
+        self._results = queue.Queue()
+        self._pending = 0  # 尚未交付结果的协程数（只在UI线程中修改）
+        self._polling = False
+
+    def call(self, coro, callback=None, errback=None):
+        """在事件循环中运行协程（UI线程调用）
+
+        完成后在UI线程中调用 callback(结果) 或 errback(异常)；
+        被取消时两者都不调用。返回 concurrent.futures.Future，可用于取消。
+        """
+        future = self.loop_thread.submit(coro)
+        self._pending += 1
+        future.add_done_callback(
+            lambda done: self._results.put((done, callback, errback)))
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+        return future
+
+    def _poll(self):
+        """取出已完成的协程并调用回调（UI线程）"""
+        while True:
+            try:
+                future, callback, errback = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if future.cancelled():
+                continue
+            error = future.exception()
+            try:
+                if error is None:
+                    if callback:
+                        callback(future.result())
+                elif errback:
+                    errback(error)
+                else:
+                    print(f"异步请求失败: {error}")
+            except Exception as e:
+                print(f"异步请求回调出错: {e}")
+
+        if self._pending > 0:
+            self.root.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False
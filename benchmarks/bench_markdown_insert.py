@@ -0,0 +1,96 @@
+"""Markdown渲染写入基准测试
+
+比较逐个文本节点调用 Text.insert（旧方式）与合并片段后一次
+insert(index, text1, tags1, ...)（新方式）的Tcl调用次数和耗时。
+
+用法: python benchmarks/bench_markdown_insert.py [段落组数]
+"""
+
+import os
+import sys
+import time
+import tkinter as tk
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import markdown_renderer  # noqa: E402
+
+
+class _LegacyParser(markdown_renderer.HTMLToTextWidgetParser):
+    """旧方式：每个文本节点、每个换行各产生一个片段（即一次insert）"""
+
+    def _emit(self, text, tags):
+        self.segments.append((text, tags))
+
+
+def build_sample(groups):
+    """生成包含标题、列表、行内代码和代码块的长回答"""
+    parts = []
+    for i in range(groups):
+        parts.append(f"## 第{i + 1}节 说明\n")
+        parts.append(f"这是一段包含 **加粗**、`inline_code_{i}` 和普通文字的段落，"
+                     f"用于模拟较长的回答内容。\n")
+        for j in range(8):
+            parts.append(f"- 列表项 {j}：调用 `func_{j}()` 并检查 **返回值**")
+        parts.append("")
+        parts.append("```python\nfor i in range(10):\n    print(i)\n```\n")
+        parts.append("> 引用内容，包含 `code` 片段\n")
+    return "\n".join(parts)
+
+
+def legacy_segments(renderer, text, base_tag):
+    """用旧方式解析得到逐节点片段"""
+    parser = _LegacyParser(base_tag)
+    parser.feed(renderer.to_html(text))
+    parser.close()
+    return parser.segments
+
+
+def time_insert(text_widget, calls):
+    """执行一组insert调用并返回耗时（秒）"""
+    text_widget.delete("1.0", tk.END)
+    text_widget.update_idletasks()
+    start = time.perf_counter()
+    for args in calls:
+        text_widget.insert(tk.END, *args)
+    text_widget.update_idletasks()
+    return time.perf_counter() - start
+
+
+def main():
+    groups = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    text = build_sample(groups)
+    renderer = markdown_renderer.MarkdownRenderer()
+
+    old_segments = legacy_segments(renderer, text, "ai_message")
+    new_segments = renderer.get_segments(text, "ai_message")
+    old_calls = list(old_segments)
+    new_calls = [markdown_renderer.flatten_segments(new_segments)]
+
+    print(f"Markdown长度: {len(text)} 字符")
+    print(f"旧方式 insert 调用次数: {len(old_calls)}")
+    print(f"新方式 insert 调用次数: {len(new_calls)} （合并后片段数 {len(new_segments)}）")
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"无法创建Tk窗口，跳过耗时测试: {e}")
+        return
+    root.withdraw()
+    text_widget = tk.Text(root, wrap=tk.WORD, width=100)
+    markdown_renderer.configure_text_tags(text_widget)
+    text_widget.pack()
+
+    rounds = 5
+    old_time = min(time_insert(text_widget, old_calls) for _ in range(rounds))
+    new_time = min(time_insert(text_widget, new_calls) for _ in range(rounds))
+    root.destroy()
+
+    print(f"旧方式耗时: {old_time * 1000:.1f} ms")
+    print(f"新方式耗时: {new_time * 1000:.1f} ms")
+    if new_time > 0:
+        print(f"加速比: {old_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
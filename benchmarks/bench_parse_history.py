@@ -0,0 +1,196 @@
+"""历史记录解析基准测试
+
+在合成的大型导出文件（默认约10MB，含较长的思考过程）上比较逐行解析
+（旧方式）与单次扫描解析（ChatHistoryScanner）的耗时，并检查两者输出一致。
+传入文件路径时同时检查这些已有导出文件的输出是否一致。
+
+用法: python benchmarks/bench_parse_history.py [目标MB数] [导出文件 ...]
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import history_manager  # noqa: E402
+
+
+def legacy_parse_chat_history(content):
+    """旧的逐行解析实现（用于对比）"""
+    history = []
+    lines = content.split('\n')
+
+    current_role = None
+    current_content = []
+    current_reasoning = None
+    in_round = False
+    in_thinking = False
+
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+
+        if line.startswith('# DeepSeek AI 对话记录') or \
+           line.startswith('标题:') or \
+           line.startswith('导出时间:') or \
+           line.startswith('模型:') or \
+           (line.startswith('# ') and i < 3) or \
+           line == '':
+            i += 1
+            continue
+
+        round_match = re.match(r'^##\s+第(\d+)轮\s+-\s+(.+)$', line)
+        if round_match:
+            if current_role and current_content:
+                msg = {
+                    "role": current_role,
+                    "content": '\n'.join(current_content).strip()
+                }
+                if current_reasoning:
+                    msg["reasoning_content"] = current_reasoning.strip()
+                history.append(msg)
+
+            role_name = round_match.group(2).strip()
+            if role_name == "我":
+                current_role = "user"
+            elif "DeepSeek" in role_name or "AI" in role_name:
+                current_role = "assistant"
+            else:
+                current_role = None
+
+            current_content = []
+            current_reasoning = None
+            in_round = True
+            in_thinking = False
+            i += 1
+            continue
+
+        if line.startswith('### 🧠 思考过程') or line.startswith('### 思考过程'):
+            in_thinking = True
+            current_reasoning = []
+            i += 1
+            continue
+
+        if line.startswith('### 💡 最终回答') or line.startswith('### 最终回答'):
+            in_thinking = False
+            if current_reasoning:
+                current_reasoning = '\n'.join(current_reasoning)
+            i += 1
+            continue
+
+        if line == '---' or line == '***':
+            i += 1
+            continue
+
+        if in_round and current_role:
+            if in_thinking and current_reasoning is not None:
+                current_reasoning.append(lines[i])
+            else:
+                current_content.append(lines[i])
+
+        i += 1
+
+    if current_role and current_content:
+        msg = {
+            "role": current_role,
+            "content": '\n'.join(current_content).strip()
+        }
+        if current_reasoning:
+            if isinstance(current_reasoning, list):
+                current_reasoning = '\n'.join(current_reasoning)
+            msg["reasoning_content"] = current_reasoning.strip()
+        history.append(msg)
+
+    return history
+
+
+def build_export(target_bytes):
+    """按 export_chat 的格式生成合成导出文件"""
+    parts = [
+        "# 合成对话\n\n",
+        "标题: 合成对话\n",
+        "导出时间: 2024-01-01 12:00:00\n",
+        "模型: deepseek-reasoner\n",
+        "导出模式: 全部对话\n\n",
+    ]
+    size = 0
+    round_no = 1
+    while size < target_bytes:
+        question = f"第{round_no}个问题：如何在 Python 中处理 **大文件**？\n请给出 `mmap` 示例。"
+        reasoning = "\n".join(
+            f"思考步骤 {j}：分析需求，考虑内存占用与 I/O 性能，比较逐行读取和内存映射。"
+            for j in range(60))
+        answer = "\n".join([
+            "## 方案概述",
+            "",
+            "- 使用 `mmap` 映射文件",
+            "- 使用生成器逐块处理",
+            "* 避免一次性 `read()`",
+            "",
+            "```python",
+            "import mmap",
+            "with open(path, 'rb') as f:",
+            "    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)",
+            "```",
+            "",
+            "> 注意：大文件处理时应关注峰值内存。",
+        ] * 3)
+
+        for role, msg in (("我", {"content": question}),
+                          ("DeepSeek AI", {"content": answer, "reasoning_content": reasoning})):
+            block = [f"## 第{round_no}轮 - {role}\n\n"]
+            if msg.get("reasoning_content"):
+                block.append("### 🧠 思考过程\n\n")
+                block.append(f"{msg['reasoning_content']}\n\n")
+                block.append("### 💡 最终回答\n\n")
+            block.append(f"{msg['content']}\n\n")
+            block.append("---\n\n")
+            text = "".join(block)
+            parts.append(text)
+            size += len(text.encode('utf-8'))
+            round_no += 1
+    return "".join(parts)
+
+
+def best_time(func, content, rounds=3):
+    """多次运行取最短耗时（秒）"""
+    best = None
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func(content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    target_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    manager = history_manager.HistoryManager.__new__(history_manager.HistoryManager)
+
+    # 已有导出文件：只检查输出是否一致
+    for path in sys.argv[2:]:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        same = legacy_parse_chat_history(content) == manager.parse_chat_history(content)
+        print(f"{path}: {'输出一致' if same else '输出不一致！'}")
+
+    content = build_export(int(target_mb * 1024 * 1024))
+    print(f"合成导出文件: {len(content.encode('utf-8')) / 1024 / 1024:.1f} MB, "
+          f"{content.count(chr(10))} 行")
+
+    old_time, old_result = best_time(legacy_parse_chat_history, content)
+    new_time, new_result = best_time(manager.parse_chat_history, content)
+
+    print(f"消息数: {len(new_result)}")
+    print(f"输出一致: {old_result == new_result}")
+    print(f"旧方式耗时: {old_time * 1000:.1f} ms")
+    print(f"新方式耗时: {new_time * 1000:.1f} ms")
+    if new_time > 0:
+        print(f"加速比: {old_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -42,6 +42,17 @@ args.extend([
     '--add-data=markdown_renderer.py;.',
     '--add-data=api_client.py;.',
     '--add-data=history_manager.py;.',
+    '--add-data=stream_engine.py;.',
+    '--add-data=conversation_store.py;.',
+    '--add-data=history_watcher.py;.',
+    '--add-data=search_index.py;.',
+    '--add-data=history_loader.py;.',
+    '--add-data=context_manager.py;.',
+    '--add-data=token_counter.py;.',
+    '--add-data=async_bridge.py;.',
+    '--add-data=session_manager.py;.',
+    '--add-data=request_scheduler.py;.',
+    '--add-data=retry_policy.py;.',
     '--hidden-import=tkinter',
     '--hidden-import=openai',
     '--clean',
@@ -35,75 +35,213 @@ def bind_text_mousewheel(text_widget, canvas):
     text_widget.bind("<MouseWheel>", on_text_mousewheel)
 
 
-def update_text_height(text_widget):
-    """根据内容动态更新Text widget的高度（考虑自动换行）"""
-    text_widget.update_idletasks()
+def _count_ypixels(text_widget, index1, index2):
+    """统计两个索引之间的像素高度（强制更新布局）"""
+    result = text_widget.count(index1, index2, "update", "ypixels")
+    if isinstance(result, tuple):
+        result = result[0]
+    return result or 0
+
+
+class TextHeightTracker:
+    """Text widget的增量高度跟踪器
+    
+    以 (行号, 累计像素高度) 检查点缓存已测量的逻辑行，每次只测量
+    最后一个检查点之后的尾部；宽度变化或中间内容被修改时失效。
+    """
+    
+    def __init__(self):
+        self._checkpoints = [(0, 0)]
+        self._width = None
+        self._linespace = None
+        self.applied_height = None
     
-    # 获取逻辑行数，用于后续计算
-    end_index = text_widget.index(tk.END)
-    logical_line_count = int(end_index.split('.')[0])
+    def invalidate(self, from_line=1):
+        """使从 from_line（逻辑行号，从1开始）起的缓存失效"""
+        while len(self._checkpoints) > 1 and self._checkpoints[-1][0] >= from_line:
+            self._checkpoints.pop()
+    
+    def measure(self, text_widget):
+        """返回完整显示内容所需的高度（以行为单位）"""
+        last_line = int(text_widget.index("end-1c").split('.')[0])
+        
+        width = text_widget.winfo_width()
+        if width <= 1:
+            # 尚未显示，宽度未知，暂用逻辑行数（显示后会触发<Configure>重新计算）
+            return last_line
+        
+        if width != self._width:
+            self._width = width
+            self.invalidate()
+        
+        if self._linespace is None:
+            self._linespace = int(text_widget.tk.call(
+                "font", "metrics", text_widget.cget("font"), "-linespace")) or 1
+        
+        # 内容被删减到缓存范围之内时，丢弃失效的检查点
+        self.invalidate(last_line)
+        stable_line, stable_px = self._checkpoints[-1]
+        
+        # 只测量尾部：最后一个检查点之后到最后一行开头，以及最后一行本身
+        body_px = stable_px
+        if last_line > stable_line + 1:
+            body_px += _count_ypixels(text_widget, f"{stable_line + 1}.0", f"{last_line}.0")
+            self._checkpoints.append((last_line - 1, body_px))
+        
+        content_px = body_px
+        # 末尾的空行（内容以换行结束）不计入高度
+        if text_widget.compare(f"{last_line}.0", "!=", "end-1c"):
+            content_px += _count_ypixels(text_widget, f"{last_line}.0", "end")
+        
+        return max(1, -(-content_px // self._linespace))
+
+
+def _get_height_tracker(text_widget):
+    """获取（或创建）Text widget对应的高度跟踪器"""
+    tracker = getattr(text_widget, '_height_tracker', None)
+    if tracker is None:
+        tracker = TextHeightTracker()
+        text_widget._height_tracker = tracker
+    return tracker
+
+
+def invalidate_text_height(text_widget, from_index="1.0"):
+    """内容在 from_index 处被删除或改写后，使该位置之后的高度缓存失效"""
+    line = int(text_widget.index(from_index).split('.')[0])
+    _get_height_tracker(text_widget).invalidate(line)
+
+
+def update_text_height(text_widget):
+    """根据内容动态更新Text widget的高度（考虑自动换行）
     
+    只重新测量上次调用之后追加的尾部，已测量的逻辑行使用缓存，
+    因此流式追加时每次的开销与新增内容成正比，而不是与整条消息成正比。
+    """
+    tracker = _get_height_tracker(text_widget)
     try:
-        # 计算到最后一行的显示行数（不包含末尾换行符）
-        if logical_line_count > 0:
-            last_line_num = logical_line_count - 1
-            # 获取最后一行的最后一个字符位置
-            last_line_end = text_widget.index(f"{last_line_num}.end")
-            # 计算到最后一行的显示行数（不包含末尾换行符）
-            display_line_count = text_widget.count("1.0", last_line_end, "displaylines")[0]
+        height = tracker.measure(text_widget)
+    except tk.TclError:
+        # 测量失败时回退到逻辑行数
+        tracker.invalidate()
+        height = int(text_widget.index("end-1c").split('.')[0])
+    
+    if height != tracker.applied_height:
+        text_widget.configure(height=height)
+        tracker.applied_height = height
+
+
+class StreamRenderBatcher:
+    """流式渲染批处理器：累积增量，每个显示帧最多写入Text widget一次"""
+    
+    def __init__(self, text_widget, on_flush=None, writer=None,
+                 interval_ms=config.RENDER_FRAME_INTERVAL_MS):
+        """初始化批处理器
+        
+        on_flush: 每次写入后调用一次（用于更新高度和滚动区域）
+        writer: 自定义写入函数，参数为 [(文本, 标签), ...]；默认直接插入到末尾
+        """
+        self.text_widget = text_widget
+        self.on_flush = on_flush
+        self.writer = writer
+        self.interval_ms = interval_ms
+        self._segments = []  # [(文本片段列表, 标签)]
+        self._after_id = None
+    
+    def append(self, text, tag):
+        """追加增量，相邻同标签的增量合并为一段"""
+        if not text:
+            return
+        if self._segments and self._segments[-1][1] == tag:
+            self._segments[-1][0].append(text)
         else:
-            display_line_count = 0
-        
-    except Exception as e:
-        # 如果count方法失败，回退到原来的方法
-        display_line_count = int(text_widget.index(tk.END).split('.')[0])
-    
-    # 使用显示行数设置高度
-    text_widget.configure(height=display_line_count)
-    
-    # 设置高度后，验证最后一行是否完全可见
-    # 使用更安全的方法：检查最后一行的完整显示，而不是基于bottom_space减少高度
-    text_widget.update_idletasks()
-    if logical_line_count > 0:
-        last_line_num = logical_line_count - 1
-        last_line_end = text_widget.index(f"{last_line_num}.end")
-        last_line_end_bbox_after = text_widget.bbox(last_line_end)
-        
-        if last_line_end_bbox_after is not None:
-            # 获取Text widget的实际高度（像素）
-            widget_height_pixels = text_widget.winfo_height()
-            # 获取最后一行的完整高度（包括行高）
-            last_line_y = last_line_end_bbox_after[1]
-            last_line_height = last_line_end_bbox_after[3]
-            last_line_bottom = last_line_y + last_line_height
-            
-            # 计算最后一行底部到widget底部的距离
-            bottom_space = widget_height_pixels - last_line_bottom
-            
-            # 获取第一行的行高，用于计算
-            first_line_bbox = text_widget.bbox("1.0")
-            if first_line_bbox is not None:
-                first_line_height = first_line_bbox[3]
-                
-                if first_line_height > 0:
-                    # 如果最后一行被裁剪（底部空间为负或太小），增加高度
-                    # 只增加，不减少，确保内容完整显示
-                    if bottom_space < 0 or (bottom_space < last_line_height * 0.5):
-                        # 需要增加高度以确保最后一行完全可见
-                        needed_space = abs(bottom_space) if bottom_space < 0 else (last_line_height * 0.5 - bottom_space)
-                        additional_lines = int(needed_space / first_line_height) + 1
-                        adjusted_height = display_line_count + additional_lines
-                        text_widget.configure(height=adjusted_height)
-                        display_line_count = adjusted_height
+            self._segments.append(([text], tag))
+        
+        if self._after_id is None:
+            self._after_id = self.text_widget.after(self.interval_ms, self.flush)
     
+    def flush(self):
+        """把累积的增量一次性写入Text widget"""
+        if self._after_id is not None:
+            try:
+                self.text_widget.after_cancel(self._after_id)
+            except tk.TclError:
+                pass
+            self._after_id = None
+        
+        if not self._segments:
+            return
+        
+        segments = [(''.join(parts), tag) for parts, tag in self._segments]
+        self._segments = []
+        if self.writer:
+            self.writer(segments)
+        else:
+            # 一次insert调用写入所有片段: insert(index, text1, tags1, text2, tags2, ...)
+            self.text_widget.insert(tk.END, *markdown_renderer.flatten_segments(segments))
+        
+        if self.on_flush:
+            self.on_flush()
+
+
+def _font_metrics(widget, font):
+    """获取字体的平均字符宽度和行高（像素），按字体缓存"""
+    key = str(font)
+    metrics = _font_metrics_cache.get(key)
+    if metrics is None:
+        char_width = int(widget.tk.call("font", "measure", font, "0")) or 1
+        linespace = int(widget.tk.call("font", "metrics", font, "-linespace")) or 1
+        metrics = (char_width, linespace)
+        _font_metrics_cache[key] = metrics
+    return metrics
+
+
+_font_metrics_cache = {}
+
+# 对话对中的内容区域（Text widget中用 <区域>_start / <区域>_end 标记界定）
+REGION_USER = "user"
+REGION_THINKING = "thinking"
+REGION_ANSWER = "answer"
+
+# 各区域Markdown渲染使用的基础标签
+REGION_BASE_TAGS = {
+    REGION_USER: "user_message",
+    REGION_THINKING: "thinking_content",
+    REGION_ANSWER: "ai_message",
+}
+
+
+def prepare_message_segments(msg):
+    """预先把消息解析为Markdown片段，放入渲染器的LRU缓存
+    
+    不调用任何Tk函数，可在后台线程中执行；显示时渲染器直接从缓存取出片段。
+    片段不保存在消息上，占用的内存受缓存大小限制。
+    """
+    renderer = markdown_renderer.get_renderer()
+    base_tag = (REGION_BASE_TAGS[REGION_USER] if msg.get("role") == "user"
+                else REGION_BASE_TAGS[REGION_ANSWER])
+    renderer.get_segments(msg.get("content", ""), base_tag)
+    if msg.get("reasoning_content"):
+        renderer.get_segments(msg["reasoning_content"], REGION_BASE_TAGS[REGION_THINKING])
+    return msg
 
 
 class ConversationPair:
-    """对话对类，封装对话对的创建和显示逻辑"""
+    """对话对类，封装对话对的创建和显示逻辑
+    
+    对话对由一个始终存在的外层Frame（占位）和按需创建的内部widget
+    （复选框、删除按钮、Text widget）组成。虚拟化模式下，离开视口的
+    对话对会销毁内部widget，只保留固定高度的占位Frame，重新进入视口
+    时根据对话历史重新渲染。
+    """
     
     def __init__(self, parent_frame, pair_index, user_msg_index, 
-                 checkbox_toggle_callback, text_font, canvas=None, delete_callback=None):
-        """初始化对话对"""
+                 checkbox_toggle_callback, text_font, canvas=None, delete_callback=None,
+                 message_provider=None, ai_msg_index=None, lazy=False):
+        """初始化对话对
+        
+        message_provider: 根据消息索引返回对话历史中的消息字典，用于重新渲染
+        lazy: 为True时只创建占位Frame，等进入视口后再创建内部widget
+        """
         self.parent_frame = parent_frame
         self.pair_index = pair_index
         self.user_msg_index = user_msg_index
@@ -111,6 +249,30 @@ class ConversationPair:
         self.text_font = text_font
         self.canvas = canvas
         self.delete_callback = delete_callback
+        self.message_provider = message_provider
+        
+        # AI消息索引（将在AI消息显示时更新）
+        self.ai_msg_index = ai_msg_index
+        
+        # 重新渲染时使用的显示信息
+        self.user_timestamp = datetime.now().strftime("%H:%M:%S")
+        self.ai_timestamp = None
+        self.ai_label = "DeepSeek"
+        self.show_thinking = True
+        
+        # 内部widget（按需创建）
+        self.materialized = False
+        self.pinned = False  # 正在生成回复的对话对不会被回收
+        self.cached_height = None
+        self.checkbox = None
+        self.delete_button = None
+        self.text_widget = None
+        self.regions = []  # 当前Text widget中已标记的区域（按出现顺序）
+        
+        # 流式显示状态
+        self.render_batcher = None
+        self._thinking_stream = None
+        self._answer_stream = None
         
         # 获取当前主题
         theme = config.get_theme()
@@ -120,6 +282,24 @@ class ConversationPair:
                                    relief=tk.SOLID, borderwidth=1)
         self.pair_frame.pack(fill=tk.X, padx=10, pady=5)
         
+        # 选择状态在widget销毁后仍然保留
+        self.checkbox_var = tk.BooleanVar(value=False)
+        
+        if self.canvas:
+            bind_mousewheel_to_canvas(self.pair_frame, self.canvas)
+        
+        if lazy:
+            width = self.canvas.winfo_width() if self.canvas else parent_frame.winfo_width()
+            self._show_placeholder(self.estimate_height(width))
+        else:
+            self._build_widgets()
+    
+    def _build_widgets(self):
+        """创建对话对的内部widget"""
+        theme = config.get_theme()
+        
+        self.pair_frame.pack_propagate(True)
+        
         # 左侧：选择框
         checkbox_frame = tk.Frame(self.pair_frame, bg=theme["COLOR_BG_PAIR"], 
                                  width=config.CHECKBOX_FRAME_WIDTH)
@@ -127,11 +307,10 @@ class ConversationPair:
         checkbox_frame.pack_propagate(False)
         
         # 创建Checkbutton
-        self.checkbox_var = tk.BooleanVar(value=False)
         self.checkbox = tk.Checkbutton(checkbox_frame, variable=self.checkbox_var,
                                        bg=theme["COLOR_BG_PAIR"], 
                                        activebackground=theme["COLOR_BG_PAIR"],
-                                       command=lambda: checkbox_toggle_callback(
+                                       command=lambda: self.checkbox_toggle_callback(
                                            self.pair_index, self.checkbox_var))
         self.checkbox.pack(anchor=tk.NW, pady=5)
         
@@ -156,7 +335,8 @@ class ConversationPair:
             
             # 绑定悬停事件
             def on_enter(e):
-                self.delete_button.pack(anchor=tk.NW, pady=(0, 5))
+                if self.delete_button:
+                    self.delete_button.pack(anchor=tk.NW, pady=(0, 5))
             
             def on_leave(e):
                 # 延迟检查，避免在鼠标移动到按钮上时立即隐藏
@@ -197,29 +377,216 @@ class ConversationPair:
         
         # 绑定Text widget的宽度变化事件，当宽度改变时重新计算高度
         self._last_text_width = None
+        text_widget = self.text_widget
         def on_text_configure(event):
-            if event.widget == self.text_widget:
+            if event.widget == text_widget:
                 current_width = event.width
                 # 只响应宽度变化，忽略高度变化
                 if current_width > 1 and current_width != self._last_text_width:
                     self._last_text_width = current_width
                     # 延迟更新，避免频繁更新
-                    self.text_widget.after(50, lambda: update_text_height(self.text_widget))
+                    text_widget.after(50, lambda: self._update_height_if_alive(text_widget))
         
         self.text_widget.bind('<Configure>', on_text_configure)
+        self.text_widget.bind('<Button-3>', self._show_context_menu)
         
         # 如果提供了canvas，绑定滚轮事件到整个frame及其所有子widget
         # 注意：必须在所有子widget创建完成后才绑定
         if self.canvas:
             bind_mousewheel_to_canvas(self.pair_frame, self.canvas)
+            bind_text_mousewheel(self.text_widget, self.canvas)
         
-        # AI消息索引（将在AI消息显示时更新）
-        self.ai_msg_index = None
+        self.materialized = True
+        self.set_selected(self.checkbox_var.get())
+    
+    def _update_height_if_alive(self, text_widget):
+        """延迟回调：Text widget仍存在时才更新高度"""
+        if text_widget is self.text_widget:
+            update_text_height(text_widget)
+    
+    def _show_placeholder(self, height):
+        """显示固定高度的占位Frame"""
+        self.cached_height = height
+        self.pair_frame.configure(height=max(int(height), 1))
+        self.pair_frame.pack_propagate(False)
+    
+    def materialize(self):
+        """创建内部widget并根据对话历史渲染内容"""
+        if self.materialized:
+            return
+        self._build_widgets()
+        self.render_messages()
+    
+    def dematerialize(self):
+        """销毁内部widget，只保留与当前高度相同的占位Frame"""
+        if not self.materialized or self.pinned:
+            return
+        
+        height = self.pair_frame.winfo_height()
+        for child in self.pair_frame.winfo_children():
+            child.destroy()
+        self.checkbox = None
+        self.delete_button = None
+        self.text_widget = None
+        self.regions = []
+        self.materialized = False
+        
+        if height <= 1:
+            height = self.estimate_height(self.pair_frame.winfo_width())
+        self._show_placeholder(height)
+    
+    def _get_message(self, msg_index):
+        """从对话历史中获取消息"""
+        if msg_index is None or not self.message_provider:
+            return None
+        return self.message_provider(msg_index)
+    
+    def estimate_height(self, width):
+        """根据消息文本估算对话对的像素高度（用于占位）"""
+        char_width, linespace = _font_metrics(self.pair_frame, self.text_font)
+        text_width = max(width - config.PAIR_CHROME_WIDTH, char_width)
+        chars_per_line = max(text_width // char_width, 1)
+        
+        texts = []
+        user_msg = self._get_message(self.user_msg_index)
+        if user_msg:
+            texts.append(user_msg.get("content", ""))
+        ai_msg = self._get_message(self.ai_msg_index)
+        if ai_msg:
+            texts.append(ai_msg.get("content", ""))
+            if self.show_thinking:
+                texts.append(ai_msg.get("reasoning_content") or "")
+        
+        # 标题行、分隔线等固定行
+        line_count = 4 if ai_msg else 1
+        for text in texts:
+            for line in text.split('\n'):
+                # 非ASCII字符（如中文）按两个字符宽度估算
+                columns = len(line) + sum(1 for ch in line if ord(ch) > 0x7f)
+                line_count += max(-(-columns // chars_per_line), 1)
+        
+        return line_count * linespace + config.PAIR_CHROME_HEIGHT
+    
+    def render_messages(self):
+        """根据对话历史重新渲染整个对话对"""
+        user_msg = self._get_message(self.user_msg_index)
+        ai_msg = self._get_message(self.ai_msg_index)
+        
+        self.text_widget.configure(state=tk.NORMAL)
+        self.text_widget.delete("1.0", tk.END)
+        self._clear_regions()
+        invalidate_text_height(self.text_widget)
+        if user_msg:
+            self._insert_user_block(user_msg["content"])
+        if ai_msg:
+            self._insert_ai_block(ai_msg["content"], ai_msg.get("reasoning_content"),
+                                  self.show_thinking, ai_msg.get("truncated", False))
+        update_text_height(self.text_widget)
+        self.text_widget.configure(state=tk.DISABLED)
+    
+    def _begin_region(self, name):
+        """在当前末尾开始一个区域
+        
+        起点标记为左重力（停在区域内容之前），终点标记在区域写入期间为
+        右重力（随末尾插入的内容后移），区域结束时改为左重力固定下来。
+        """
+        start, end = f"{name}_start", f"{name}_end"
+        self.text_widget.mark_set(start, "end-1c")
+        self.text_widget.mark_gravity(start, tk.LEFT)
+        self.text_widget.mark_set(end, "end-1c")
+        self.text_widget.mark_gravity(end, tk.RIGHT)
+        if name not in self.regions:
+            self.regions.append(name)
+    
+    def _end_region(self, name):
+        """结束区域：固定终点标记，之后在末尾插入的内容不再属于该区域"""
+        if name in self.regions:
+            self.text_widget.mark_gravity(f"{name}_end", tk.LEFT)
+    
+    def _clear_regions(self):
+        """删除所有区域标记"""
+        if self.regions:
+            self.text_widget.mark_unset(*[f"{name}_{edge}" for name in self.regions
+                                          for edge in ("start", "end")])
+        self.regions = []
+    
+    def has_region(self, name):
+        """区域是否存在（widget已销毁时始终为False）"""
+        return self.text_widget is not None and name in self.regions
+    
+    def get_region_text(self, name):
+        """获取区域中显示的文本，区域不存在时返回None"""
+        if not self.has_region(name):
+            return None
+        return self.text_widget.get(f"{name}_start", f"{name}_end")
+    
+    def _copy_to_clipboard(self, text):
+        """复制文本到剪贴板"""
+        if text is None:
+            return
+        self.text_widget.clipboard_clear()
+        self.text_widget.clipboard_append(text.strip())
+    
+    def _show_context_menu(self, event):
+        """右键菜单：复制选中内容或整个区域"""
+        theme = config.get_theme()
+        menu = tk.Menu(self.text_widget, tearoff=0, bg=theme["COLOR_BG_CHAT"],
+                       fg=theme["COLOR_TEXT_DARK"])
+        
+        if self.text_widget.tag_ranges(tk.SEL):
+            menu.add_command(label="复制",
+                             command=lambda: self._copy_to_clipboard(
+                                 self.text_widget.get(tk.SEL_FIRST, tk.SEL_LAST)))
+        
+        labels = {REGION_USER: "复制提问", REGION_THINKING: "复制思考过程",
+                  REGION_ANSWER: "复制回答"}
+        for name in self.regions:
+            menu.add_command(label=labels[name],
+                             command=lambda n=name: self._copy_to_clipboard(
+                                 self.get_region_text(n)))
+        
+        if menu.index(tk.END) is not None:
+            try:
+                menu.tk_popup(event.x_root, event.y_root)
+            finally:
+                menu.grab_release()
+    
+    def _insert_region(self, name, text):
+        """在末尾写入一个区域（预先解析过的文本直接使用渲染器缓存的片段）"""
+        self._begin_region(name)
+        markdown_renderer.render_markdown(self.text_widget, text, REGION_BASE_TAGS[name])
+        self._end_region(name)
+    
+    def _insert_user_block(self, message):
+        """写入用户消息"""
+        self.text_widget.insert(tk.END, f"👤 我 ({self.user_timestamp})\n", "user_tag")
+        self._insert_region(REGION_USER, message)
+    
+    def _insert_ai_block(self, ai_reply, reasoning_content, show_thinking, truncated=False):
+        """写入AI消息（含思考过程和分隔线），truncated表示回答被停止生成"""
+        self.text_widget.insert(tk.END, f"\n🤖 {self.ai_label} ({self.ai_timestamp})\n", "ai_tag")
+        
+        # 显示思考过程
+        if reasoning_content and show_thinking:
+            self.text_widget.insert(tk.END, "🧠 思考过程:\n", "thinking_tag")
+            self._insert_region(REGION_THINKING, reasoning_content)
+            self.text_widget.insert(tk.END, "\n\n💡 最终回答:\n", "ai_tag")
+        
+        # 使用Markdown渲染AI回复
+        self._insert_region(REGION_ANSWER, ai_reply)
+        if truncated:
+            self._insert_truncated_note()
+        self.text_widget.insert(tk.END, f"\n{'─' * config.SEPARATOR_LENGTH}\n", 
+                               "separator")
+
+    def _insert_truncated_note(self):
+        """在回答末尾写入“已停止生成”提示"""
+        self.text_widget.insert(tk.END, f"\n{config.TRUNCATED_NOTE}", "truncated_tag")
     
     def _check_and_hide_delete_button(self):
         """检查鼠标是否仍在frame或按钮上，如果不是则隐藏删除按钮"""
         try:
-            if not hasattr(self, 'delete_button') or not hasattr(self, 'pair_frame'):
+            if not self.delete_button or not hasattr(self, 'pair_frame'):
                 return
             
             x, y = self.pair_frame.winfo_pointerxy()
@@ -250,14 +617,12 @@ class ConversationPair:
     
     def display_user_message(self, message, canvas):
         """显示用户消息"""
-        # 绑定滚轮事件
-        bind_text_mousewheel(self.text_widget, canvas)
+        self.materialize()
         
         # 显示用户消息
-        timestamp = datetime.now().strftime("%H:%M:%S")
+        self.user_timestamp = datetime.now().strftime("%H:%M:%S")
         self.text_widget.configure(state=tk.NORMAL)
-        self.text_widget.insert(tk.END, f"👤 我 ({timestamp})\n", "user_tag")
-        markdown_renderer.render_markdown(self.text_widget, message, "user_message")
+        self._insert_user_block(message)
         
         # 根据内容动态设置高度
         update_text_height(self.text_widget)
@@ -266,130 +631,112 @@ class ConversationPair:
     def display_ai_message(self, ai_reply, reasoning_content, thinking_enabled, 
                           canvas, ai_msg_index):
         """显示AI消息"""
+        self.materialize()
         self.ai_msg_index = ai_msg_index
-        
-        # 绑定滚轮事件
-        bind_text_mousewheel(self.text_widget, canvas)
+        self.show_thinking = thinking_enabled
         
         self.text_widget.configure(state=tk.NORMAL)
         
         # AI消息样式
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        self.text_widget.insert(tk.END, f"\n🤖 DeepSeek ({timestamp})\n", "ai_tag")
-        
-        # 显示思考过程
-        if reasoning_content and thinking_enabled:
-            self.text_widget.insert(tk.END, "🧠 思考过程:\n", "thinking_tag")
-            markdown_renderer.render_markdown(self.text_widget, reasoning_content, 
-                                            "thinking_content")
-            self.text_widget.insert(tk.END, "\n\n💡 最终回答:\n", "ai_tag")
-        
-        # 使用Markdown渲染AI回复
-        markdown_renderer.render_markdown(self.text_widget, ai_reply, "ai_message")
-        self.text_widget.insert(tk.END, f"\n{'─' * config.SEPARATOR_LENGTH}\n", 
-                               "separator")
+        self.ai_timestamp = datetime.now().strftime("%H:%M:%S")
+        self._insert_ai_block(ai_reply, reasoning_content, thinking_enabled)
         
         # 根据内容动态设置高度
         update_text_height(self.text_widget)
         self.text_widget.configure(state=tk.DISABLED)
+        self.pinned = False
     
     def start_ai_stream(self, thinking_enabled, canvas):
         """开始流式显示AI响应"""
+        self.materialize()
+        self.pinned = True
+        self.show_thinking = thinking_enabled
         self.text_widget.configure(state=tk.NORMAL)
         
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        self.text_widget.insert(tk.END, f"\n🤖 DeepSeek ({timestamp})\n", "ai_tag")
+        self.ai_timestamp = datetime.now().strftime("%H:%M:%S")
+        self.text_widget.insert(tk.END, f"\n🤖 {self.ai_label} ({self.ai_timestamp})\n", "ai_tag")
         
         # 如果是思考模式，添加思考标签
         if thinking_enabled:
             self.text_widget.insert(tk.END, "🧠 思考过程:\n", "thinking_tag")
             self.text_widget.see(tk.END)
         
-        # 绑定滚轮事件
-        bind_text_mousewheel(self.text_widget, canvas)
+        # 增量按帧合并后再写入，已闭合的Markdown块在流式过程中即时渲染
+        self._stream_canvas = canvas
+        self._stream_content_frame = None
+        self._thinking_stream = None
+        self._answer_stream = None
+        self.render_batcher = StreamRenderBatcher(self.text_widget, self._on_stream_flush,
+                                                  writer=self._write_stream_segments)
     
-    def insert_thinking_chunk(self, chunk, canvas, content_frame):
-        """插入思考内容块"""
-        self.text_widget.insert(tk.END, chunk, "thinking_content")
+    def _new_markdown_stream(self, base_tag, raw_mark):
+        """在当前末尾创建增量Markdown渲染器"""
+        text_widget = self.text_widget
+        return markdown_renderer.IncrementalMarkdownStream(
+            text_widget, base_tag, raw_mark,
+            on_rewrite=lambda index: invalidate_text_height(text_widget, index))
+    
+    def _write_stream_segments(self, segments):
+        """把一帧内累积的增量交给思考/回答区域的增量渲染器"""
+        for text, tag in segments:
+            if tag == "thinking_content":
+                if self._thinking_stream is None:
+                    self._begin_region(REGION_THINKING)
+                    self._thinking_stream = self._new_markdown_stream(
+                        "thinking_content", "thinking_raw")
+                self._thinking_stream.feed(text)
+            else:
+                if self._answer_stream is None:
+                    # 思考内容结束：渲染其最后一个块，再插入"最终回答"标记
+                    if self._thinking_stream is not None:
+                        self._thinking_stream.finish()
+                        self._end_region(REGION_THINKING)
+                        self.text_widget.insert(tk.END, "\n\n💡 最终回答:\n", "ai_tag")
+                    self._begin_region(REGION_ANSWER)
+                    self._answer_stream = self._new_markdown_stream("ai_message", "answer_raw")
+                self._answer_stream.feed(text)
+    
+    def _on_stream_flush(self):
+        """每帧刷新后更新一次高度和滚动区域"""
         update_text_height(self.text_widget)
         self.text_widget.see(tk.END)
-        update_scroll_region(canvas, content_frame)
+        if self._stream_canvas and self._stream_content_frame:
+            update_scroll_region(self._stream_canvas, self._stream_content_frame)
     
-    def insert_answer_chunk(self, chunk, canvas, content_frame, char_count):
-        """插入回答内容块"""
-        self.text_widget.insert(tk.END, chunk, "ai_message")
-        
-        # 每10个字符或每行更新一次
-        if char_count % config.SCROLL_UPDATE_THRESHOLD == 0 or '\n' in chunk:
-            update_text_height(self.text_widget)
-            self.text_widget.see(tk.END)
-            update_scroll_region(canvas, content_frame)
-        else:
-            self.text_widget.see(tk.END)
+    def insert_thinking_chunk(self, chunk, canvas, content_frame):
+        """插入思考内容块（在下一帧统一写入）"""
+        self._stream_canvas = canvas
+        self._stream_content_frame = content_frame
+        self.render_batcher.append(chunk, "thinking_content")
+    
+    def insert_answer_chunk(self, chunk, canvas, content_frame):
+        """插入回答内容块（在下一帧统一写入）"""
+        self._stream_canvas = canvas
+        self._stream_content_frame = content_frame
+        self.render_batcher.append(chunk, "ai_message")
     
     def finish_ai_stream(self, full_response, reasoning_content, thinking_enabled,
-                        canvas, content_frame, ai_msg_index):
-        """完成流式显示，重新渲染Markdown"""
-        import re
-        
+                        canvas, content_frame, ai_msg_index, truncated=False):
+        """完成流式显示：只需渲染思考和回答各自最后一个未闭合的块
+
+        truncated: 流被用户停止，在回答末尾显示提示
+        """
         self.ai_msg_index = ai_msg_index
         
-        # 检查是否包含Markdown格式
-        has_markdown = bool(
-            re.search(r'(\*\*|__|`|#|>|[-*+]\s)', full_response) or 
-            (reasoning_content and re.search(r'(\*\*|__|`|#|>|[-*+]\s)', reasoning_content))
-        )
-        
-        if has_markdown:
-            # 记录流式内容结束位置（在插入分隔线之前）
-            stream_end_pos = self.text_widget.index(tk.END)
-            
-            # 查找思考内容和回答的位置
-            thinking_start_pos = None
-            thinking_end_pos = None
-            answer_start_pos = None
-            
-            # 查找思考内容开始位置（"🧠 思考过程:\n"之后）
-            content = self.text_widget.get("1.0", stream_end_pos)
-            thinking_marker = "🧠 思考过程:\n"
-            answer_marker = "💡 最终回答:\n"
-            
-            if thinking_marker in content:
-                thinking_start_idx = content.find(thinking_marker)
-                # thinking_start_pos 应该是标记之后的位置（思考内容开始）
-                thinking_start_pos = f"1.0+{thinking_start_idx + len(thinking_marker)}c"
-                
-                if answer_marker in content:
-                    answer_marker_idx = content.find(answer_marker)
-                    thinking_end_pos = f"1.0+{answer_marker_idx}c"
-                    answer_start_pos = f"1.0+{answer_marker_idx + len(answer_marker)}c"
-                else:
-                    thinking_end_pos = stream_end_pos
-            
-            # 重新渲染思考内容
-            if reasoning_content and thinking_start_pos and thinking_end_pos:
-                # 只删除思考内容，保留 "🧠 思考过程:\n" 标记
-                self.text_widget.delete(thinking_start_pos, thinking_end_pos)
-                self.text_widget.mark_set("insert", thinking_start_pos)
-                markdown_renderer.render_markdown(self.text_widget, reasoning_content, 
-                                                "thinking_content")
-                
-                # 重新查找回答开始位置（answer_marker 应该在重新渲染后的内容中）
-                if answer_marker in content:
-                    # 重新获取当前内容，查找 answer_marker 的新位置
-                    current_pos = self.text_widget.index(tk.END)
-                    content_after_render = self.text_widget.get("1.0", current_pos)
-                    if answer_marker in content_after_render:
-                        answer_marker_idx = content_after_render.find(answer_marker)
-                        answer_start_pos = f"1.0+{answer_marker_idx + len(answer_marker)}c"
-            
-            # 重新渲染回答内容
-            if full_response and answer_start_pos:
-                current_end_pos = self.text_widget.index(tk.END)
-                self.text_widget.delete(answer_start_pos, current_end_pos)
-                self.text_widget.mark_set("insert", answer_start_pos)
-                markdown_renderer.render_markdown(self.text_widget, full_response, 
-                                                "ai_message")
+        # 写入尚未刷新的增量
+        if self.render_batcher:
+            self.render_batcher.flush()
+            self.render_batcher = None
+        
+        for stream in (self._thinking_stream, self._answer_stream):
+            if stream is not None:
+                stream.finish()
+        self._thinking_stream = None
+        self._answer_stream = None
+        self._end_region(REGION_THINKING)
+        self._end_region(REGION_ANSWER)
+        if truncated:
+            self._insert_truncated_note()
         
         # 插入分隔线
         self.text_widget.insert(tk.END, f"\n{'─' * config.SEPARATOR_LENGTH}\n", 
@@ -401,6 +748,8 @@ class ConversationPair:
         self.text_widget.see(tk.END)
         self.text_widget.configure(state=tk.DISABLED)
         
+        self.pinned = False
+        
         # 更新滚动区域
         update_scroll_region(canvas, content_frame)
     
@@ -416,11 +765,27 @@ class ConversationPair:
             else:
                 selected_bg = "#e8f4f8"
             self.pair_frame.config(bg=selected_bg)
-            self.checkbox.config(bg=selected_bg, activebackground=selected_bg)
+            if self.checkbox:
+                self.checkbox.config(bg=selected_bg, activebackground=selected_bg)
         else:
             self.pair_frame.config(bg=theme["COLOR_BG_PAIR"])
-            self.checkbox.config(bg=theme["COLOR_BG_PAIR"], 
-                               activebackground=theme["COLOR_BG_PAIR"])
+            if self.checkbox:
+                self.checkbox.config(bg=theme["COLOR_BG_PAIR"], 
+                                   activebackground=theme["COLOR_BG_PAIR"])
+    
+    def mark_unsent(self):
+        """收到回答前被停止：消息已从对话历史中移除，只保留当前显示
+
+        对话对不再对应对话历史中的消息，无法重新渲染，因此不再回收。
+        """
+        self.user_msg_index = None
+        self.ai_msg_index = None
+        self.pinned = True
+        if self.text_widget is not None:
+            self.text_widget.configure(state=tk.NORMAL)
+            self.text_widget.insert(tk.END, f"\n{config.UNSENT_NOTE}\n", "truncated_tag")
+            update_text_height(self.text_widget)
+            self.text_widget.configure(state=tk.DISABLED)
     
     def get_pair_info(self):
         """获取对话对信息字典"""
@@ -434,3 +799,81 @@ class ConversationPair:
             'text_widget': self.text_widget
         }
 
+
+
+class VirtualPairView:
+    """对话区域的虚拟化视图：只为视口附近的对话对保留内部widget
+    
+    其余对话对只保留占位Frame（使用缓存或估算的像素高度），因此内存占用
+    和窗口缩放的开销与视口大小成正比，而不是与对话长度成正比。
+    """
+    
+    def __init__(self, canvas, scrollbar, get_pairs, 
+                 overscan=config.VIRTUAL_OVERSCAN_PX):
+        """初始化
+        
+        get_pairs: 返回按显示顺序排列的ConversationPair列表
+        """
+        self.canvas = canvas
+        self.scrollbar = scrollbar
+        self.get_pairs = get_pairs
+        self.overscan = overscan
+        self._refresh_pending = False
+        
+        # 滚动位置变化时（滚动条、滚轮、内容变化）刷新可见范围
+        self.canvas.configure(yscrollcommand=self._on_yscroll)
+    
+    def _on_yscroll(self, first, last):
+        """Canvas的yscrollcommand回调"""
+        self.scrollbar.set(first, last)
+        self.schedule_refresh()
+    
+    def schedule_refresh(self):
+        """在空闲时刷新（合并同一轮事件中的多次请求）"""
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.canvas.after_idle(self.refresh)
+    
+    def _first_visible(self, pairs, top):
+        """二分查找第一个底部在 top 之下的对话对"""
+        lo, hi = 0, len(pairs)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            frame = pairs[mid].pair_frame
+            if frame.winfo_y() + frame.winfo_height() < top:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+    
+    def refresh(self):
+        """创建视口附近对话对的widget，回收其余对话对的widget"""
+        try:
+            self._refresh_visible()
+        finally:
+            # 刷新过程中（update_idletasks）触发的请求不会嵌套执行
+            self._refresh_pending = False
+    
+    def _refresh_visible(self):
+        """刷新可见范围内的对话对"""
+        pairs = self.get_pairs()
+        if not pairs:
+            return
+        
+        try:
+            pairs[0].pair_frame.update_idletasks()
+            top = self.canvas.canvasy(0) - self.overscan
+            bottom = self.canvas.canvasy(self.canvas.winfo_height()) + self.overscan
+        except tk.TclError:
+            return
+        
+        visible = set()
+        i = self._first_visible(pairs, top)
+        while i < len(pairs) and pairs[i].pair_frame.winfo_y() <= bottom:
+            visible.add(id(pairs[i]))
+            pairs[i].materialize()
+            i += 1
+        
+        for pair in pairs:
+            if pair.materialized and id(pair) not in visible:
+                pair.dematerialize()
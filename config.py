@@ -57,6 +57,10 @@ SIDEBAR_COLLAPSED_WIDTH = 40  # 折叠后的宽度
 TITLE_BAR_HEIGHT = 60
 INPUT_HEIGHT = 4
 CHECKBOX_FRAME_WIDTH = 30
+PAIR_CHROME_WIDTH = 90  # 对话对中Text以外部分占用的宽度（复选框、边框、内边距）
+PAIR_CHROME_HEIGHT = 42  # 对话对中Text以外部分占用的高度
+HISTORY_ROW_HEIGHT = 46  # 历史记录列表每行的高度
+HISTORY_TITLE_SAVE_DELAY_MS = 2000  # 滚动加载标题后延迟保存标题缓存
 
 # 默认配置
 DEFAULT_CONFIG = {
@@ -69,7 +73,10 @@ DEFAULT_CONFIG = {
     "thinking_enabled": False,
     "dark_mode": False,
     "sidebar_collapsed": False,
-    "history_sidebar_collapsed": False
+    "history_sidebar_collapsed": False,
+    "context_budget_tokens": 32000,
+    "context_summary_enabled": True,
+    "max_concurrent_requests": 3
 }
 
 # 模型配置
@@ -78,18 +85,95 @@ MODEL_MAX_TOKENS = {
     'deepseek-chat': 8000,
     'deepseek-reasoner': 64000
 }
+MODEL_CONTEXT_TOKENS = {  # 模型的上下文长度（输入+输出）
+    'deepseek-chat': 128000,
+    'deepseek-reasoner': 128000
+}
 
 # 文件路径
 CONFIG_FILE = "config/deepseek_config.json"
 CHAT_HISTORY_DIR = "chat_history"
 ICON_FILE = "icon/deepseek.ico"
+CONVERSATION_STORE_DIR_NAME = ".store"  # 结构化对话存储目录（位于历史记录目录下）
+CONVERSATION_INDEX_FILE = "index.json"
+HISTORY_TITLE_INDEX_FILE = "history_titles.json"  # 历史记录侧边栏标题缓存（按路径、修改时间、大小校验）
+HISTORY_WATCH_INTERVAL = 1.0  # 历史记录目录监视：轮询间隔（秒）
+HISTORY_WATCH_POLL_MS = 500  # UI线程取目录变化事件的间隔
+SEARCH_INDEX_FILE = "search.db"  # 全文搜索索引（SQLite FTS5）
+GENERATED_TITLE_CACHE_FILE = "generated_titles.json"  # AI生成标题缓存（按标题生成内容的哈希）
+GENERATED_TITLE_CACHE_SIZE = 500
+HISTORY_READ_CHUNK_SIZE = 1024 * 1024  # 流式解析历史文件时每次读取的字符数
+HISTORY_LOAD_SLICE_MS = 12  # 逐步加载历史记录时每次占用UI线程的最长时间
+HISTORY_LOAD_POLL_MS = 16  # UI线程取已解析消息的间隔
+HISTORY_LOAD_QUEUE_MAXSIZE = 256  # 已解析、等待显示的消息数上限
 
 # 其他常量
 SEPARATOR_LENGTH = 50
 TITLE_MAX_LENGTH = 10
+PROVISIONAL_TITLE_LENGTH = 20  # 临时标题（第一条用户消息开头）的最大长度
+SESSION_TITLE_LENGTH = 12  # 会话标签页标题（第一条用户消息开头）的最大长度
+TRUNCATED_NOTE = "⏹ 已停止生成，回答不完整"  # 显示在被停止的回答末尾
+UNSENT_NOTE = "⏹ 已停止，消息未保存到对话历史"  # 收到回答前被停止的对话对末尾
+TRUNCATED_ROLE_SUFFIX = "（已停止生成）"  # 导出时被停止的回答的轮次标题后缀
 MAX_TITLE_GEN_LENGTH = 3000
 MAX_CONTENT_PREVIEW = 500
-SCROLL_UPDATE_THRESHOLD = 10
+
+# 流式响应引擎
+STREAM_QUEUE_MAXSIZE = 1024  # 增量队列容量，满时后台线程等待（背压）
+STREAM_PUT_TIMEOUT = 0.1  # 队列满时每次等待的秒数（期间检查取消）
+STREAM_POLL_INTERVAL_MS = 30  # UI线程取队列的间隔
+STREAM_DRAIN_MAX_EVENTS = 512  # UI线程每次最多取出的事件数
+RENDER_FRAME_INTERVAL_MS = 33  # 流式内容写入Text widget的最小间隔（约30帧/秒）
+ASYNC_BRIDGE_POLL_MS = 30  # UI线程取异步请求结果的间隔
+MAX_CONCURRENT_REQUESTS_LIMIT = 8  # 同时进行的生成请求数的上限（设置滑块的最大值）
+
+# 对话区域虚拟化
+VIRTUAL_LIST_ENABLED = True  # 只为视口附近的对话对创建widget
+VIRTUAL_OVERSCAN_PX = 600  # 视口上下额外保留的像素范围
+
+# Markdown渲染
+MARKDOWN_CACHE_SIZE = 512  # 缓存的已解析消息数（LRU）
+
+# HTTP连接
+HTTP2_ENABLED = True  # 安装了h2时使用HTTP/2
+HTTP_CONNECT_TIMEOUT = 10.0  # 秒
+HTTP_READ_TIMEOUT = 600.0  # 两次收到数据之间的最长等待（思考模式可能长时间没有输出）
+HTTP_WRITE_TIMEOUT = 30.0
+HTTP_POOL_TIMEOUT = 30.0  # 等待连接池空闲连接的时间
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE = 10
+HTTP_KEEPALIVE_EXPIRY = 90.0  # 空闲连接保持的秒数
+
+# 请求重试和限速
+API_MAX_RETRIES = 4  # 一次请求失败后最多重试的次数（流式响应收到新内容后重新计数）
+API_MAX_STREAM_RESUMES = 3  # 流式响应中断后最多续传的次数
+API_RETRY_BASE_DELAY = 1.0  # 指数退避的初始等待（秒），第n次重试最多等待 base * 2^n
+API_RETRY_MAX_DELAY = 30.0
+API_RETRY_AFTER_MAX = 60.0  # 服务器 Retry-After 的最长等待
+API_RETRY_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+RATE_LIMIT_REQUESTS_PER_SECOND = 2.0  # 本进程发出请求的平均速率（令牌桶）
+RATE_LIMIT_BURST = 4  # 令牌桶容量（允许的突发请求数）
+DEEPSEEK_PREFIX_COMPLETION_PATH = "/beta"  # 对话前缀续写（用于续传中断的流式回答）
+
+# 上下文窗口
+CONTEXT_BUDGET_MIN = 2000  # 上下文预算滑动条的最小值
+CONTEXT_BUDGET_STEP = 1000
+CONTEXT_TRIM_RATIO = 0.75  # 超出预算时裁剪到预算的比例，留出余量使窗口起点不必每轮移动
+CONTEXT_MESSAGE_OVERHEAD_TOKENS = 4  # 每条消息的角色、分隔符等额外token
+CONTEXT_SUMMARY_MAX_TOKENS = 500  # 滚动摘要的最大长度
+CONTEXT_SUMMARY_INPUT_CHARS = 2000  # 生成摘要时每条消息最多使用的字符数
+
+# Token计数
+TOKENIZER_FILE = "tokenizer/tokenizer.json"  # 可选的DeepSeek分词器文件（需要安装tokenizers）
+TOKENS_PER_CJK_CHAR = 0.6  # 没有分词器时的估算系数
+TOKENS_PER_ASCII_CHAR = 0.3
+TOKEN_ESTIMATE_DELAY_MS = 300  # 输入停止后多久更新预计token数
+
+# 历史记录搜索
+SEARCH_RESULT_LIMIT = 100  # 最多显示的命中消息数
+SEARCH_SNIPPET_TOKENS = 12  # 搜索结果摘要的词数（FTS5 snippet）
+SEARCH_SNIPPET_CHARS = 20  # 短关键词搜索时摘要中关键词两侧保留的字符数
+SEARCH_DEBOUNCE_MS = 200  # 输入停止后多久开始搜索
 
 # 主题配置
 # 浅色主题（默认）
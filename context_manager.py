@@ -0,0 +1,231 @@
+"""上下文窗口管理模块
+
+发送请求前按token预算裁剪对话历史：保留最近的若干轮对话（滑动窗口），
+更早的对话可以用滚动摘要代替，使每次请求的大小不随对话长度无限增长。
+
+窗口的起点在两次请求之间保持不变，只有超出预算时才一次性裁剪到预算的
+一部分（CONTEXT_TRIM_RATIO），因此摘要不需要每轮都重新生成。
+
+DeepSeek API会缓存请求的前缀（按字节比较），命中缓存的输入token更便宜、
+更快。因此每条消息发送的内容规范化后缓存在消息上，摘要也只在窗口移动时
+变化，使相邻两次请求的前缀尽量保持一致。
+"""
+
+import threading
+
+import config
+import token_counter
+
+
+def canonical_message(msg):
+    """发送给API的规范化消息（只含角色和内容，换行统一为LF）
+
+    结果缓存在消息的 "_api" 键上，内容不变时每次返回同一个字典。
+    """
+    content = msg.get("content") or ""
+    cached = msg.get("_api")
+    if cached is not None and cached[0] is content and cached[1]["role"] == msg["role"]:
+        return cached[1]
+    api_msg = {"role": msg["role"], "content": content.replace("\r\n", "\n")}
+    msg["_api"] = (content, api_msg)
+    return api_msg
+
+
+def _api_message_tokens(api_msg):
+    """规范化消息的token数"""
+    return token_counter.count_tokens(api_msg["content"]) + config.CONTEXT_MESSAGE_OVERHEAD_TOKENS
+
+
+def format_summary_input(messages, max_chars=config.CONTEXT_SUMMARY_INPUT_CHARS):
+    """把待摘要的消息整理为文本，每条消息只保留开头部分"""
+    lines = []
+    for msg in messages:
+        role = "用户" if msg.get("role") == "user" else "AI"
+        content = (msg.get("content") or "").strip()
+        if len(content) > max_chars:
+            content = content[:max_chars] + "..."
+        lines.append(f"{role}: {content}")
+    return "\n\n".join(lines)
+
+
+class ContextManager:
+    """对话上下文窗口管理器
+
+    窗口起点和摘要都按消息对象（而不是下标）记录，删除对话对、加载历史
+    等修改对话历史的操作后仍能找到原来的位置；找不到时从头重新计算。
+    """
+
+    def __init__(self, budget_tokens=config.DEFAULT_CONFIG["context_budget_tokens"],
+                 summary_enabled=config.DEFAULT_CONFIG["context_summary_enabled"]):
+        """初始化"""
+        self.budget_tokens = budget_tokens
+        self.summary_enabled = summary_enabled
+        self._lock = threading.Lock()
+        self._first_kept = None  # 窗口内的第一条消息
+        # {"text": 摘要, "message": 摘要的系统消息, "ids": 已摘要消息的id, "messages": 已摘要的消息}
+        self._summary = None
+        self._last_sent = []  # 上一次发送的规范化消息列表
+
+    def reset(self):
+        """清除窗口起点和摘要（清空或替换对话历史时调用）"""
+        with self._lock:
+            self._first_kept = None
+            self._summary = None
+            self._last_sent = []
+
+    def forget_messages(self, history, removed):
+        """对话历史中将要删除 removed 中的消息（删除前调用）
+
+        窗口的第一条消息被删除时，窗口起点移到其后第一条保留的消息，
+        而不是从头重新裁剪，使其余消息的发送前缀保持不变。
+        """
+        removed_ids = {id(msg) for msg in removed}
+        with self._lock:
+            if self._first_kept is None or id(self._first_kept) not in removed_ids:
+                return
+            start = self._window_start(history)
+            while start < len(history) and id(history[start]) in removed_ids:
+                start += 1
+            self._first_kept = history[start] if start < len(history) else None
+
+    def prefix_invalidation(self, removed):
+        """删除 removed 中的消息后，上一次请求中不再能命中前缀缓存的token数
+
+        被删除的消息不在上一次发送的窗口内（已被裁剪或摘要）时返回0。
+        """
+        removed_api = [msg["_api"][1] for msg in removed if msg.get("_api")]
+        with self._lock:
+            last_sent = self._last_sent
+        for position, api_msg in enumerate(last_sent):
+            if any(api_msg is removed_msg for removed_msg in removed_api):
+                return sum(_api_message_tokens(m) for m in last_sent[position:]
+                           if not any(m is removed_msg for removed_msg in removed_api))
+        return 0
+
+    def _window_start(self, history):
+        """窗口起点在当前对话历史中的下标"""
+        if self._first_kept is None:
+            return 0
+        for i, msg in enumerate(history):
+            if msg is self._first_kept:
+                return i
+        return 0
+
+    def _trim(self, history, start, budget):
+        """窗口超出预算时前移起点，使窗口大小降到预算的 CONTEXT_TRIM_RATIO
+
+        新起点对齐到用户消息，且最后一条用户消息总是保留。
+        """
+        target = int(budget * config.CONTEXT_TRIM_RATIO)
+        last_user = max((i for i, msg in enumerate(history) if msg.get("role") == "user"),
+                        default=len(history) - 1)
+
+        total = 0
+        new_start = len(history)
+        while new_start > start:
+            tokens = token_counter.message_tokens(history[new_start - 1])
+            if total + tokens > target:
+                break
+            total += tokens
+            new_start -= 1
+
+        while new_start < last_user and history[new_start].get("role") != "user":
+            new_start += 1
+        return min(new_start, last_user)
+
+    def _update_summary(self, dropped, summarizer):
+        """更新滚动摘要，使其覆盖所有被移出窗口的消息，返回摘要的系统消息
+
+        只摘要新移出窗口的消息。已摘要的消息被删除时摘要保持不变，
+        以免摘要（位于请求最前面）变化使整个前缀缓存失效。
+        """
+        previous = self._summary
+        covered = previous["ids"] if previous else set()
+        new_messages = [msg for msg in dropped if id(msg) not in covered]
+        if not new_messages:
+            return previous["message"] if previous else None
+
+        previous_text = previous["text"] if previous else None
+        try:
+            text = summarizer(previous_text, new_messages)
+        except Exception as e:
+            print(f"生成对话摘要失败: {e}")
+            return previous["message"] if previous else None
+
+        if not text:
+            return previous["message"] if previous else None
+        text = text.strip()
+        messages = (previous["messages"] if previous else []) + new_messages
+        self._summary = {
+            "text": text,
+            "message": {"role": "system", "content": f"以下是之前对话的摘要，供参考：\n{text}"},
+            # 保留消息的引用，使id在摘要有效期间不会被复用
+            "ids": {id(msg) for msg in messages},
+            "messages": messages,
+        }
+        return self._summary["message"]
+
+    def estimate_tokens(self, history):
+        """估计按当前窗口发送 history 需要的输入token数（不移动窗口、不生成摘要）"""
+        with self._lock:
+            start = self._window_start(history)
+            summary = self._summary
+        total = token_counter.messages_tokens(history[start:])
+        if summary is not None and start > 0:
+            total += _api_message_tokens(summary["message"])
+        return total
+
+    def build_messages(self, history, summarizer=None, budget_tokens=None):
+        """构建发送给API的消息列表
+
+        summarizer(上一次的摘要或None, 新移出窗口的消息列表) 返回新的摘要文本，
+        为None或未启用摘要时直接丢弃窗口外的消息。
+        返回 (API消息列表, 信息字典)，信息字典包含窗口起点、估计token数、是否使用摘要
+        和与上一次请求相同的前缀的token数（可能命中服务器缓存）。
+        """
+        budget = budget_tokens or self.budget_tokens
+        use_summary = self.summary_enabled and summarizer is not None
+        if use_summary:
+            # 为摘要预留空间
+            budget = max(budget - config.CONTEXT_SUMMARY_MAX_TOKENS, 0)
+
+        with self._lock:
+            start = self._window_start(history)
+            total = token_counter.messages_tokens(history[start:])
+            if total > budget:
+                start = self._trim(history, start, budget)
+                total = token_counter.messages_tokens(history[start:])
+            self._first_kept = history[start] if start < len(history) else None
+
+        # 生成摘要需要请求API，不持有锁，避免界面线程调用reset()时被阻塞
+        summary = None
+        if use_summary and start > 0:
+            summary = self._update_summary(history[:start], summarizer)
+
+        api_messages = []
+        message_tokens = []
+        if summary:
+            api_messages.append(summary)
+            message_tokens.append(_api_message_tokens(summary))
+            total += message_tokens[0]
+        for msg in history[start:]:
+            api_messages.append(canonical_message(msg))
+            message_tokens.append(token_counter.message_tokens(msg))
+
+        # 与上一次请求逐条比较（规范化消息在内容不变时是同一个对象）
+        with self._lock:
+            last_sent = self._last_sent
+            self._last_sent = api_messages
+        shared = 0
+        for previous, current in zip(last_sent, api_messages):
+            if previous is not current and previous != current:
+                break
+            shared += 1
+
+        info = {
+            "window_start": start,
+            "estimated_tokens": total,
+            "summarized": summary is not None,
+            "shared_prefix_tokens": sum(message_tokens[:shared]),
+        }
+        return api_messages, info
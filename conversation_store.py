@@ -0,0 +1,277 @@
+"""对话存储模块
+
+每个对话保存为一个追加写入的JSONL文件（第一行为元数据，其后每行一条消息），
+另有一个小的索引文件记录每个对话的标题、修改时间、消息数和模型，
+列出和加载对话都不需要解析Markdown。
+"""
+
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import config
+
+
+def normalize_path(path):
+    """规范化文件路径，用于比较导出文件"""
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _message_record(msg):
+    """消息字典转为存储记录（下划线开头的键为运行时缓存，不保存）"""
+    record = {"type": "message"}
+    record.update((key, value) for key, value in msg.items() if not key.startswith('_'))
+    return record
+
+
+class ConversationStore:
+    """JSONL对话存储 + 索引文件"""
+
+    def __init__(self, store_dir=os.path.join(config.CHAT_HISTORY_DIR,
+                                              config.CONVERSATION_STORE_DIR_NAME)):
+        """初始化存储目录并加载索引"""
+        self.store_dir = store_dir
+        self.index_path = os.path.join(store_dir, config.CONVERSATION_INDEX_FILE)
+        self._lock = threading.Lock()
+        self._upsert_lock = threading.Lock()  # 按导出路径查找并写入的整个过程互斥
+        self._batch_depth = 0  # 大于0时推迟写入索引文件
+        self._index_dirty = False
+        if not os.path.exists(self.store_dir):
+            os.makedirs(self.store_dir)
+        self._export_ids = {}  # 规范化的导出文件路径 -> 对话ID（与索引同步，读写都持有锁）
+        self.index = self._load_index()
+        with self._lock:
+            self._export_ids = self._build_export_ids(self.index)
+
+    def _conversation_path(self, conversation_id):
+        """对话JSONL文件路径"""
+        return os.path.join(self.store_dir, f"{conversation_id}.jsonl")
+
+    def _load_index(self):
+        """读取索引文件，不存在或损坏时从JSONL文件重建"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if isinstance(index, dict):
+                return index
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"读取对话索引失败，将重建: {e}")
+        return self.rebuild_index()
+
+    @staticmethod
+    def _build_export_ids(index):
+        """由索引建立导出文件路径到对话ID的映射"""
+        return {entry["export_path"]: conversation_id
+                for conversation_id, entry in index.items() if entry.get("export_path")}
+
+    def _set_export_path(self, conversation_id, export_path):
+        """更新对话的导出文件路径映射（调用时已持有锁）"""
+        old_path = self.index.get(conversation_id, {}).get("export_path")
+        if old_path and self._export_ids.get(old_path) == conversation_id:
+            del self._export_ids[old_path]
+        if export_path:
+            self._export_ids[export_path] = conversation_id
+
+    def _save_index(self):
+        """写入索引文件（先写临时文件再替换，避免写到一半损坏）"""
+        if self._batch_depth:
+            self._index_dirty = True
+            return
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    @contextmanager
+    def batch(self):
+        """批量操作：期间的修改只在结束时写一次索引文件"""
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if not self._batch_depth and self._index_dirty:
+                    self._index_dirty = False
+                    self._save_index()
+
+    def rebuild_index(self):
+        """扫描所有JSONL文件重建索引"""
+        index = {}
+        for filename in os.listdir(self.store_dir):
+            if not filename.endswith('.jsonl'):
+                continue
+            conversation_id = filename[:-len('.jsonl')]
+            try:
+                meta, messages = self._read_conversation(conversation_id)
+            except Exception as e:
+                print(f"读取对话 {filename} 失败: {e}")
+                continue
+            entry = {key: value for key, value in meta.items() if key != "type"}
+            entry["message_count"] = len(messages)
+            entry["mtime"] = os.path.getmtime(self._conversation_path(conversation_id))
+            index[conversation_id] = entry
+
+        with self._lock:
+            self.index = index
+            self._export_ids = self._build_export_ids(index)
+            self._save_index()
+        return index
+
+    def _read_conversation(self, conversation_id):
+        """读取JSONL文件，返回 (元数据, 消息列表)；后出现的元数据行覆盖之前的"""
+        meta = {}
+        messages = []
+        with open(self._conversation_path(conversation_id), 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 最后一行可能因程序中断而不完整，跳过
+                    continue
+                kind = record.pop("type", "message")
+                if kind == "meta":
+                    meta.update(record)
+                else:
+                    messages.append(record)
+        return meta, messages
+
+    def _append_records(self, conversation_id, records):
+        """追加记录到JSONL文件"""
+        with open(self._conversation_path(conversation_id), 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def create(self, messages, title=None, model=None, export_path=None):
+        """新建对话，返回对话ID"""
+        conversation_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        meta = {
+            "id": conversation_id,
+            "title": title,
+            "model": model,
+            "created": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        if export_path:
+            meta["export_path"] = normalize_path(export_path)
+            meta["export_mtime"] = os.path.getmtime(export_path)
+
+        with self._lock:
+            self._append_records(conversation_id,
+                                 [dict(meta, type="meta")] + [_message_record(m) for m in messages])
+            entry = dict(meta)
+            entry["message_count"] = len(messages)
+            entry["mtime"] = os.path.getmtime(self._conversation_path(conversation_id))
+            self.index[conversation_id] = entry
+            self._set_export_path(conversation_id, entry.get("export_path"))
+            self._save_index()
+        return conversation_id
+
+    def append_messages(self, conversation_id, messages):
+        """向已有对话追加消息"""
+        if conversation_id not in self.index or not messages:
+            return
+        with self._lock:
+            self._append_records(conversation_id, [_message_record(m) for m in messages])
+            entry = self.index[conversation_id]
+            entry["message_count"] = entry.get("message_count", 0) + len(messages)
+            entry["mtime"] = os.path.getmtime(self._conversation_path(conversation_id))
+            self._save_index()
+
+    def update_meta(self, conversation_id, **fields):
+        """更新对话元数据（如标题），以追加元数据行的方式写入"""
+        if conversation_id not in self.index:
+            return
+        if "export_path" in fields and fields["export_path"]:
+            fields["export_mtime"] = os.path.getmtime(fields["export_path"])
+            fields["export_path"] = normalize_path(fields["export_path"])
+        with self._lock:
+            self._append_records(conversation_id, [dict(fields, type="meta")])
+            if "export_path" in fields:
+                self._set_export_path(conversation_id, fields["export_path"])
+            entry = self.index[conversation_id]
+            entry.update(fields)
+            entry["mtime"] = os.path.getmtime(self._conversation_path(conversation_id))
+            self._save_index()
+
+    def stored_prefix_length(self, conversation_id, messages):
+        """已存储的消息恰好是 messages 的前若干条时返回已存储的条数，否则返回None"""
+        count = 0
+        for count, record in enumerate(self.iter_messages(conversation_id), 1):
+            if count > len(messages):
+                return None
+            expected = _message_record(messages[count - 1])
+            expected.pop("type")
+            if record != expected:
+                return None
+        return count
+
+    def upsert_by_export_path(self, export_path, messages, title=None, model=None):
+        """保存与导出文件对应的对话，返回对话ID
+
+        已有记录是 messages 的开头部分时只追加新的消息，否则替换整个记录。
+        查找和写入在同一把锁内完成，多个线程同时导入同一文件时不会建立重复的记录。
+        """
+        with self._upsert_lock:
+            conversation_id = self.find_by_export_path(export_path)
+            stored = None
+            if conversation_id is not None:
+                stored = self.stored_prefix_length(conversation_id, messages)
+            if stored is None:
+                if conversation_id is not None:
+                    self.delete(conversation_id)
+                return self.create(messages, title=title, model=model, export_path=export_path)
+
+            self.append_messages(conversation_id, messages[stored:])
+            fields = {"title": title, "export_path": export_path}
+            if model:
+                fields["model"] = model
+            self.update_meta(conversation_id, **fields)
+            return conversation_id
+
+    def load(self, conversation_id):
+        """加载对话的消息列表"""
+        return list(self.iter_messages(conversation_id))
+
+    def iter_messages(self, conversation_id):
+        """逐条读取对话的消息（不一次读入整个文件）"""
+        with open(self._conversation_path(conversation_id), 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.pop("type", "message") == "message":
+                    yield record
+
+    def get(self, conversation_id):
+        """获取对话的索引信息"""
+        return self.index.get(conversation_id)
+
+    def find_by_export_path(self, export_path):
+        """查找由指定Markdown文件导出（或导入）的对话ID"""
+        target = normalize_path(export_path)
+        with self._lock:
+            return self._export_ids.get(target)
+
+    def delete(self, conversation_id):
+        """删除对话"""
+        with self._lock:
+            try:
+                os.remove(self._conversation_path(conversation_id))
+            except FileNotFoundError:
+                pass
+            self._set_export_path(conversation_id, None)
+            if self.index.pop(conversation_id, None) is not None:
+                self._save_index()
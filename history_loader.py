@@ -0,0 +1,94 @@
+"""历史记录后台加载模块"""
+
+import queue
+import threading
+
+import config
+import chat_display
+
+# 队列事件类型
+EVENT_MESSAGE = "message"
+EVENT_DONE = "done"
+EVENT_ERROR = "error"
+EVENT_CANCELLED = "cancelled"
+
+TERMINAL_EVENTS = (EVENT_DONE, EVENT_ERROR, EVENT_CANCELLED)
+
+
+class HistoryLoadWorker:
+    """历史记录加载器：后台线程读取、解析文件并预先生成Markdown片段
+
+    解析出的消息通过有界队列交给UI线程，UI线程只需创建对话对并写入
+    渲染器缓存中已生成的片段。队列满时后台线程等待（背压）。
+    """
+
+    def __init__(self, history_manager, filepath, maxsize=config.HISTORY_LOAD_QUEUE_MAXSIZE):
+        """初始化"""
+        self.history_manager = history_manager
+        self.filepath = filepath
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.progress = 0.0  # 已处理的比例（0~1），由后台线程更新
+        self._cancel_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动后台线程"""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """请求取消（后台线程会在下一条消息或队列等待时退出）"""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        """是否已请求取消"""
+        return self._cancel_event.is_set()
+
+    def _set_progress(self, fraction):
+        """记录进度（由解析生成器回调）"""
+        self.progress = fraction
+
+    def _put(self, event):
+        """放入队列，队列满时等待（背压），等待期间响应取消"""
+        while not self._cancel_event.is_set():
+            try:
+                self.queue.put(event, timeout=config.STREAM_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        """后台线程函数：逐条解析消息并生成片段"""
+        error = None
+        messages = None
+        try:
+            messages = self.history_manager.iter_chat_history(self.filepath, self._set_progress)
+            for msg in messages:
+                if self._cancel_event.is_set():
+                    break
+                chat_display.prepare_message_segments(msg)
+                if not self._put((EVENT_MESSAGE, msg)):
+                    break
+        except Exception as e:
+            error = str(e)
+        finally:
+            if messages is not None:
+                messages.close()
+
+        # 结束事件必须送达，UI线程会一直取到结束事件为止
+        if self._cancel_event.is_set():
+            self.queue.put((EVENT_CANCELLED, None))
+        elif error is not None:
+            self.queue.put((EVENT_ERROR, error))
+        else:
+            self.progress = 1.0
+            self.queue.put((EVENT_DONE, None))
+
+    def next_event(self):
+        """取出一个事件（UI线程调用，不阻塞），队列为空时返回None"""
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            return None
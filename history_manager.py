@@ -1,11 +1,275 @@
 """历史记录管理模块"""
 
+import hashlib
+import json
 import os
 import re
+import threading
 from datetime import datetime
 from tkinter import filedialog
 
 import config
+import conversation_store
+import search_index
+
+
+# 可能需要特殊处理的行：空行，或去掉前导空白后以这些字符开头的行
+# （文件头、轮次标题、思考过程/最终回答标题、分隔线）。其余行一定是正文。
+# 匹配候选行之前的换行符（以字面量开头的模式可以快速跳过正文）
+_CANDIDATE_PATTERN = r'[^\S\n]*(?:[#标导模*-]|\n|\Z)'
+_CANDIDATE_LINE_RE = re.compile(r'\n(?=' + _CANDIDATE_PATTERN + ')')
+_CANDIDATE_FIRST_LINE_RE = re.compile(_CANDIDATE_PATTERN)
+_ROUND_RE = re.compile(r'^##\s+第(\d+)轮\s+-\s+(.+)$')
+_FILE_HEADER_PREFIXES = ('# DeepSeek AI 对话记录', '标题:', '导出时间:', '模型:')
+_THINKING_HEADERS = ('### 🧠 思考过程', '### 思考过程')
+_ANSWER_HEADERS = ('### 💡 最终回答', '### 最终回答')
+
+
+class ChatHistoryScanner:
+    """对话历史文件扫描器
+    
+    用一个编译好的正则在整段文本上查找可能是标题、分隔线或空行的行，
+    两个这样的行之间的正文整段切片收集，不再逐行strip和匹配。
+    文本可以分多次传入（每次必须在行尾结束），feed() 返回已经完整的消息。
+    """
+    
+    def __init__(self):
+        """初始化扫描状态"""
+        self.current_role = None
+        self.current_content = []  # 正文片段（每段为若干连续行）
+        self.current_reasoning = None  # None / 片段列表 / 合并后的字符串
+        self.current_truncated = False  # 当前回答是否被停止生成
+        self.in_round = False
+        self.in_thinking = False
+        self.line_count = 0  # 已扫描的行数（只用于判断文件前3行）
+        self._messages = []
+    
+    def _finish_message(self):
+        """保存当前消息"""
+        if self.current_role and self.current_content:
+            msg = {
+                "role": self.current_role,
+                "content": '\n'.join(self.current_content).strip()
+            }
+            if self.current_reasoning:
+                if isinstance(self.current_reasoning, list):
+                    self.current_reasoning = '\n'.join(self.current_reasoning)
+                msg["reasoning_content"] = self.current_reasoning.strip()
+            if self.current_truncated:
+                msg["truncated"] = True
+            self._messages.append(msg)
+    
+    def _collect(self, chunk):
+        """收集正文片段"""
+        if self.in_round and self.current_role:
+            if self.in_thinking and self.current_reasoning is not None:
+                self.current_reasoning.append(chunk)
+            else:
+                self.current_content.append(chunk)
+    
+    def _handle_line(self, raw_line, in_header_area):
+        """处理一个候选行"""
+        line = raw_line.strip()
+        
+        # 跳过文件头（标题、导出时间、模型等）
+        if not line or line.startswith(_FILE_HEADER_PREFIXES) or \
+           (in_header_area and line.startswith('# ')):
+            return
+        
+        # 检测对话轮次
+        round_match = line.startswith('##') and _ROUND_RE.match(line)
+        if round_match:
+            self._finish_message()
+            
+            role_name = round_match.group(2).strip()
+            if role_name == "我":
+                self.current_role = "user"
+            elif "DeepSeek" in role_name or "AI" in role_name:
+                self.current_role = "assistant"
+            else:
+                self.current_role = None
+            
+            self.current_content = []
+            self.current_reasoning = None
+            self.current_truncated = (self.current_role == "assistant" and
+                                      role_name.endswith(config.TRUNCATED_ROLE_SUFFIX))
+            self.in_round = True
+            self.in_thinking = False
+            return
+        
+        # 检测思考过程标题
+        if line.startswith(_THINKING_HEADERS):
+            self.in_thinking = True
+            self.current_reasoning = []
+            return
+        
+        # 检测最终回答标题
+        if line.startswith(_ANSWER_HEADERS):
+            self.in_thinking = False
+            if self.current_reasoning and isinstance(self.current_reasoning, list):
+                self.current_reasoning = '\n'.join(self.current_reasoning)
+            return
+        
+        # 跳过分隔线
+        if line == '---' or line == '***':
+            return
+        
+        self._collect(raw_line)
+    
+    @staticmethod
+    def _candidate_starts(text):
+        """依次返回候选行的起始位置"""
+        if _CANDIDATE_FIRST_LINE_RE.match(text):
+            yield 0
+        for match in _CANDIDATE_LINE_RE.finditer(text):
+            yield match.end()
+    
+    def feed(self, text):
+        """扫描一段文本，返回其中已经完整的消息列表"""
+        # 文件前3行中的 "# " 行视为标题
+        header_end = -1
+        if self.line_count < 3:
+            header_end = 0
+            for _ in range(3 - self.line_count):
+                header_end = text.find('\n', header_end) + 1
+                if header_end == 0:
+                    header_end = len(text) + 1
+                    break
+        
+        pos = 0
+        for start in self._candidate_starts(text):
+            # 上一个候选行和这一行之间都是正文，整段收集（不含行尾换行符）
+            if start > pos:
+                self._collect(text[pos:start - 1])
+            end = text.find('\n', start)
+            if end < 0:
+                end = len(text)
+            self._handle_line(text[start:end], start < header_end)
+            pos = end + 1
+        if pos < len(text):
+            self._collect(text[pos:])
+        
+        if self.line_count < 3:
+            self.line_count += text.count('\n') + (0 if text.endswith('\n') else 1)
+        
+        messages, self._messages = self._messages, []
+        return messages
+    
+    def close(self):
+        """结束扫描，返回最后一条消息（如果有）"""
+        self._finish_message()
+        messages, self._messages = self._messages, []
+        return messages
+
+
+class HistoryTitleIndex:
+    """历史记录标题缓存
+    
+    以文件路径为键记录修改时间、大小和标题，只有修改时间或大小变化的文件
+    才需要重新读取标题。缓存保存在JSON文件中，程序重启后仍然有效。
+    """
+    
+    def __init__(self, index_path):
+        """初始化并读取缓存文件"""
+        self.index_path = index_path
+        self.entries = {}
+        self.dirty = False
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                self.entries = entries
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"读取标题缓存失败: {e}")
+    
+    def get(self, filepath, mtime, size):
+        """返回缓存的标题，文件已变化或未缓存时返回None"""
+        entry = self.entries.get(filepath)
+        if entry and entry.get("mtime") == mtime and entry.get("size") == size:
+            return entry.get("title")
+        return None
+    
+    def put(self, filepath, mtime, size, title):
+        """记录文件标题"""
+        self.entries[filepath] = {"mtime": mtime, "size": size, "title": title}
+        self.dirty = True
+    
+    def discard(self, filepath):
+        """移除文件的缓存"""
+        if self.entries.pop(filepath, None) is not None:
+            self.dirty = True
+    
+    def retain(self, filepaths):
+        """只保留仍然存在的文件的缓存"""
+        for filepath in set(self.entries) - set(filepaths):
+            del self.entries[filepath]
+            self.dirty = True
+    
+    def save(self):
+        """有改动时写入缓存文件"""
+        if not self.dirty:
+            return
+        try:
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+            self.dirty = False
+        except Exception as e:
+            print(f"保存标题缓存失败: {e}")
+
+
+class GeneratedTitleCache:
+    """AI生成标题的缓存
+    
+    以标题生成内容（generate_title_content 的结果）的哈希为键，
+    重复导出相同的对话时不需要再次请求API。最多保留 max_entries 条（最近使用的）。
+    """
+    
+    def __init__(self, cache_path, max_entries=config.GENERATED_TITLE_CACHE_SIZE):
+        """初始化并读取缓存文件"""
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.entries = {}  # 按使用顺序排列（dict保持插入顺序）
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                self.entries = entries
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"读取生成标题缓存失败: {e}")
+    
+    @staticmethod
+    def _key(content):
+        """缓存键"""
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+    
+    def get(self, content):
+        """返回缓存的标题，未缓存时返回None"""
+        key = self._key(content)
+        title = self.entries.pop(key, None)
+        if title is not None:
+            self.entries[key] = title
+        return title
+    
+    def put(self, content, title):
+        """记录生成的标题并写入缓存文件"""
+        key = self._key(content)
+        self.entries.pop(key, None)
+        self.entries[key] = title
+        while len(self.entries) > self.max_entries:
+            del self.entries[next(iter(self.entries))]
+        try:
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"保存生成标题缓存失败: {e}")
 
 
 class HistoryManager:
@@ -16,127 +280,234 @@ class HistoryManager:
         self.chat_history_dir = chat_history_dir
         if not os.path.exists(self.chat_history_dir):
             os.makedirs(self.chat_history_dir)
+        # 结构化存储：Markdown只作为导出格式，列表和加载都从存储读取
+        self.store = conversation_store.ConversationStore(
+            os.path.join(self.chat_history_dir, config.CONVERSATION_STORE_DIR_NAME))
+        self.title_index = HistoryTitleIndex(
+            os.path.join(self.store.store_dir, config.HISTORY_TITLE_INDEX_FILE))
+        self._file_stats = {}  # 路径 -> (修改时间, 大小)，由 get_history_files 更新
+        self.search_index = search_index.SearchIndex(
+            os.path.join(self.store.store_dir, config.SEARCH_INDEX_FILE))
+        self.generated_titles = GeneratedTitleCache(
+            os.path.join(self.store.store_dir, config.GENERATED_TITLE_CACHE_FILE))
+        self._sync_lock = threading.Lock()  # 同一时间只有一个线程更新索引
     
     def parse_chat_history(self, content):
         """解析对话历史文件"""
-        history = []
-        lines = content.split('\n')
+        scanner = ChatHistoryScanner()
+        history = scanner.feed(content)
+        history.extend(scanner.close())
+        return history
+    
+    def _get_stored_conversation(self, filepath):
+        """获取与Markdown文件对应且仍然有效的存储对话ID
         
-        current_role = None
-        current_content = []
-        current_reasoning = None
-        in_round = False
-        in_thinking = False
+        文件在导出后被外部修改过（修改时间不一致）时视为无效。
+        """
+        conversation_id = self.store.find_by_export_path(filepath)
+        if conversation_id is None:
+            return None
+        try:
+            mtime = os.path.getmtime(filepath)
+        except OSError:
+            return None
+        if abs(mtime - self.store.get(conversation_id).get("export_mtime", 0)) > 1:
+            return None
+        return conversation_id
+    
+    def load_conversation(self, filepath):
+        """加载历史对话
         
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            # 跳过文件头（标题、导出时间、模型等）
-            if line.startswith('# DeepSeek AI 对话记录') or \
-               line.startswith('标题:') or \
-               line.startswith('导出时间:') or \
-               line.startswith('模型:') or \
-               (line.startswith('# ') and i < 3) or \
-               line == '':
-                i += 1
-                continue
-            
-            # 检测对话轮次
-            round_match = re.match(r'^##\s+第(\d+)轮\s+-\s+(.+)$', line)
-            if round_match:
-                # 保存上一轮的内容
-                if current_role and current_content:
-                    msg = {
-                        "role": current_role,
-                        "content": '\n'.join(current_content).strip()
-                    }
-                    if current_reasoning:
-                        msg["reasoning_content"] = current_reasoning.strip()
+        优先从结构化存储读取；没有对应记录（如旧版本导出的文件或外部修改过的
+        文件）时解析Markdown，并把结果写入存储，下次加载无需再解析。
+        """
+        return list(self.iter_chat_history(filepath))
+    
+    def iter_chat_history(self, filepath, progress=None):
+        """逐条产生历史对话中的消息，边读边解析，不一次读入整个文件
+        
+        有有效的存储记录时逐行读取JSONL；否则分块读取Markdown并用扫描器解析，
+        全部读完后把结果写入存储。
+        progress: 可选的回调，参数为已处理的比例（0~1）
+        """
+        conversation_id = self._get_stored_conversation(filepath)
+        if conversation_id is not None:
+            total = self.store.get(conversation_id).get("message_count") or 1
+            for count, msg in enumerate(self.store.iter_messages(conversation_id), 1):
+                if progress:
+                    progress(min(count / total, 1.0))
+                yield msg
+            return
+        
+        total_bytes = os.path.getsize(filepath) or 1
+        
+        history = []
+        scanner = ChatHistoryScanner()
+        leftover = ''
+        with open(filepath, 'r', encoding='utf-8') as f:
+            while True:
+                chunk = f.read(config.HISTORY_READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                # 只把完整的行交给扫描器，不完整的最后一行留到下一块
+                chunk = leftover + chunk
+                cut = chunk.rfind('\n') + 1
+                leftover = chunk[cut:]
+                if progress:
+                    # 底层二进制流的位置（包含文本层预读的部分，足够用于显示进度）
+                    progress(min(f.buffer.tell() / total_bytes, 1.0))
+                for msg in scanner.feed(chunk[:cut]):
                     history.append(msg)
-                
-                # 开始新的一轮
-                role_name = round_match.group(2).strip()
-                if role_name == "我":
-                    current_role = "user"
-                elif "DeepSeek" in role_name or "AI" in role_name:
-                    current_role = "assistant"
-                else:
-                    current_role = None
-                
-                current_content = []
-                current_reasoning = None
-                in_round = True
-                in_thinking = False
-                i += 1
-                continue
-            
-            # 检测思考过程标题
-            if line.startswith('### 🧠 思考过程') or line.startswith('### 思考过程'):
-                in_thinking = True
-                current_reasoning = []
-                i += 1
-                continue
-            
-            # 检测最终回答标题
-            if line.startswith('### 💡 最终回答') or line.startswith('### 最终回答'):
-                in_thinking = False
-                if current_reasoning:
-                    current_reasoning = '\n'.join(current_reasoning)
-                i += 1
-                continue
-            
-            # 跳过分隔线
-            if line == '---' or line == '***':
-                i += 1
-                continue
-            
-            # 收集内容
-            if in_round and current_role:
-                if in_thinking and current_reasoning is not None:
-                    # 收集思考过程内容
-                    current_reasoning.append(lines[i])
-                else:
-                    # 收集正常内容
-                    current_content.append(lines[i])
-            
-            i += 1
+                    yield msg
         
-        # 保存最后一轮的内容
-        if current_role and current_content:
-            msg = {
-                "role": current_role,
-                "content": '\n'.join(current_content).strip()
-            }
-            if current_reasoning:
-                if isinstance(current_reasoning, list):
-                    current_reasoning = '\n'.join(current_reasoning)
-                msg["reasoning_content"] = current_reasoning.strip()
+        messages = scanner.feed(leftover) if leftover else []
+        messages.extend(scanner.close())
+        for msg in messages:
             history.append(msg)
+            yield msg
         
-        return history
+        if history:
+            try:
+                self._save_to_store(filepath, history, self.extract_title_from_file(filepath))
+            except Exception as e:
+                print(f"保存对话到存储失败: {e}")
+    
+    def _save_to_store(self, filepath, messages, title, model=None):
+        """保存与Markdown文件对应的对话（已有记录时追加或替换），并更新搜索索引"""
+        conversation_id = self.store.upsert_by_export_path(filepath, messages,
+                                                           title=title, model=model)
+        st = os.stat(filepath)
+        self.search_index.index_conversation(filepath, st.st_mtime, st.st_size, title, messages)
+        return conversation_id
+    
+    def sync_search_index(self, filepaths=None):
+        """增量更新搜索索引：只处理修改时间或大小变化的文件
+        
+        filepaths为None时检查整个历史记录目录，并删除已不存在的文件的索引。
+        可在后台线程中调用。返回重新建立索引的文件数。
+        """
+        with self._sync_lock, self.store.batch():
+            return self._sync_search_index(filepaths)
+    
+    def _sync_search_index(self, filepaths):
+        """sync_search_index 的实现（调用时已持有锁）"""
+        if filepaths is None:
+            filepaths = [os.path.join(self.chat_history_dir, name)
+                         for name in os.listdir(self.chat_history_dir) if name.endswith('.md')]
+            self.search_index.retain(filepaths)
+        
+        updated = 0
+        for filepath in filepaths:
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                self.search_index.remove(filepath)
+                continue
+            if self.search_index.is_current(filepath, st.st_mtime, st.st_size):
+                continue
+            try:
+                messages = self.load_conversation(filepath)
+                # 从存储加载时不会重建索引，这里补上
+                if not self.search_index.is_current(filepath, st.st_mtime, st.st_size):
+                    self.search_index.index_conversation(
+                        filepath, st.st_mtime, st.st_size,
+                        self.extract_title_from_file(filepath), messages)
+                updated += 1
+            except Exception as e:
+                print(f"建立搜索索引失败 {filepath}: {e}")
+        return updated
+    
+    def search(self, query, limit=config.SEARCH_RESULT_LIMIT):
+        """全文搜索历史对话，返回按相关度排序的消息命中列表"""
+        try:
+            return self.search_index.search(query, limit)
+        except Exception as e:
+            print(f"搜索失败: {e}")
+            return []
+    
+    def delete_history_file(self, filepath):
+        """删除历史对话文件及其存储记录"""
+        conversation_id = self.store.find_by_export_path(filepath)
+        if conversation_id is not None:
+            self.store.delete(conversation_id)
+        os.remove(filepath)
+        self.title_index.discard(filepath)
+        self.title_index.save()
+        self.search_index.remove(filepath)
     
     def get_history_files(self):
         """获取历史记录文件列表"""
         if not os.path.exists(self.chat_history_dir):
             return []
         
+        # scandir 的目录项自带文件属性（Windows上不需要额外的系统调用）
         history_files = []
-        for filename in os.listdir(self.chat_history_dir):
-            if filename.endswith('.md'):
-                filepath = os.path.join(self.chat_history_dir, filename)
-                try:
-                    mtime = os.path.getmtime(filepath)
-                    history_files.append((mtime, filepath, filename))
-                except:
-                    continue
+        file_stats = {}
+        with os.scandir(self.chat_history_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.md'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    file_stats[entry.path] = (stat.st_mtime, stat.st_size)
+                    history_files.append((stat.st_mtime, entry.path, entry.name))
+        
+        self._file_stats = file_stats
+        self.title_index.retain(file_stats)
         
         # 按时间从新到旧排序
         history_files.sort(reverse=True)
         return history_files
     
+    def stat_history_file(self, filepath):
+        """重新读取单个文件的属性（用于增量更新），返回 (修改时间, 路径, 文件名)
+        
+        文件不存在时返回None。
+        """
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            self.forget_history_file(filepath)
+            return None
+        self._file_stats[filepath] = (st.st_mtime, st.st_size)
+        return (st.st_mtime, filepath, os.path.basename(filepath))
+    
+    def forget_history_file(self, filepath):
+        """文件已被删除：移除其属性和标题缓存"""
+        self._file_stats.pop(filepath, None)
+        self.title_index.discard(filepath)
+    
+    def get_title(self, filepath):
+        """获取历史记录标题，文件未变化时直接使用缓存，不打开文件"""
+        stat = self._file_stats.get(filepath)
+        if stat is None:
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                return None
+            stat = (st.st_mtime, st.st_size)
+            self._file_stats[filepath] = stat
+        
+        title = self.title_index.get(filepath, *stat)
+        if title is None:
+            title = self.extract_title_from_file(filepath)
+            if title:
+                self.title_index.put(filepath, stat[0], stat[1], title)
+        return title
+    
+    def save_title_index(self):
+        """保存标题缓存（在一次刷新结束后调用）"""
+        self.title_index.save()
+    
     def extract_title_from_file(self, filepath):
-        """从文件中提取标题"""
+        """从文件中提取标题（有存储记录时直接使用索引中的标题）"""
+        conversation_id = self._get_stored_conversation(filepath)
+        if conversation_id is not None:
+            title = self.store.get(conversation_id).get("title")
+            if title:
+                return title
+        
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
                 first_lines = [f.readline().strip() for _ in range(10)]
@@ -176,7 +547,12 @@ class HistoryManager:
     
     def export_chat(self, conversation_history, conversation_pairs, model, 
                    generate_title_callback=None):
-        """导出对话到文件"""
+        """导出对话到文件
+        
+        标题优先使用缓存的AI生成标题；没有缓存时先用临时标题写入文件，
+        再调用 generate_title_callback(文件路径, 标题生成内容) 在后台生成标题，
+        生成后由 apply_generated_title 更新文件。
+        """
         if not conversation_history:
             return None, "没有对话内容可导出"
         
@@ -215,17 +591,17 @@ class HistoryManager:
             # 对消息索引进行排序，确保按照conversation_history的顺序
             messages_to_export = sorted(set(messages_to_export))
             
-            # 生成标题（使用AI总结，只基于要导出的对话）
-            title = None
-            if generate_title_callback:
-                title = generate_title_callback(messages_to_export)
-            
-            if not title:
-                title = "DeepSeek AI 对话记录"
-            
             if not messages_to_export:
                 return None, "没有可导出的对话内容"
             
+            # 标题（AI总结，只基于要导出的对话）：相同内容生成过标题时直接使用
+            title_content = self.generate_title_content(conversation_history, messages_to_export)
+            title = self.generated_titles.get(title_content) if title_content else None
+            title_pending = title is None and title_content and generate_title_callback
+            if not title:
+                title = self.provisional_title(
+                    [conversation_history[idx] for idx in messages_to_export])
+            
             with open(file_path, 'w', encoding='utf-8') as f:
                 # 写入标题
                 f.write(f"# {title}\n\n")
@@ -245,6 +621,8 @@ class HistoryManager:
                         continue
                     msg = conversation_history[msg_idx]
                     role = "我" if msg["role"] == "user" else "DeepSeek AI"
+                    if msg.get("truncated"):
+                        role += config.TRUNCATED_ROLE_SUFFIX
                     f.write(f"## 第{export_round}轮 - {role}\n\n")
                     
                     # 如果有思考过程，先导出思考过程
@@ -257,11 +635,67 @@ class HistoryManager:
                     f.write("---\n\n")
                     export_round += 1
             
+            # 同时保存结构化副本，之后加载无需解析Markdown
+            try:
+                self._save_to_store(file_path,
+                                    [conversation_history[idx] for idx in messages_to_export
+                                     if idx < len(conversation_history)],
+                                    title, model)
+            except Exception as e:
+                print(f"保存对话到存储失败: {e}")
+            
+            if title_pending:
+                generate_title_callback(file_path, title_content)
+            
             return file_path, None
             
         except Exception as e:
             return None, f"导出失败: {str(e)}"
     
+    def provisional_title(self, messages):
+        """AI标题生成之前使用的临时标题：第一条用户消息的开头"""
+        for msg in messages:
+            if msg.get("role") == "user" and msg.get("content", "").strip():
+                text = ' '.join(msg["content"].split())
+                if len(text) > config.PROVISIONAL_TITLE_LENGTH:
+                    text = text[:config.PROVISIONAL_TITLE_LENGTH] + "…"
+                return text
+        return "DeepSeek AI 对话记录"
+    
+    def apply_generated_title(self, filepath, title_content, title):
+        """记录生成的标题，并把导出文件、存储和搜索索引中的临时标题替换为它
+        
+        文件在导出后被修改过（或已删除）时只记录缓存，返回False。
+        """
+        self.generated_titles.put(title_content, title)
+        
+        conversation_id = self._get_stored_conversation(filepath)
+        if conversation_id is None:
+            return False
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                lines = f.read().split('\n')
+            # 只替换文件头中的标题行（"# 标题" 和 "标题: ..."）
+            for i, line in enumerate(lines[:6]):
+                if i == 0 and line.startswith('# '):
+                    lines[i] = f"# {title}"
+                elif line.startswith('标题:'):
+                    lines[i] = f"标题: {title}"
+                    break
+            tmp_path = filepath + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines))
+            os.replace(tmp_path, filepath)
+            
+            self.store.update_meta(conversation_id, title=title, export_path=filepath)
+            st = os.stat(filepath)
+            self.search_index.index_conversation(filepath, st.st_mtime, st.st_size, title,
+                                                 self.store.load(conversation_id))
+            return True
+        except Exception as e:
+            print(f"更新导出文件标题失败: {e}")
+            return False
+    
     def generate_title_content(self, conversation_history, message_indices=None, 
                              max_length=config.MAX_TITLE_GEN_LENGTH):
         """生成用于标题生成的对话内容"""
@@ -0,0 +1,196 @@
+"""历史记录目录监视模块
+
+后台线程监视历史记录目录，把文件的新增、修改和删除事件放入队列，
+由UI线程定时取出并增量更新侧边栏。Linux上使用inotify（通过ctypes调用），
+其他平台或inotify不可用时退回到定时扫描目录。
+"""
+
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+
+import config
+
+# 事件类型
+EVENT_ADDED = "added"
+EVENT_MODIFIED = "modified"
+EVENT_REMOVED = "removed"
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _load_inotify():
+    """加载libc中的inotify函数，不可用时返回None"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class HistoryWatcher:
+    """历史记录目录监视器
+
+    事件以 (事件类型, 文件路径) 的形式放入 queue，UI线程调用 drain() 取出。
+    """
+
+    def __init__(self, directory, suffix='.md', interval=config.HISTORY_WATCH_INTERVAL):
+        """初始化
+
+        interval: 轮询模式的扫描间隔（秒），inotify模式下为检查停止请求的间隔
+        """
+        self.directory = directory
+        self.suffix = suffix
+        self.interval = interval
+        self.queue = queue.Queue()
+        self.backend = None  # "inotify" 或 "polling"
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动后台线程"""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """请求停止（后台线程在下一个检查间隔退出）"""
+        self._stop_event.set()
+
+    def _emit(self, kind, filename):
+        """放入一个事件（只关心指定后缀的文件）"""
+        if filename.endswith(self.suffix):
+            self.queue.put((kind, os.path.join(self.directory, filename)))
+
+    def _run(self):
+        """后台线程函数：优先使用inotify，失败时退回轮询"""
+        try:
+            if self._run_inotify():
+                return
+        except Exception as e:
+            print(f"inotify监视失败，改用轮询: {e}")
+        self._run_polling()
+
+    def _run_inotify(self):
+        """使用inotify监视目录，inotify不可用时返回False"""
+        libc = _load_inotify()
+        if libc is None:
+            return False
+
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return False
+        try:
+            mask = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+                    IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+            if libc.inotify_add_watch(fd, os.fsencode(self.directory), mask) < 0:
+                return False
+            self.backend = "inotify"
+
+            while not self._stop_event.is_set():
+                readable, _, _ = select.select([fd], [], [], self.interval)
+                if not readable:
+                    continue
+                try:
+                    data = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                if not self._dispatch_inotify(data):
+                    # 目录本身被删除或移动，不能再继续监视
+                    break
+        finally:
+            os.close(fd)
+        return True
+
+    def _dispatch_inotify(self, data):
+        """解析一次read得到的inotify事件，目录失效时返回False"""
+        offset = 0
+        while offset + _INOTIFY_EVENT.size <= len(data):
+            _, mask, _, name_len = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = data[offset:offset + name_len].rstrip(b'\0')
+            offset += name_len
+            filename = os.fsdecode(name)
+
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                return False
+            if mask & IN_Q_OVERFLOW:
+                # 内核事件队列溢出，已丢失事件，让UI做一次完整刷新
+                self.queue.put((EVENT_MODIFIED, None))
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                self._emit(EVENT_ADDED, filename)
+            elif mask & IN_CLOSE_WRITE:
+                self._emit(EVENT_MODIFIED, filename)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._emit(EVENT_REMOVED, filename)
+        return True
+
+    def _scan(self):
+        """扫描目录，返回 {文件名: (修改时间, 大小)}"""
+        snapshot = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(self.suffix):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        snapshot[entry.name] = (stat.st_mtime, stat.st_size)
+        except OSError:
+            pass
+        return snapshot
+
+    def _run_polling(self):
+        """定时扫描目录并与上一次的结果比较"""
+        self.backend = "polling"
+        previous = self._scan()
+        while not self._stop_event.wait(self.interval):
+            current = self._scan()
+            for filename, stat in current.items():
+                old = previous.get(filename)
+                if old is None:
+                    self._emit(EVENT_ADDED, filename)
+                elif old != stat:
+                    self._emit(EVENT_MODIFIED, filename)
+            for filename in previous.keys() - current.keys():
+                self._emit(EVENT_REMOVED, filename)
+            previous = current
+
+    def drain(self):
+        """取出队列中已有的事件（UI线程调用，不阻塞）
+
+        同一文件的多个事件合并为最后一个，返回 [(事件类型, 文件路径), ...]；
+        文件路径为None表示需要完整刷新。
+        """
+        events = {}
+        while True:
+            try:
+                kind, filepath = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            events.pop(filepath, None)
+            events[filepath] = kind
+        return [(kind, filepath) for filepath, kind in events.items()]
@@ -8,17 +8,24 @@ except:
     pass
 
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import messagebox, ttk
 import json
 import os
 import threading
-from datetime import datetime
+import time
 import config
 import ui_components as ui
 import chat_display as chat
-import markdown_renderer as md
 import api_client
+import async_bridge
+import context_manager
+import history_loader
 import history_manager
+import history_watcher
+import request_scheduler
+import session_manager
+import stream_engine
+import token_counter
 
 
 class ModernDeepSeekClient:
@@ -41,13 +48,19 @@ class ModernDeepSeekClient:
 
         # API客户端和历史管理器
         self.api_client = None
+        self.async_client = None  # 异步客户端，请求在 async_loop 的事件循环中并发执行
+        self.async_loop = async_bridge.AsyncLoopThread()
+        self.async_bridge = async_bridge.TkAsyncBridge(root, self.async_loop)
         self.history_manager = history_manager.HistoryManager()
 
-        # 对话数据
-        self.conversation_history = []
-        self.conversation_pairs = {}  # 存储ConversationPair对象
-        self.current_pair_index = -1
-        self.conversation_pair_frames = {}
+        # 会话（标签页）：每个会话有独立的对话历史、对话对和显示区域
+        self.sessions = session_manager.SessionManager()
+
+        # 输入区域预计token数的延迟更新任务
+        self._token_estimate_job = None
+
+        # 正在逐步加载的历史记录（None表示没有加载任务）
+        self.history_load_state = None
 
         # 思考模式变量
         self.thinking_enabled_var = None
@@ -55,6 +68,9 @@ class ModernDeepSeekClient:
         # 加载配置
         self.config_file = config.CONFIG_FILE
         self.config = self.load_config()
+
+        # 生成请求调度：限制同时进行的请求数，各会话轮流执行
+        self.scheduler = request_scheduler.RequestScheduler(self.config["max_concurrent_requests"])
         
         # 边栏折叠状态（在配置加载后初始化）
         self.sidebar_collapsed_var = tk.BooleanVar(value=self.config.get("sidebar_collapsed", False))
@@ -78,6 +94,69 @@ class ModernDeepSeekClient:
         # 存储UI组件引用以便主题切换
         self.ui_widgets = {}
 
+    # 以下属性指向当前显示的会话，供只操作当前标签页的界面代码使用；
+    # 请求过程中的回调显式传入发起请求的会话
+    @property
+    def session(self):
+        """当前显示的会话"""
+        return self.sessions.active
+
+    @property
+    def conversation_history(self):
+        """当前会话的对话历史"""
+        return self.session.conversation_history
+
+    @conversation_history.setter
+    def conversation_history(self, value):
+        self.session.conversation_history = value
+
+    @property
+    def conversation_pairs(self):
+        """当前会话的对话对"""
+        return self.session.conversation_pairs
+
+    @conversation_pairs.setter
+    def conversation_pairs(self, value):
+        self.session.conversation_pairs = value
+
+    @property
+    def conversation_pair_frames(self):
+        """当前会话的对话对Frame"""
+        return self.session.conversation_pair_frames
+
+    @conversation_pair_frames.setter
+    def conversation_pair_frames(self, value):
+        self.session.conversation_pair_frames = value
+
+    @property
+    def current_pair_index(self):
+        """当前会话最后一个对话对的索引"""
+        return self.session.current_pair_index
+
+    @current_pair_index.setter
+    def current_pair_index(self, value):
+        self.session.current_pair_index = value
+
+    @property
+    def context_manager(self):
+        """当前会话的上下文窗口"""
+        return self.session.context_manager
+
+    @property
+    def chat_canvas(self):
+        """当前会话的对话Canvas"""
+        return self.session.chat_canvas
+
+    @property
+    def chat_content_frame(self):
+        """当前会话的对话内容Frame"""
+        return self.session.chat_content_frame
+
+    @property
+    def pair_view(self):
+        """当前会话的虚拟化视图"""
+        return self.session.pair_view
+
     def load_config(self):
         """加载配置文件"""
         default_config = config.DEFAULT_CONFIG.copy()
@@ -107,7 +186,10 @@ class ModernDeepSeekClient:
             "thinking_enabled": self.thinking_enabled_var.get(),
             "dark_mode": self.dark_mode_var.get(),
             "sidebar_collapsed": self.sidebar_collapsed_var.get(),
-            "history_sidebar_collapsed": self.history_sidebar_collapsed_var.get()
+            "history_sidebar_collapsed": self.history_sidebar_collapsed_var.get(),
+            "context_budget_tokens": self.context_budget_var.get(),
+            "context_summary_enabled": self.context_summary_var.get(),
+            "max_concurrent_requests": self.max_concurrent_var.get()
         }
 
     def save_config(self, config_dict=None):
@@ -241,6 +323,22 @@ class ModernDeepSeekClient:
         ui.create_checkbutton(param_frame, "流式响应", self.stream_var,
                             bg=theme["COLOR_BG_SIDEBAR"]).pack(anchor=tk.W, pady=5)
 
+        # 上下文预算：超出时裁剪较早的对话
+        self.context_budget_var = tk.IntVar(value=self.config["context_budget_tokens"])
+        ui.create_scale_with_label(param_frame, "上下文预算:", self.context_budget_var,
+                                 config.CONTEXT_BUDGET_MIN,
+                                 max(config.MODEL_CONTEXT_TOKENS.values()),
+                                 resolution=config.CONTEXT_BUDGET_STEP)
+        self.context_summary_var = tk.BooleanVar(value=self.config["context_summary_enabled"])
+        ui.create_checkbutton(param_frame, "摘要超出预算的早期对话", self.context_summary_var,
+                            bg=theme["COLOR_BG_SIDEBAR"]).pack(anchor=tk.W, pady=5)
+
+        # 同时进行的生成请求数（多个会话并行）
+        self.max_concurrent_var = tk.IntVar(value=self.config["max_concurrent_requests"])
+        ui.create_scale_with_label(param_frame, "并发请求数:", self.max_concurrent_var,
+                                 1, config.MAX_CONCURRENT_REQUESTS_LIMIT,
+                                 command=lambda value: self.scheduler.set_max_in_flight(value))
+
         # 夜间模式开关
         theme_frame, self.dark_mode_check = ui.create_frame_with_checkbox(
             self.sidebar_content, "🌙 夜间模式:", self.dark_mode_var,
@@ -292,14 +390,34 @@ class ModernDeepSeekClient:
         ui.create_button(self.history_sidebar_content, "🔄 刷新", self.refresh_history,
                         bg=config.COLOR_BUTTON_BLUE, pady=5).pack(fill=tk.X, padx=10, pady=(0, 10))
 
+        # 搜索框：输入关键词后列表显示命中的消息，清空后恢复为文件列表
+        search_frame = tk.Frame(self.history_sidebar_content, bg=config.COLOR_BG_CONFIG)
+        search_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+        ui.create_label(search_frame, text="🔍", bg=config.COLOR_BG_CONFIG,
+                        fg=config.COLOR_TEXT_WHITE).pack(side=tk.LEFT, padx=(0, 5))
+        self.history_search_var = tk.StringVar()
+        self.history_search_entry = ui.create_entry(search_frame,
+                                                    textvariable=self.history_search_var,
+                                                    bg=theme["COLOR_BG_INPUT"])
+        self.history_search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, ipady=4)
+        self.history_search_entry.bind("<Escape>", lambda e: self.history_search_var.set(""))
+        self.history_search_var.trace_add("write", lambda *args: self._schedule_history_search())
+        self._history_search_after_id = None
+        self.history_search_results = None  # None表示未在搜索
+
         # 历史记录列表
         history_list_frame = tk.Frame(self.history_sidebar_content, bg=config.COLOR_BG_CONFIG)
         history_list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
 
-        self.history_canvas, self.history_content, _ = ui.create_scrollable_canvas(
-            history_list_frame, bg_color=config.COLOR_BG_SIDEBAR)
-
-        self.history_buttons = []
+        # 虚拟化列表：只为可见的行创建widget，标题在行显示时才读取
+        self.history_list = ui.VirtualListView(
+            history_list_frame, config.HISTORY_ROW_HEIGHT,
+            self._create_history_row, self._bind_history_row,
+            bg_color=config.COLOR_BG_SIDEBAR)
+        self.history_canvas = self.history_list.canvas
+        self._history_row_buttons = {}  # 行Frame -> 标题按钮
+        self._title_save_pending = False
+        self.history_files = []
 
         # 主聊天区域（放在历史栏右边，占据剩余空间）
         chat_container = tk.Frame(main_container, bg=config.COLOR_BG_MAIN)
@@ -315,6 +433,12 @@ class ModernDeepSeekClient:
                        font=config.FONT_MEDIUM, bg=config.COLOR_BG_CHAT).pack(
                        side=tk.LEFT, padx=20)
 
+        # 会话（标签页）按钮
+        ui.create_button(title_bar, "➕ 新会话", self.new_session,
+                        bg=config.COLOR_BUTTON_BLUE, padx=10, pady=3).pack(side=tk.LEFT, padx=(0, 5))
+        ui.create_button(title_bar, "✖ 关闭会话", self.close_session,
+                        bg=config.COLOR_BUTTON_GRAY, padx=10, pady=3).pack(side=tk.LEFT)
+
         # 状态指示器
         self.status_indicator = ui.create_label(title_bar, text="●", fg=config.COLOR_STATUS_RED,
                                                font=("Segoe UI", 12), bg=config.COLOR_BG_CHAT)
@@ -323,12 +447,10 @@ class ModernDeepSeekClient:
                                            font=self.small_font, bg=config.COLOR_BG_CHAT)
         self.status_label.pack(side=tk.RIGHT, padx=(0, 5))
 
-        # 聊天显示区域
-        chat_frame = tk.Frame(chat_container, bg=config.COLOR_BG_CHAT)
-        chat_frame.pack(fill=tk.BOTH, expand=True, padx=2, pady=(2, 0))
-
-        self.chat_canvas, self.chat_content_frame, _ = ui.create_scrollable_canvas(
-            chat_frame, bg_color=config.COLOR_BG_CHAT)
+        # 聊天显示区域：每个会话一个标签页
+        self.session_notebook = ttk.Notebook(chat_container)
+        self.session_notebook.pack(fill=tk.BOTH, expand=True, padx=2, pady=(2, 0))
+        self.session_notebook.bind("<<NotebookTabChanged>>", self._on_session_tab_changed)
 
         # 输入区域
         input_frame = tk.Frame(chat_container, bg=config.COLOR_BG_CHAT)
@@ -356,18 +478,30 @@ class ModernDeepSeekClient:
                                         bg=config.COLOR_BUTTON_GREEN, padx=20, pady=5,
                                         state=tk.DISABLED)
         self.send_btn.pack(side=tk.RIGHT, padx=5)
+        self.stop_btn = ui.create_button(right_btn_frame, "⏹ 停止生成", self.stop_generation,
+                                        bg=config.COLOR_BUTTON_RED, padx=15, pady=5,
+                                        state=tk.DISABLED)
+        self.stop_btn.pack(side=tk.RIGHT, padx=5)
 
         ui.create_label(btn_frame, text="Ctrl+Enter 发送消息 | Shift+Enter 换行",
                        font=config.FONT_TINY, bg=config.COLOR_BG_CHAT,
                        fg=config.COLOR_TEXT_MEDIUM_GRAY).pack(side=tk.LEFT, padx=(10, 0))
 
+        # 预计发送的token数（对话历史窗口 + 当前输入）
+        self.token_estimate_label = ui.create_label(btn_frame, text="", font=config.FONT_TINY,
+                                                    bg=config.COLOR_BG_CHAT,
+                                                    fg=config.COLOR_TEXT_MEDIUM_GRAY)
+        self.token_estimate_label.pack(side=tk.LEFT, padx=(10, 0))
+
         # 绑定快捷键
         self.input_text.bind("<Control-Return>", lambda e: self.send_message())
         self.input_text.bind("<Shift-Return>", lambda e: None)
+        self.input_text.bind("<KeyRelease>", lambda e: self._schedule_token_estimate())
 
-        # 设置初始提示
-        self.show_welcome_message()
+        # 第一个会话（显示初始提示）
+        self._create_session_tab()
         self.refresh_history()
+        self._start_history_watcher()
         
         # 保存chat_container引用，以便后续使用
         self.chat_container = chat_container
@@ -376,6 +510,84 @@ class ModernDeepSeekClient:
         self.root.bind('<Configure>', self._on_window_configure)
         self._last_window_width = self.root.winfo_width()
 
+    def _create_session_tab(self):
+        """新建会话及其标签页，并切换到该标签页"""
+        session = self.sessions.create()
+        session.tab_frame = tk.Frame(self.session_notebook, bg=config.COLOR_BG_CHAT)
+        session.chat_canvas, session.chat_content_frame, chat_scrollbar = \
+            ui.create_scrollable_canvas(session.tab_frame, bg_color=config.COLOR_BG_CHAT)
+
+        # 虚拟化视图：只为视口附近的对话对创建widget
+        if config.VIRTUAL_LIST_ENABLED:
+            session.pair_view = chat.VirtualPairView(session.chat_canvas, chat_scrollbar,
+                                                     session.get_ordered_pairs)
+
+        self.session_notebook.add(session.tab_frame, text=session.title)
+        self.session_notebook.select(session.tab_frame)
+        self.show_welcome_message()
+        return session
+
+    def new_session(self):
+        """新建会话"""
+        if self.history_load_state is not None:
+            messagebox.showwarning("警告", "正在加载历史记录，请稍候")
+            return
+        self._create_session_tab()
+
+    def close_session(self):
+        """关闭当前会话（正在生成的请求会被取消）"""
+        if self.history_load_state is not None:
+            messagebox.showwarning("警告", "正在加载历史记录，请稍候")
+            return
+        if len(self.sessions) <= 1:
+            messagebox.showinfo("提示", "至少保留一个会话，可使用“清空对话”清除内容")
+            return
+
+        session = self.session
+        if self.scheduler.is_busy(session.id):
+            if not messagebox.askyesno("确认", "该会话正在生成回复，关闭后将取消请求。确定要关闭吗？"):
+                return
+            self.scheduler.cancel_session(session.id)
+            if session.stream_worker is not None:
+                session.stream_worker.cancel()
+            # 取消成功后不会再有回调，需要在这里释放调度器的执行位置
+            if session.request_future is not None and session.request_future.cancel():
+                self._on_request_done(session)
+        elif session.conversation_history:
+            if not messagebox.askyesno("确认", f"确定要关闭“{session.title}”吗？未导出的对话将丢失。"):
+                return
+
+        self.sessions.remove(session.id)
+        self.session_notebook.forget(session.tab_frame)
+        session.tab_frame.destroy()
+
+    def _on_session_tab_changed(self, event=None):
+        """切换标签页：更新当前会话"""
+        selected = self.session_notebook.select()
+        session = self.sessions.find_by_tab(selected)
+        if session is None or session is self.session:
+            return
+        # 加载历史记录时消息会写入当前会话，不允许切换
+        if self.history_load_state is not None:
+            self.session_notebook.select(self.session.tab_frame)
+            return
+        self.sessions.set_active(session.id)
+        # 隐藏期间窗口宽度可能已变化
+        self._update_all_pair_heights()
+        self._update_stop_button()
+        self._schedule_token_estimate()
+
+    def _set_session_title(self, session, message):
+        """用第一条消息设置会话标题"""
+        if session.set_title_from_message(message) and session.tab_frame is not None:
+            self.session_notebook.tab(session.tab_frame, text=session.title)
+
+    def _update_session_status(self, session, status, color=config.COLOR_STATUS_RED):
+        """更新状态栏；不是当前显示的会话时加上会话标题"""
+        if session is not self.session:
+            status = f"[{session.title}] {status}"
+        self.update_status(status, color)
+
     def show_welcome_message(self):
         """显示欢迎消息"""
         welcome = """🤖 欢迎使用 DeepSeek AI Assistant!
@@ -497,14 +709,14 @@ class ModernDeepSeekClient:
         # 递归更新所有widget的颜色
         self._update_widget_colors(self.root, theme)
         
-        # 更新所有对话对的颜色
-        for pair in self.conversation_pairs.values():
+        # 更新所有会话中对话对的颜色
+        for pair in (p for session in self.sessions for p in session.conversation_pairs.values()):
             if hasattr(pair, 'pair_frame'):
                 pair.pair_frame.config(bg=theme["COLOR_BG_PAIR"])
-                if hasattr(pair, 'checkbox'):
+                if pair.checkbox:
                     pair.checkbox.config(bg=theme["COLOR_BG_PAIR"], 
                                        activebackground=theme["COLOR_BG_PAIR"])
-                if hasattr(pair, 'text_widget'):
+                if pair.text_widget:
                     pair.text_widget.config(bg=theme["COLOR_BG_CHAT"])
                     # 重新配置text tags
                     import markdown_renderer
@@ -709,6 +921,7 @@ class ModernDeepSeekClient:
         if api_key and base_url:
             try:
                 self.api_client = api_client.DeepSeekAPIClient(api_key, base_url)
+                self.async_client = api_client.AsyncDeepSeekAPIClient(api_key, base_url)
                 self.update_status("已连接", config.COLOR_STATUS_GREEN)
                 self.send_btn.config(state=tk.NORMAL)
                 self.init_btn.config(text="✅ 已连接", bg=config.COLOR_STATUS_GREEN)
@@ -729,6 +942,7 @@ class ModernDeepSeekClient:
 
         try:
             self.api_client = api_client.DeepSeekAPIClient(api_key, base_url)
+            self.async_client = api_client.AsyncDeepSeekAPIClient(api_key, base_url)
             self.config = self._build_config_dict()
             self.config["api_key"] = api_key
             self.config["base_url"] = base_url
@@ -743,6 +957,7 @@ class ModernDeepSeekClient:
             self.update_status("连接失败")
             messagebox.showerror("错误", f"初始化失败: {str(e)}")
             self.api_client = None
+            self.async_client = None
 
     def test_connection(self):
         """测试API连接"""
@@ -750,16 +965,21 @@ class ModernDeepSeekClient:
             messagebox.showwarning("警告", "请先初始化客户端")
             return
 
-        try:
-            self.update_status("测试中...", config.COLOR_STATUS_ORANGE)
-            response = self.api_client.test_connection(self.model_var.get())
+        model = self.model_var.get()
+
+        def on_done(response):
             if response:
                 self.update_status("连接成功", config.COLOR_STATUS_GREEN)
-                messagebox.showinfo("成功", f"API连接测试成功！\n模型: {self.model_var.get()}")
-        except Exception as e:
+                messagebox.showinfo("成功", f"API连接测试成功！\n模型: {model}")
+
+        def on_error(e):
             self.update_status("测试失败")
             messagebox.showerror("错误", f"连接测试失败: {str(e)}")
 
+        # 在事件循环中测试，等待响应期间界面不卡顿
+        self.update_status("测试中...", config.COLOR_STATUS_ORANGE)
+        self.async_bridge.call(self.async_client.test_connection(model), on_done, on_error)
+
     def save_current_config(self):
         """保存当前配置"""
         if self.save_config():
@@ -768,7 +988,7 @@ class ModernDeepSeekClient:
             messagebox.showerror("错误", "保存配置失败")
 
     def send_message(self):
-        """发送消息"""
+        """发送消息：交给调度器，在并发上限内开始生成"""
         if not self.api_client:
             messagebox.showwarning("警告", "请先初始化客户端")
             return
@@ -777,71 +997,244 @@ class ModernDeepSeekClient:
         if not user_input:
             return
 
-        thread = threading.Thread(target=self._send_message_thread, args=(user_input,))
+        if self.history_load_state is not None:
+            messagebox.showwarning("警告", "正在加载历史记录，请稍候")
+            return
+
+        session = self.session
+        waiting = self.scheduler.submit(session.id,
+                                        lambda: self._start_request(session, user_input))
+        self.clear_input()
+        if waiting:
+            self._update_session_status(session, f"已排队（等待中的请求 {waiting} 个）",
+                                        config.COLOR_STATUS_ORANGE)
+
+    def _start_request(self, session, user_input):
+        """开始一个请求（由调度器在UI线程中调用）"""
+        session.stop_requested = False
+        self._update_stop_button()
+        self._display_user_message(session, user_input)
+        session.conversation_history.append({"role": "user", "content": user_input})
+        self._set_session_title(session, user_input)
+
+        # 在UI线程中读取参数，后台线程只负责构建上下文（可能需要请求摘要）
+        settings = {
+            "model": self.model_var.get(),
+            "max_tokens": self.max_tokens_var.get(),
+            "temperature": self.temperature_var.get(),
+            "stream": self.stream_var.get(),
+            "is_reasoner_model": self._is_reasoner_model(),
+            "thinking_enabled": self.thinking_enabled_var.get(),
+            "base_url": self.base_url_var.get(),
+            "context_budget": self._get_context_budget(),
+            "context_summary_enabled": self.context_summary_var.get()
+        }
+        thread = threading.Thread(target=self._send_message_thread, args=(session, settings))
         thread.daemon = True
         thread.start()
 
-    def _send_message_thread(self, user_input):
-        """实际发送消息的线程函数"""
+    def _send_message_thread(self, session, settings):
+        """构建请求参数的线程函数"""
         try:
-            self.root.after(0, self._display_user_message, user_input)
-            self.conversation_history.append({"role": "user", "content": user_input})
-
-            # 构建API消息
-            api_messages = [{"role": msg["role"], "content": msg["content"]}
-                          for msg in self.conversation_history]
+            # 构建API消息（超出上下文预算时裁剪或摘要较早的对话）
+            api_messages, estimated_tokens = self._build_api_messages(session, settings)
 
             params = self.api_client.build_params(
-                model=self.model_var.get(),
+                model=settings["model"],
                 messages=api_messages,
-                max_tokens=self.max_tokens_var.get(),
-                temperature=self.temperature_var.get(),
-                stream=self.stream_var.get(),
-                is_reasoner_model=self._is_reasoner_model(),
-                thinking_enabled=self.thinking_enabled_var.get()
+                max_tokens=settings["max_tokens"],
+                temperature=settings["temperature"],
+                stream=settings["stream"],
+                is_reasoner_model=settings["is_reasoner_model"],
+                thinking_enabled=settings["thinking_enabled"]
             )
 
             print(f"API调用参数: {params}")
 
-            if self.stream_var.get():
-                self.root.after(0, self._display_ai_stream, params)
+            if settings["stream"]:
+                self.root.after(0, self._display_ai_stream, session, params, estimated_tokens)
             else:
-                self.root.after(0, self._display_ai_response, params)
-
-            self.root.after(0, self.clear_input)
+                self.root.after(0, self._display_ai_response, session, params, estimated_tokens)
         except Exception as e:
-            self.root.after(0, self._display_error, str(e))
+            self.root.after(0, self._display_error, session, str(e))
+
+    def _get_context_budget(self):
+        """本次请求可用的上下文token数：设置的预算，且不超过模型上下文长度减去回复长度"""
+        model_limit = config.MODEL_CONTEXT_TOKENS.get(self.model_var.get(),
+                                                      min(config.MODEL_CONTEXT_TOKENS.values()))
+        return max(min(self.context_budget_var.get(), model_limit - self.max_tokens_var.get()),
+                   config.CONTEXT_BUDGET_MIN)
 
-    def _display_user_message(self, message):
+    def _summarize_messages(self, previous_summary, messages, base_url):
+        """生成滚动摘要（在发送线程中调用）"""
+        if not self.api_client:
+            return None
+        return self.api_client.summarize_conversation(
+            context_manager.format_summary_input(messages), previous_summary,
+            max_tokens=config.CONTEXT_SUMMARY_MAX_TOKENS, base_url=base_url)
+
+    def _build_api_messages(self, session, settings):
+        """按上下文预算构建发送给API的消息列表，返回 (消息列表, 估计的输入token数)
+
+        settings 为请求开始时在UI线程中读取的参数（见 _start_request）。
+        """
+        session.context_manager.summary_enabled = settings["context_summary_enabled"]
+        api_messages, info = session.context_manager.build_messages(
+            session.conversation_history,
+            lambda previous, messages: self._summarize_messages(previous, messages,
+                                                                settings["base_url"]),
+            budget_tokens=settings["context_budget"])
+        if info["window_start"]:
+            print(f"上下文已裁剪: 省略较早的 {info['window_start']} 条消息"
+                  f"{'（已摘要）' if info['summarized'] else ''}，"
+                  f"估计 {info['estimated_tokens']} tokens")
+        return api_messages, info["estimated_tokens"]
+
+    def _schedule_token_estimate(self):
+        """输入停止一段时间后更新预计token数"""
+        if self._token_estimate_job is not None:
+            self.root.after_cancel(self._token_estimate_job)
+        self._token_estimate_job = self.root.after(config.TOKEN_ESTIMATE_DELAY_MS,
+                                                   self._update_token_estimate)
+
+    def _update_token_estimate(self):
+        """显示按当前窗口发送对话历史和输入内容预计的输入token数"""
+        self._token_estimate_job = None
+        try:
+            user_input = self.input_text.get("1.0", tk.END).strip()
+            history_tokens = self.context_manager.estimate_tokens(self.conversation_history)
+            input_tokens = token_counter.count_tokens(user_input)
+            if input_tokens:
+                input_tokens += config.CONTEXT_MESSAGE_OVERHEAD_TOKENS
+            total = history_tokens + input_tokens
+            text = f"预计输入 ≈ {total} tokens（历史 {history_tokens} + 输入 {input_tokens}）"
+            if total > self._get_context_budget():
+                text += " | 超出上下文预算，将省略较早的对话"
+            self.token_estimate_label.config(text=text)
+        except Exception as e:
+            print(f"估计token数失败: {e}")
+
+    def _session_closed(self, session):
+        """会话是否已被关闭"""
+        return self.sessions.get(session.id) is not session
+
+    def _on_request_done(self, session):
+        """会话的请求结束（成功、出错或取消）：让调度器开始下一个请求"""
+        session.stream_worker = None
+        session.request_future = None
+        session.stop_requested = False
+        self.scheduler.finish(session.id)
+        self._update_stop_button()
+        if session is self.session:
+            self._schedule_token_estimate()
+
+    def _update_stop_button(self):
+        """当前会话有正在生成的回复时才能停止"""
+        running = self.scheduler.is_running(self.session.id)
+        self.stop_btn.config(state=tk.NORMAL if running else tk.DISABLED)
+
+    def stop_generation(self):
+        """停止当前会话正在生成的回复
+
+        流式响应立即取消网络读取并关闭连接，已收到的部分回答保存到对话历史
+        （标记为 truncated）；非流式请求直接取消，不保存回复。
+        """
+        session = self.session
+        if not self.scheduler.is_running(session.id) or session.stop_requested:
+            return
+        session.stop_requested = True
+        self.stop_btn.config(state=tk.DISABLED)
+
+        if session.stream_worker is not None:
+            # 消费任务收到取消后送出结束事件，由 _poll_ai_stream 保存部分回答
+            session.stream_worker.cancel()
+            self._update_session_status(session, "正在停止...", config.COLOR_STATUS_ORANGE)
+        elif session.request_future is not None:
+            # 结果已经返回（等待UI线程取出）时无法取消，按正常完成处理
+            if session.request_future.cancel():
+                self._abort_request(session)
+        else:
+            # 还在构建上下文，请求开始前会检查 stop_requested
+            self._update_session_status(session, "正在停止...", config.COLOR_STATUS_ORANGE)
+
+    def _retry_notifier(self, session):
+        """重试回调：在状态栏显示重试信息（回调在事件循环线程中调用）"""
+        def on_retry(attempt, delay, error):
+            status = f"请求失败，{delay:.1f}秒后第{attempt}次重试..."
+            self.root.after(0, self._update_session_status, session, status,
+                            config.COLOR_STATUS_ORANGE)
+        return on_retry
+
+    def _abort_request(self, session):
+        """请求在收到回答前被停止：不保存回复，并移除没有回复的用户消息
+
+        否则下一次请求中会出现连续两条用户消息（deepseek-reasoner会拒绝）。
+        """
+        pair = session.conversation_pairs.get(session.current_pair_index)
+        history = session.conversation_history
+        if pair and pair.user_msg_index is not None and \
+                pair.user_msg_index == len(history) - 1 and history[-1]["role"] == "user":
+            session.context_manager.forget_messages(history, [history[-1]])
+            history.pop()
+        if pair:
+            pair.mark_unsent()
+        self._update_session_status(session, "已停止生成", config.COLOR_STATUS_ORANGE)
+        self._on_request_done(session)
+
+    def _close_unanswered_stream(self, session, pair, stream_state):
+        """结束没有收到回答内容的流式显示（可能已显示部分思考过程），不保存回复"""
+        pair.finish_ai_stream("", stream_state["reasoning_content"], self._is_thinking_enabled(),
+                              session.chat_canvas, session.chat_content_frame, None)
+
+    def _display_user_message(self, session, message):
         """显示用户消息"""
-        self.current_pair_index = len(self.conversation_pairs)
-        user_msg_index = len(self.conversation_history)
+        session.current_pair_index = len(session.conversation_pairs)
+        user_msg_index = len(session.conversation_history)
 
         # 使用ConversationPair类创建对话对
         pair = chat.ConversationPair(
-            self.chat_content_frame,
-            self.current_pair_index,
+            session.chat_content_frame,
+            session.current_pair_index,
             user_msg_index,
             self._on_checkbox_toggle,
             self.text_font,
-            self.chat_canvas,
-            delete_callback=self._delete_conversation_pair
+            session.chat_canvas,
+            delete_callback=self._delete_conversation_pair,
+            message_provider=session.get_message
         )
 
-        pair.display_user_message(message, self.chat_canvas)
+        pair.display_user_message(message, session.chat_canvas)
+        # 等待回复期间不回收该对话对的widget
+        pair.pinned = True
 
         # 存储对话对
-        self.conversation_pairs[self.current_pair_index] = pair
-        self.conversation_pair_frames[self.current_pair_index] = pair.pair_frame
+        session.conversation_pairs[session.current_pair_index] = pair
+        session.conversation_pair_frames[session.current_pair_index] = pair.pair_frame
 
         # 更新滚动区域
-        chat.update_scroll_region(self.chat_canvas, self.chat_content_frame)
-        self.update_status("正在生成...", config.COLOR_STATUS_ORANGE)
+        chat.update_scroll_region(session.chat_canvas, session.chat_content_frame)
+        self._update_session_status(session, "正在生成...", config.COLOR_STATUS_ORANGE)
+
+    def _display_ai_response(self, session, params, estimated_tokens=None):
+        """请求非流式AI响应（在事件循环中执行，完成后回到UI线程显示）"""
+        if self._session_closed(session):
+            self._on_request_done(session)
+            return
+        if session.stop_requested:
+            self._abort_request(session)
+            return
+        pair = session.conversation_pairs.get(session.current_pair_index)
+        session.request_future = self.async_bridge.call(
+            self.async_client.create_completion(on_retry=self._retry_notifier(session), **params),
+            lambda response: self._show_ai_response(session, pair, response, estimated_tokens),
+            lambda e: self._display_error(session, str(e)))
 
-    def _display_ai_response(self, params):
+    def _show_ai_response(self, session, pair, response, estimated_tokens=None):
         """显示非流式AI响应"""
+        if self._session_closed(session):
+            self._on_request_done(session)
+            return
         try:
-            response = self.api_client.create_completion(**params)
             ai_reply = response.choices[0].message.content
 
             reasoning_content = ""
@@ -852,85 +1245,159 @@ class ModernDeepSeekClient:
             msg = {"role": "assistant", "content": ai_reply}
             if reasoning_content:
                 msg["reasoning_content"] = reasoning_content
-            self.conversation_history.append(msg)
+            if response.usage:
+                msg["_usage"] = token_counter.usage_record(response.usage, estimated_tokens)
+            session.conversation_history.append(msg)
 
             # 显示AI消息
-            if self.current_pair_index >= 0 and self.current_pair_index in self.conversation_pairs:
-                pair = self.conversation_pairs[self.current_pair_index]
+            if pair is not None:
                 pair.display_ai_message(
                     ai_reply, reasoning_content, self._is_thinking_enabled(),
-                    self.chat_canvas, len(self.conversation_history) - 1
+                    session.chat_canvas, len(session.conversation_history) - 1
                 )
-                chat.update_scroll_region(self.chat_canvas, self.chat_content_frame)
+                chat.update_scroll_region(session.chat_canvas, session.chat_content_frame)
 
-            tokens = response.usage.total_tokens if response.usage else 'N/A'
-            self.update_status(f"已完成 | Tokens: {tokens}", config.COLOR_STATUS_GREEN)
+            if response.usage:
+                self._update_session_status(
+                    session, f"已完成 | {token_counter.format_usage(msg['_usage'])}",
+                    config.COLOR_STATUS_GREEN)
+            else:
+                self._update_session_status(session, "已完成 | Tokens: N/A",
+                                            config.COLOR_STATUS_GREEN)
+            self._on_request_done(session)
         except Exception as e:
-            self._display_error(str(e))
+            self._display_error(session, str(e))
 
-    def _display_ai_stream(self, params):
-        """显示流式AI响应"""
+    def _display_ai_stream(self, session, params, estimated_tokens=None):
+        """显示流式AI响应（在事件循环中消费流，UI线程定时取增量）"""
+        if self._session_closed(session):
+            self._on_request_done(session)
+            return
+        if session.stop_requested:
+            self._abort_request(session)
+            return
         try:
-            if self.current_pair_index < 0 or self.current_pair_index not in self.conversation_pairs:
+            pair = session.conversation_pairs.get(session.current_pair_index)
+            if pair is None:
+                self._on_request_done(session)
                 return
 
-            pair = self.conversation_pairs[self.current_pair_index]
-            pair.start_ai_stream(self._is_thinking_enabled(), self.chat_canvas)
+            pair.start_ai_stream(self._is_thinking_enabled(), session.chat_canvas)
 
-            full_response = ""
-            reasoning_content = ""
-            in_thinking_phase = True
-            thinking_char_count = 0
-            answer_char_count = 0
-
-            stream = self.api_client.create_completion_stream(**params)
-
-            for chunk in stream:
-                delta = chunk.choices[0].delta
-
-                if hasattr(delta, 'reasoning_content') and delta.reasoning_content:
-                    thinking_chunk = delta.reasoning_content
-                    reasoning_content += thinking_chunk
-                    pair.insert_thinking_chunk(thinking_chunk, self.chat_canvas,
-                                             self.chat_content_frame)
-                    thinking_char_count += len(thinking_chunk)
-                    self.root.update()
-
-                if hasattr(delta, 'content') and delta.content:
-                    if in_thinking_phase and reasoning_content:
-                        pair.text_widget.insert(tk.END, "\n\n💡 最终回答:\n", "ai_tag")
-                        in_thinking_phase = False
-                        chat.update_text_height(pair.text_widget)
-                        chat.update_scroll_region(self.chat_canvas, self.chat_content_frame)
-
-                    content_chunk = delta.content
-                    full_response += content_chunk
-                    pair.insert_answer_chunk(content_chunk, self.chat_canvas,
-                                            self.chat_content_frame, answer_char_count)
-                    answer_char_count += len(content_chunk)
-                    self.root.update()
-
-            # 完成流式显示
-            pair.finish_ai_stream(
-                full_response, reasoning_content, self._is_thinking_enabled(),
-                self.chat_canvas, self.chat_content_frame,
-                len(self.conversation_history)
-            )
+            stream_state = {
+                "full_response": "",
+                "reasoning_content": "",
+                "usage": None,
+                "estimated_tokens": estimated_tokens
+            }
 
-            # 保存对话历史
-            msg = {"role": "assistant", "content": full_response}
-            if reasoning_content:
-                msg["reasoning_content"] = reasoning_content
-            self.conversation_history.append(msg)
-            pair.ai_msg_index = len(self.conversation_history) - 1
+            on_retry = self._retry_notifier(session)
+            worker = stream_engine.AsyncStreamWorker(
+                self.async_loop,
+                lambda: self.async_client.create_completion_stream(on_retry=on_retry, **params))
+            session.stream_worker = worker
+            worker.start()
+
+            self._poll_ai_stream(session, pair, worker, stream_state)
+        except Exception as e:
+            self._display_error(session, str(e))
+
+    def _poll_ai_stream(self, session, pair, worker, stream_state):
+        """定时从流式队列取出增量并显示（UI线程）"""
+        if self._session_closed(session):
+            worker.cancel()
+            self._on_request_done(session)
+            return
+        try:
+            for kind, data in worker.drain():
+                if kind == stream_engine.EVENT_THINKING:
+                    stream_state["reasoning_content"] += data
+                    pair.insert_thinking_chunk(data, session.chat_canvas,
+                                             session.chat_content_frame)
+
+                elif kind == stream_engine.EVENT_ANSWER:
+                    stream_state["full_response"] += data
+                    pair.insert_answer_chunk(data, session.chat_canvas,
+                                             session.chat_content_frame)
+
+                elif kind == stream_engine.EVENT_USAGE:
+                    stream_state["usage"] = data
+
+                elif kind == stream_engine.EVENT_ERROR:
+                    # 重试用完后仍然失败：已收到的部分回答照样保存
+                    if stream_state["full_response"]:
+                        self._finish_ai_stream(session, pair, stream_state, truncated=True)
+                        self._update_session_status(session, "连接中断，已保存部分回答")
+                        messagebox.showerror("错误", f"API请求失败（已保存部分回答）:\n{data}")
+                    else:
+                        self._close_unanswered_stream(session, pair, stream_state)
+                        self._display_error(session, data)
+                    return
+
+                elif kind == stream_engine.EVENT_DONE:
+                    self._finish_ai_stream(session, pair, stream_state)
+                    return
 
-            self.update_status("流式响应完成", config.COLOR_STATUS_GREEN)
+                elif kind == stream_engine.EVENT_CANCELLED:
+                    # 用户停止生成：保存已收到的部分回答；还没有回答内容时不保存空回复
+                    if stream_state["full_response"]:
+                        self._finish_ai_stream(session, pair, stream_state, truncated=True)
+                    else:
+                        self._close_unanswered_stream(session, pair, stream_state)
+                        self._abort_request(session)
+                    return
         except Exception as e:
-            self._display_error(str(e))
+            worker.cancel()
+            self._display_error(session, str(e))
+            return
 
-    def _display_error(self, error_msg):
+        self.root.after(config.STREAM_POLL_INTERVAL_MS,
+                        self._poll_ai_stream, session, pair, worker, stream_state)
+
+    def _finish_ai_stream(self, session, pair, stream_state, truncated=False):
+        """完成流式显示并保存对话历史（truncated: 被用户停止，保存的是部分回答）"""
+        full_response = stream_state["full_response"]
+        reasoning_content = stream_state["reasoning_content"]
+
+        pair.finish_ai_stream(
+            full_response, reasoning_content, self._is_thinking_enabled(),
+            session.chat_canvas, session.chat_content_frame,
+            len(session.conversation_history), truncated
+        )
+
+        # 保存对话历史
+        msg = {"role": "assistant", "content": full_response}
+        if reasoning_content:
+            msg["reasoning_content"] = reasoning_content
+        if truncated:
+            msg["truncated"] = True
+        if stream_state["usage"] is not None:
+            msg["_usage"] = token_counter.usage_record(stream_state["usage"],
+                                                       stream_state["estimated_tokens"])
+        session.conversation_history.append(msg)
+        pair.ai_msg_index = len(session.conversation_history) - 1
+
+        if truncated:
+            self._update_session_status(session, "已停止生成，已保存部分回答",
+                                        config.COLOR_STATUS_ORANGE)
+        elif "_usage" in msg:
+            self._update_session_status(
+                session, f"流式响应完成 | {token_counter.format_usage(msg['_usage'])}",
+                config.COLOR_STATUS_GREEN)
+        else:
+            self._update_session_status(session, "流式响应完成", config.COLOR_STATUS_GREEN)
+        self._on_request_done(session)
+
+    def _display_error(self, session, error_msg):
         """显示错误信息"""
-        error_frame = tk.Frame(self.chat_content_frame, bg=config.COLOR_BG_ERROR,
+        if self._session_closed(session):
+            self._on_request_done(session)
+            return
+        pair = session.conversation_pairs.get(session.current_pair_index)
+        if pair:
+            pair.pinned = False
+
+        error_frame = tk.Frame(session.chat_content_frame, bg=config.COLOR_BG_ERROR,
                              relief=tk.SOLID, borderwidth=1)
         error_frame.pack(fill=tk.X, padx=10, pady=5)
 
@@ -939,8 +1406,9 @@ class ModernDeepSeekClient:
                        fg=config.COLOR_TEXT_ERROR, justify=tk.LEFT,
                        padx=10, pady=10).pack(fill=tk.X)
 
-        chat.update_scroll_region(self.chat_canvas, self.chat_content_frame)
-        self.update_status("错误")
+        chat.update_scroll_region(session.chat_canvas, session.chat_content_frame)
+        self._update_session_status(session, "错误")
+        self._on_request_done(session)
         messagebox.showerror("错误", f"API请求失败:\n{error_msg}")
 
     def _on_checkbox_toggle(self, pair_index, checkbox_var):
@@ -956,9 +1424,13 @@ class ModernDeepSeekClient:
         """删除指定的对话对"""
         if pair_index not in self.conversation_pairs:
             return
-        
-        # 确认删除
-        if not messagebox.askyesno("确认删除", "确定要删除这个对话对吗？"):
+
+        # 加载过程中消息索引还在变化
+        if self.history_load_state is not None:
+            messagebox.showwarning("警告", "正在加载历史记录，请稍候")
+            return
+        if self.scheduler.is_busy(self.session.id):
+            messagebox.showwarning("警告", "当前会话正在生成回复，请稍候")
             return
         
         # 获取要删除的对话对
@@ -973,6 +1445,17 @@ class ModernDeepSeekClient:
         if ai_msg_index is not None and ai_msg_index < len(self.conversation_history):
             indices_to_delete.append(ai_msg_index)
         indices_to_delete = sorted(set(indices_to_delete), reverse=True)  # 从大到小排序
+        removed_messages = [self.conversation_history[idx] for idx in indices_to_delete]
+
+        # 确认删除（删除上一次请求中间的消息会使服务器端的前缀缓存失效）
+        prompt = "确定要删除这个对话对吗？"
+        invalidated = self.context_manager.prefix_invalidation(removed_messages)
+        if invalidated:
+            prompt += (f"\n\n注意：删除后，下一次请求中约 {invalidated} tokens "
+                       f"将无法命中服务器端的前缀缓存，需要重新计算。")
+        if not messagebox.askyesno("确认删除", prompt):
+            return
+        self.context_manager.forget_messages(self.conversation_history, removed_messages)
         
         # 从对话历史中删除消息（从后往前删除，避免索引变化问题）
         for idx in indices_to_delete:
@@ -1024,13 +1507,14 @@ class ModernDeepSeekClient:
                 pair_obj.pair_index = new_idx
                 
                 # 更新复选框回调中的索引
-                pair_obj.checkbox.config(
-                    command=lambda idx=new_idx, var=pair_obj.checkbox_var: 
-                        self._on_checkbox_toggle(idx, var)
-                )
+                if pair_obj.checkbox:
+                    pair_obj.checkbox.config(
+                        command=lambda idx=new_idx, var=pair_obj.checkbox_var: 
+                            self._on_checkbox_toggle(idx, var)
+                    )
                 
                 # 更新删除按钮回调中的索引
-                if hasattr(pair_obj, 'delete_button') and pair_obj.delete_callback:
+                if pair_obj.delete_button and pair_obj.delete_callback:
                     pair_obj.delete_button.config(
                         command=lambda idx=new_idx: self._delete_conversation_pair(idx)
                     )
@@ -1064,14 +1548,22 @@ class ModernDeepSeekClient:
         # 更新状态
         self.update_status("已连接" if self.api_client else "未连接",
                          config.COLOR_STATUS_GREEN if self.api_client else config.COLOR_STATUS_RED)
+        self._schedule_token_estimate()
 
     def clear_chat(self):
         """清空对话"""
+        if self.history_load_state is not None:
+            messagebox.showwarning("警告", "正在加载历史记录，请稍候")
+            return
+        if self.scheduler.is_busy(self.session.id):
+            messagebox.showwarning("警告", "当前会话正在生成回复，请稍候")
+            return
         if messagebox.askyesno("确认", "确定要清空对话历史吗？"):
             for frame in self.conversation_pair_frames.values():
                 frame.destroy()
             self.conversation_pair_frames.clear()
             self.conversation_history.clear()
+            self.context_manager.reset()
             self.conversation_pairs.clear()
             self.current_pair_index = -1
 
@@ -1081,6 +1573,7 @@ class ModernDeepSeekClient:
             self.show_welcome_message()
             self.update_status("已连接" if self.api_client else "未连接",
                              config.COLOR_STATUS_GREEN if self.api_client else config.COLOR_STATUS_RED)
+            self._schedule_token_estimate()
             
             # 更新canvas滚动区域并滚动到顶部
             import chat_display as chat
@@ -1091,89 +1584,183 @@ class ModernDeepSeekClient:
     def clear_input(self):
         """清空输入框"""
         self.input_text.delete("1.0", tk.END)
+        self._schedule_token_estimate()
 
     def refresh_history(self):
-        """刷新历史记录列表"""
-        for btn in self.history_buttons:
-            btn.destroy()
-        self.history_buttons.clear()
+        """刷新历史记录列表（只重新绑定可见的行）"""
+        self.history_files = self.history_manager.get_history_files()
+        self._show_history_items()
+        self.history_manager.save_title_index()
+
+    def _show_history_items(self):
+        """在历史记录列表中显示文件列表或搜索结果"""
+        if self.history_search_results is None:
+            self.history_list.set_items(self.history_files)
+        else:
+            self.history_list.set_items(self.history_search_results)
+
+    def _schedule_history_search(self):
+        """输入变化后延迟搜索，连续输入时只搜索一次"""
+        if self._history_search_after_id is not None:
+            self.root.after_cancel(self._history_search_after_id)
+        self._history_search_after_id = self.root.after(config.SEARCH_DEBOUNCE_MS,
+                                                        self._run_history_search)
+
+    def _run_history_search(self):
+        """执行搜索并显示命中的消息"""
+        self._history_search_after_id = None
+        query = self.history_search_var.get().strip()
+        if query:
+            self.history_search_results = self.history_manager.search(query)
+        else:
+            self.history_search_results = None
+        self.history_list.canvas.yview_moveto(0.0)
+        self._show_history_items()
+
+    def _sync_search_index(self, filepaths=None):
+        """在后台线程中更新搜索索引，完成后刷新当前的搜索结果"""
+        def worker():
+            updated = self.history_manager.sync_search_index(filepaths)
+            if updated and self.history_search_results is not None:
+                self.root.after(0, self._run_history_search)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _start_history_watcher(self):
+        """启动历史记录目录监视，目录变化时增量更新侧边栏"""
+        self.history_watcher = history_watcher.HistoryWatcher(
+            self.history_manager.chat_history_dir)
+        self.history_watcher.start()
+        self.root.after(config.HISTORY_WATCH_POLL_MS, self._poll_history_watcher)
+        # 启动时在后台补建变化过的文件的搜索索引
+        self._sync_search_index()
+
+    def _poll_history_watcher(self):
+        """定时取出目录变化事件并更新侧边栏"""
+        try:
+            events = self.history_watcher.drain()
+            if events:
+                self._apply_history_events(events)
+        except Exception as e:
+            print(f"更新历史记录列表失败: {e}")
+        self.root.after(config.HISTORY_WATCH_POLL_MS, self._poll_history_watcher)
 
-        history_files = self.history_manager.get_history_files()
-        # 在循环外部获取一次主题，确保所有按钮使用相同的主题
-        theme = config.get_theme()
+    def _apply_history_events(self, events):
+        """按文件增量更新历史记录列表，只对变化的文件读取属性"""
+        # 监视器丢失了事件时做一次完整刷新
+        if any(filepath is None for _, filepath in events):
+            self.refresh_history()
+            return
 
-        for mtime, filepath, filename in history_files:
-            try:
-                title = self.history_manager.extract_title_from_file(filepath)
-                if not title:
-                    continue
-
-                btn_frame = tk.Frame(self.history_content, bg=config.COLOR_BG_CONFIG,
-                                     relief=tk.FLAT)
-                btn_frame.pack(fill=tk.X, padx=5, pady=3)
-
-                # 左侧：历史记录按钮
-                left_frame = tk.Frame(btn_frame, bg=config.COLOR_BG_CONFIG)
-                left_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-                btn = ui.create_button(left_frame, title[:40] + ('...' if len(title) > 40 else ''),
-                                       command=lambda fp=filepath: self.load_history_from_file(fp),
-                                       bg=config.COLOR_BG_SIDEBAR, anchor=tk.W,
-                                       padx=10, pady=8, cursor="hand2")
-                btn.pack(fill=tk.X)
-
-                def on_enter(e, b=btn):
-                    b.config(bg=config.COLOR_BUTTON_HOVER)
-
-                def on_leave(e, b=btn):
-                    b.config(bg=config.COLOR_BG_SIDEBAR)
-
-                btn.bind("<Enter>", on_enter)
-                btn.bind("<Leave>", on_leave)
-
-                # 右侧：删除按钮
-                delete_btn = tk.Button(
-                    btn_frame,
-                    text="🗑️",
-                    font=("Segoe UI", 10),
-                    bg=theme["COLOR_BG_CONFIG"],
-                    fg=theme["COLOR_TEXT_MEDIUM_GRAY"],
-                    activebackground=theme["COLOR_BUTTON_RED"],
-                    activeforeground="white",
-                    relief=tk.FLAT,
-                    cursor="hand2",
-                    command=lambda fp=filepath, fn=filename: self.delete_history_file(fp, fn),
-                    width=3,
-                    padx=5,
-                    anchor="nw"
-                )
-                delete_btn.pack(side=tk.RIGHT, padx=(5, 0))
+        files = {item[1]: item for item in self.history_files}
+        for kind, filepath in events:
+            if kind == history_watcher.EVENT_REMOVED:
+                files.pop(filepath, None)
+                self.history_manager.forget_history_file(filepath)
+            else:
+                item = self.history_manager.stat_history_file(filepath)
+                if item:
+                    files[filepath] = item
+                else:
+                    files.pop(filepath, None)
 
-                # 删除按钮悬停效果 - 使用闭包捕获当前按钮实例
-                # 关键修复：为每个按钮创建独立的事件处理函数
-                def create_delete_handlers(btn_instance, theme_color):
-                    """为删除按钮创建独立的事件处理器"""
+        self.history_files = sorted(files.values(), reverse=True)
+        self._show_history_items()
+        self.history_manager.save_title_index()
+        self._sync_search_index([filepath for _, filepath in events])
 
-                    def on_delete_enter(e):
-                        btn_instance.config(fg=theme_color["COLOR_BUTTON_RED"])
+    def _create_history_row(self, parent):
+        """创建历史记录列表的一行（行widget会被重复使用）"""
+        theme = config.get_theme()
 
-                    def on_delete_leave(e):
-                        btn_instance.config(fg=theme_color["COLOR_TEXT_MEDIUM_GRAY"])
+        row = tk.Frame(parent, bg=config.COLOR_BG_SIDEBAR)
+        btn_frame = tk.Frame(row, bg=config.COLOR_BG_CONFIG, relief=tk.FLAT)
+        btn_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=3)
 
-                    return on_delete_enter, on_delete_leave
+        # 左侧：历史记录按钮
+        left_frame = tk.Frame(btn_frame, bg=config.COLOR_BG_CONFIG)
+        left_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-                # 为当前删除按钮创建独立的事件处理器
-                on_delete_enter, on_delete_leave = create_delete_handlers(delete_btn, theme)
-                delete_btn.bind("<Enter>", on_delete_enter)
-                delete_btn.bind("<Leave>", on_delete_leave)
+        btn = ui.create_button(left_frame, "",
+                               command=lambda: self._on_history_row_action(row, False),
+                               bg=config.COLOR_BG_SIDEBAR, anchor=tk.W,
+                               padx=10, pady=8, cursor="hand2")
+        btn.pack(fill=tk.BOTH, expand=True)
 
-                self.history_buttons.append(btn_frame)
-            except Exception as e:
-                print(f"加载历史记录 {filename} 失败: {e}")
-                continue
+        btn.bind("<Enter>", lambda e: btn.config(bg=config.COLOR_BUTTON_HOVER))
+        btn.bind("<Leave>", lambda e: btn.config(bg=config.COLOR_BG_SIDEBAR))
 
-        self.history_content.update_idletasks()
-        self.history_canvas.configure(scrollregion=self.history_canvas.bbox("all"))
+        # 右侧：删除按钮
+        delete_btn = tk.Button(
+            btn_frame,
+            text="🗑️",
+            font=("Segoe UI", 10),
+            bg=theme["COLOR_BG_CONFIG"],
+            fg=theme["COLOR_TEXT_MEDIUM_GRAY"],
+            activebackground=theme["COLOR_BUTTON_RED"],
+            activeforeground="white",
+            relief=tk.FLAT,
+            cursor="hand2",
+            command=lambda: self._on_history_row_action(row, True),
+            width=3,
+            padx=5,
+            anchor="nw"
+        )
+        delete_btn.pack(side=tk.RIGHT, padx=(5, 0))
+
+        # 悬停时读取当前主题颜色
+        delete_btn.bind("<Enter>", lambda e: delete_btn.config(
+            fg=config.get_theme()["COLOR_BUTTON_RED"]))
+        delete_btn.bind("<Leave>", lambda e: delete_btn.config(
+            fg=config.get_theme()["COLOR_TEXT_MEDIUM_GRAY"]))
+
+        self._history_row_buttons[row] = btn
+        return row
+
+    def _bind_history_row(self, row, item):
+        """把历史记录或搜索结果绑定到一行（标题有缓存时不读取文件）"""
+        if isinstance(item, dict):
+            # 搜索结果：对话标题 + 命中摘要
+            text = f"{(item['title'] or os.path.basename(item['path']))[:10]} · {item['snippet']}"
+            self._history_row_buttons[row].config(
+                text=text[:40] + ('...' if len(text) > 40 else ''))
+            return
+
+        mtime, filepath, filename = item
+        try:
+            title = self.history_manager.get_title(filepath)
+        except Exception as e:
+            print(f"加载历史记录 {filename} 失败: {e}")
+            title = None
+        if not title:
+            title = filename
+        self._history_row_buttons[row].config(
+            text=title[:40] + ('...' if len(title) > 40 else ''))
+
+        # 滚动时新读取的标题延迟保存
+        if self.history_manager.title_index.dirty and not self._title_save_pending:
+            self._title_save_pending = True
+            self.root.after(config.HISTORY_TITLE_SAVE_DELAY_MS, self._save_title_index)
+
+    def _save_title_index(self):
+        """保存标题缓存"""
+        self._title_save_pending = False
+        self.history_manager.save_title_index()
+
+    def _on_history_row_action(self, row, delete):
+        """历史记录行的按钮回调：加载或删除该行当前绑定的文件"""
+        item = self.history_list.get_item(row)
+        if item is None:
+            return
+        if isinstance(item, dict):
+            filepath = item["path"]
+            filename = os.path.basename(filepath)
+        else:
+            mtime, filepath, filename = item
+        if delete:
+            self.delete_history_file(filepath, filename)
+        else:
+            self.load_history_from_file(filepath)
 
     def delete_history_file(self, filepath, filename):
         """删除历史对话文件"""
@@ -1182,112 +1769,190 @@ class ModernDeepSeekClient:
         
         try:
             if os.path.exists(filepath):
-                os.remove(filepath)
+                self.history_manager.delete_history_file(filepath)
                 messagebox.showinfo("成功", "历史对话文件已删除")
                 # 刷新历史记录列表
                 self.refresh_history()
+                if self.history_search_results is not None:
+                    self._run_history_search()
             else:
                 messagebox.showwarning("警告", "文件不存在")
         except Exception as e:
             messagebox.showerror("错误", f"删除文件失败: {str(e)}")
     
     def load_history_from_file(self, filepath):
-        """从文件加载对话历史"""
+        """从文件加载对话历史
+
+        文件在后台线程中读取、解析并生成Markdown片段，UI线程按时间片
+        分批创建对话对，显示进度并可随时取消。
+        """
+        if self.history_load_state is not None:
+            messagebox.showwarning("警告", "正在加载其他历史记录，请稍候")
+            return
+        if self.scheduler.is_busy(self.session.id):
+            messagebox.showwarning("警告", "当前会话正在生成回复，请新建会话后再加载")
+            return
+
+        # 询问用户是追加还是替换（替换在收到第一条消息后才执行，文件为空时不影响当前对话）
+        replace = False
+        if self.conversation_history:
+            choice = messagebox.askyesnocancel(
+                "加载选项",
+                "当前已有对话历史。\n\n点击'是'：追加到现有对话\n点击'否'：替换现有对话\n点击'取消'：取消加载"
+            )
+            if choice is None:
+                return
+            replace = not choice
+
+        # 加载进度：提示文字、进度条和取消按钮
+        progress_frame = tk.Frame(self.chat_content_frame, bg=config.COLOR_BG_CHAT)
+        progress_frame.pack(fill=tk.X, padx=10, pady=5)
+        load_label = ui.create_label(progress_frame, text="📥 正在加载对话记录...",
+                                     font=self.text_font, bg=config.COLOR_BG_CHAT,
+                                     fg=config.COLOR_STATUS_BLUE, padx=10, pady=5)
+        load_label.pack(side=tk.LEFT)
+        cancel_btn = ui.create_button(progress_frame, "取消", self._cancel_history_load,
+                                      bg=config.COLOR_BUTTON_RED, padx=10, pady=2)
+        cancel_btn.pack(side=tk.RIGHT, padx=5)
+        progressbar = ttk.Progressbar(progress_frame, mode='determinate', maximum=100)
+        progressbar.pack(side=tk.RIGHT, fill=tk.X, expand=True, padx=10)
+
+        worker = history_loader.HistoryLoadWorker(self.history_manager, filepath)
+        self.history_load_state = {
+            "worker": worker,
+            "replace": replace,
+            "pending_user_index": None,  # 等待下一条消息以确定是否有AI回复的用户消息
+            "count": 0,
+            "frame": progress_frame,
+            "label": load_label,
+            "progressbar": progressbar,
+            "cancel_btn": cancel_btn,
+        }
+        self.update_status("正在加载历史记录...", config.COLOR_STATUS_ORANGE)
+        worker.start()
+        self.root.after(config.HISTORY_LOAD_POLL_MS, self._poll_history_load)
+
+    def _cancel_history_load(self):
+        """取消正在进行的历史记录加载（已显示的对话对保留）"""
+        state = self.history_load_state
+        if state is not None:
+            state["worker"].cancel()
+            state["cancel_btn"].config(state=tk.DISABLED)
+
+    def _poll_history_load(self):
+        """取出已解析的消息并显示，超过时间片后交还UI线程，稍后继续"""
+        state = self.history_load_state
+        worker = state["worker"]
+        deadline = time.perf_counter() + config.HISTORY_LOAD_SLICE_MS / 1000
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
+            while time.perf_counter() < deadline:
+                event = worker.next_event()
+                if event is None:
+                    break
+                kind, data = event
+                if kind == history_loader.EVENT_MESSAGE:
+                    if state["replace"]:
+                        state["replace"] = False
+                        self._clear_chat_for_load(state["frame"])
+                    self._add_loaded_message(state, data)
+                else:
+                    self._finish_history_load(kind, data)
+                    return
+        except Exception as e:
+            worker.cancel()
+            self._finish_history_load(history_loader.EVENT_ERROR, str(e))
+            return
 
-            imported_history = self.history_manager.parse_chat_history(content)
+        state["progressbar"]["value"] = worker.progress * 100
+        state["label"].config(text=f"📥 正在加载对话记录... {state['count']} 条")
+        chat.update_scroll_region(self.chat_canvas, self.chat_content_frame)
+        self.root.after(config.HISTORY_LOAD_POLL_MS, self._poll_history_load)
 
-            if not imported_history:
-                messagebox.showwarning("警告", "未能从文件中解析出对话内容")
+    def _clear_chat_for_load(self, keep_widget):
+        """替换模式：清空当前对话（保留加载进度）"""
+        self.conversation_history = []
+        self.context_manager.reset()
+        for frame in self.conversation_pair_frames.values():
+            frame.destroy()
+        self.conversation_pair_frames.clear()
+        self.conversation_pairs.clear()
+        self.current_pair_index = -1
+        for widget in self.chat_content_frame.winfo_children():
+            if widget is not keep_widget:
+                widget.destroy()
+
+    def _add_loaded_message(self, state, msg):
+        """把加载的消息加入对话历史，用户消息和紧随其后的AI回复组成对话对"""
+        self.conversation_history.append(msg)
+        msg_index = len(self.conversation_history) - 1
+        state["count"] += 1
+
+        user_index = state["pending_user_index"]
+        if user_index is not None:
+            state["pending_user_index"] = None
+            if msg["role"] == "assistant":
+                self._create_loaded_pair(user_index, msg_index)
                 return
+            self._create_loaded_pair(user_index, None)
 
-            # 询问用户是追加还是替换
-            if self.conversation_history:
-                choice = messagebox.askyesnocancel(
-                    "加载选项",
-                    "当前已有对话历史。\n\n点击'是'：追加到现有对话\n点击'否'：替换现有对话\n点击'取消'：取消加载"
-                )
-                if choice is None:
-                    return
-                elif choice:
-                    self.conversation_history.extend(imported_history)
-                else:
-                    self.conversation_history = imported_history
-                    for frame in self.conversation_pair_frames.values():
-                        frame.destroy()
-                    self.conversation_pair_frames.clear()
-                    self.conversation_pairs.clear()
-                    self.current_pair_index = -1
-                    for widget in self.chat_content_frame.winfo_children():
-                        widget.destroy()
-            else:
-                self.conversation_history = imported_history
-
-            # 显示导入提示
-            ui.create_label(self.chat_content_frame,
-                          text=f"📥 已加载 {len(imported_history)} 条对话记录",
-                          font=self.text_font, bg=config.COLOR_BG_CHAT,
-                          fg=config.COLOR_STATUS_BLUE, padx=10, pady=5).pack(
-                          fill=tk.X, padx=10, pady=5)
-
-            # 显示导入的对话内容
-            current_pair_idx = len(self.conversation_pairs)
-            base_msg_index = len(self.conversation_history) - len(imported_history)
-
-            i = 0
-            while i < len(imported_history):
-                msg = imported_history[i]
-
-                if msg["role"] == "user":
-                    user_msg_index = base_msg_index + i
-
-                    pair = chat.ConversationPair(
-                        self.chat_content_frame,
-                        current_pair_idx,
-                        user_msg_index,
-                        self._on_checkbox_toggle,
-                        self.text_font,
-                        self.chat_canvas,
-                        delete_callback=self._delete_conversation_pair
-                    )
+        if msg["role"] == "user":
+            state["pending_user_index"] = msg_index
 
-                    pair.display_user_message(msg["content"], self.chat_canvas)
-
-                    ai_msg_index = None
-                    if i + 1 < len(imported_history) and imported_history[i + 1]["role"] == "assistant":
-                        i += 1
-                        ai_msg = imported_history[i]
-                        ai_msg_index = base_msg_index + i
-
-                        pair.text_widget.configure(state=tk.NORMAL)
-                        timestamp = datetime.now().strftime("%H:%M:%S")
-                        pair.text_widget.insert(tk.END, f"\n🤖 DeepSeek AI ({timestamp})\n", "ai_tag")
-                        if ai_msg.get("reasoning_content"):
-                            pair.text_widget.insert(tk.END, "🧠 思考过程:\n", "thinking_tag")
-                            md.render_markdown(pair.text_widget, ai_msg["reasoning_content"],
-                                             "thinking_content")
-                            pair.text_widget.insert(tk.END, "\n\n💡 最终回答:\n", "ai_tag")
-                        md.render_markdown(pair.text_widget, ai_msg["content"], "ai_message")
-                        pair.text_widget.insert(tk.END, f"\n{'─' * config.SEPARATOR_LENGTH}\n",
-                                              "separator")
-                        chat.update_text_height(pair.text_widget)
-                        # 确保滚动到底部
-                        pair.text_widget.see(tk.END)
-                        pair.text_widget.configure(state=tk.DISABLED)
-
-                    self.conversation_pairs[current_pair_idx] = pair
-                    self.conversation_pair_frames[current_pair_idx] = pair.pair_frame
-                    pair.ai_msg_index = ai_msg_index
-                    current_pair_idx += 1
-
-                i += 1
+    def _create_loaded_pair(self, user_msg_index, ai_msg_index):
+        """为加载的消息创建对话对"""
+        # 虚拟化模式下只创建占位Frame，进入视口时再渲染
+        lazy = self.pair_view is not None
+        pair_idx = len(self.conversation_pairs)
+        pair = chat.ConversationPair(
+            self.chat_content_frame,
+            pair_idx,
+            user_msg_index,
+            self._on_checkbox_toggle,
+            self.text_font,
+            self.chat_canvas,
+            delete_callback=self._delete_conversation_pair,
+            message_provider=self.session.get_message,
+            ai_msg_index=ai_msg_index,
+            lazy=lazy
+        )
+        pair.ai_label = "DeepSeek AI"
+        pair.ai_timestamp = pair.user_timestamp
+        if not lazy:
+            pair.render_messages()
+
+        self.conversation_pairs[pair_idx] = pair
+        self.conversation_pair_frames[pair_idx] = pair.pair_frame
+
+    def _finish_history_load(self, kind, error=None):
+        """加载结束：显示最后一个对话对并提示结果"""
+        state = self.history_load_state
+        self.history_load_state = None
+
+        if state["pending_user_index"] is not None:
+            self._create_loaded_pair(state["pending_user_index"], None)
+
+        count = state["count"]
+        state["progressbar"].destroy()
+        state["cancel_btn"].destroy()
+        if kind == history_loader.EVENT_CANCELLED:
+            state["label"].config(text=f"📥 已取消加载，已加载 {count} 条对话记录")
+        elif count:
+            state["label"].config(text=f"📥 已加载 {count} 条对话记录")
+        else:
+            state["frame"].destroy()
 
-            chat.update_scroll_region(self.chat_canvas, self.chat_content_frame)
-            messagebox.showinfo("成功", f"成功加载 {len(imported_history)} 条对话记录！")
-        except Exception as e:
-            messagebox.showerror("错误", f"加载失败: {str(e)}")
+        chat.update_scroll_region(self.chat_canvas, self.chat_content_frame)
+        self.update_status("已连接" if self.api_client else "未连接",
+                           config.COLOR_STATUS_GREEN if self.api_client else config.COLOR_STATUS_RED)
+        self._schedule_token_estimate()
+
+        if kind == history_loader.EVENT_ERROR:
+            messagebox.showerror("错误", f"加载失败: {error}")
+        elif kind == history_loader.EVENT_DONE:
+            if count:
+                messagebox.showinfo("成功", f"成功加载 {count} 条对话记录！")
+            else:
+                messagebox.showwarning("警告", "未能从文件中解析出对话内容")
 
     def export_chat(self):
         """导出对话"""
@@ -1295,14 +1960,12 @@ class ModernDeepSeekClient:
             messagebox.showwarning("警告", "没有对话内容可导出")
             return
 
-        def generate_title_callback(message_indices):
-            return self._generate_chat_title(message_indices)
-
+        # 文件先以临时标题写入，AI标题在后台生成后再更新
         file_path, error = self.history_manager.export_chat(
             self.conversation_history,
             {idx: pair.get_pair_info() for idx, pair in self.conversation_pairs.items()},
             self.model_var.get(),
-            generate_title_callback
+            self._generate_export_title if self.async_client else None
         )
 
         if error:
@@ -1328,48 +1991,45 @@ class ModernDeepSeekClient:
             self.root.after(50, self._update_all_pair_heights)
     
     def _update_all_pair_heights(self):
-        """更新所有对话对的高度"""
+        """更新所有对话对的高度
+
+        只更新已创建widget的对话对；占位对话对保留缓存高度，
+        进入视口重新创建时会得到准确高度。
+        """
         for pair in self.conversation_pairs.values():
-            if pair and hasattr(pair, 'text_widget'):
+            if pair and pair.text_widget:
                 chat.update_text_height(pair.text_widget)
         # 更新滚动区域
         if hasattr(self, 'chat_canvas') and hasattr(self, 'chat_content_frame'):
             chat.update_scroll_region(self.chat_canvas, self.chat_content_frame)
+        if self.pair_view:
+            self.pair_view.schedule_refresh()
 
-    def _generate_chat_title(self, message_indices=None):
-        """使用AI生成对话标题"""
-        if not self.api_client:
-            return None
-
-        if not self.conversation_history:
-            return None
-
-        try:
-            summary_messages = [{
+    def _generate_export_title(self, file_path, title_content):
+        """在事件循环中为导出的文件生成标题，完成后更新文件中的临时标题"""
+        summary_messages = [
+            {
                 "role": "system",
                 "content": f"请根据以下对话内容，生成一个简洁的标题（不超过{config.TITLE_MAX_LENGTH}个字）。标题应该概括对话的主要主题或内容。只返回标题，不要其他内容，不要加引号。"
-            }]
-
-            content = self.history_manager.generate_title_content(
-                self.conversation_history, message_indices
-            )
-            if not content:
-                return None
-
-            summary_messages.append({"role": "user", "content": content})
-
-            use_chat_model = self._is_reasoner_model()
-            response = self.api_client.generate_title(
-                summary_messages, self.model_var.get(), use_chat_model
-            )
+            },
+            {"role": "user", "content": title_content}
+        ]
 
+        def on_done(response):
             title = self.history_manager.parse_title_from_response(response)
-            if title:
-                print(f"成功生成标题: {title}")
-            return title
-        except Exception as e:
+            if not title:
+                return
+            print(f"成功生成标题: {title}")
+            if self.history_manager.apply_generated_title(file_path, title_content, title):
+                self.refresh_history()
+
+        def on_error(e):
             print(f"生成标题失败: {e}")
-            return None
+
+        self.async_bridge.call(
+            self.async_client.generate_title(summary_messages, self.model_var.get(),
+                                             self._is_reasoner_model()),
+            on_done, on_error)
 
 
 def set_dpi_aware():
@@ -1,6 +1,8 @@
 """Markdown渲染模块"""
 
 import html.parser
+import threading
+from collections import OrderedDict
 import markdown
 import tkinter as tk
 import config
@@ -24,6 +26,8 @@ def configure_text_tags(text_widget):
                           font=config.FONT_CODE)
     text_widget.tag_config("separator", foreground=theme["COLOR_TEXT_GRAY"], 
                           font=("Segoe UI", 9))
+    text_widget.tag_config("truncated_tag", foreground=theme["COLOR_STATUS_ORANGE"], 
+                          font=("Segoe UI", 9, "italic"))
     text_widget.tag_config("md_h1", foreground=theme["COLOR_TEXT_DARK"], 
                           font=config.FONT_H1)
     text_widget.tag_config("md_h2", foreground=theme["COLOR_TEXT_DARKER"], 
@@ -41,26 +45,132 @@ def configure_text_tags(text_widget):
                           lmargin1=20, lmargin2=20)
 
 
-def render_markdown(text_widget, text, base_tag=""):
-    """渲染Markdown格式文本到Text widget"""
-    # 将Markdown转换为HTML
-    md = markdown.Markdown(extensions=['extra', 'codehilite', 'nl2br'])
-    html_content = md.convert(text)
+class MarkdownRenderer:
+    """Markdown渲染器：复用Markdown实例，并缓存解析得到的文本片段
+    
+    解析结果是 [(文本, 标签), ...] 片段列表，以 (文本, 基础标签) 为键
+    保存在LRU缓存中，重新加载、删除或切换主题后的重新渲染直接回放片段，
+    不再重新解析。
+    
+    get_segments 可以在后台线程中调用：每个线程使用自己的Markdown实例，
+    缓存的读写由锁保护。
+    """
+    
+    def __init__(self, cache_size=config.MARKDOWN_CACHE_SIZE):
+        """初始化渲染器"""
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+    
+    def _get_markdown(self):
+        """获取（首次使用时创建）当前线程可复用的Markdown实例"""
+        md = getattr(self._local, "md", None)
+        if md is None:
+            md = markdown.Markdown(extensions=['extra', 'codehilite', 'nl2br'])
+            self._local.md = md
+        return md
+    
+    def to_html(self, text):
+        """将Markdown转换为HTML"""
+        md = self._get_markdown()
+        try:
+            return md.convert(text)
+        finally:
+            # 清除上一次转换的状态（脚注、引用链接等），以便复用实例
+            md.reset()
+    
+    def get_segments(self, text, base_tag=""):
+        """获取Markdown文本对应的片段列表（优先使用缓存）"""
+        key = (text, base_tag)
+        with self._lock:
+            segments = self._cache.get(key)
+            if segments is not None:
+                self._cache.move_to_end(key)
+                return segments
+        
+        parser = HTMLToTextWidgetParser(base_tag)
+        parser.feed(self.to_html(text))
+        parser.close()
+        segments = parser.segments
+        
+        with self._lock:
+            self._cache[key] = segments
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return segments
+    
+    def render(self, text_widget, text, base_tag="", index=tk.END):
+        """渲染Markdown格式文本到Text widget的 index 位置
+        
+        所有片段通过一次 insert(index, text1, tags1, text2, tags2, ...) 写入，
+        只产生一次Tcl调用。
+        """
+        insert_segments(text_widget, self.get_segments(text, base_tag), index)
     
-    # 解析HTML并应用到Text widget
-    parser = HTMLToTextWidgetParser(text_widget, base_tag)
-    parser.feed(html_content)
-    parser.close()
+    def clear_cache(self):
+        """清空片段缓存"""
+        with self._lock:
+            self._cache.clear()
+
+
+_default_renderer = MarkdownRenderer()
+
+
+def get_renderer():
+    """获取全局共享的Markdown渲染器"""
+    return _default_renderer
+
+
+def render_markdown(text_widget, text, base_tag="", index=tk.END):
+    """渲染Markdown格式文本到Text widget"""
+    _default_renderer.render(text_widget, text, base_tag, index)
+
+
+def insert_segments(text_widget, segments, index=tk.END):
+    """把已解析的片段通过一次insert写入Text widget"""
+    if segments:
+        text_widget.insert(index, *flatten_segments(segments))
+
+
+def flatten_segments(segments):
+    """将片段列表展开为 Text.insert 的参数序列 [text1, tags1, text2, tags2, ...]"""
+    return [item for segment in segments for item in segment]
 
 
 class HTMLToTextWidgetParser(html.parser.HTMLParser):
-    """将HTML解析并转换为Text widget的格式"""
-    def __init__(self, text_widget, base_tag=""):
+    """将HTML解析为Text widget的文本片段列表 [(文本, 标签), ...]
+    
+    相邻且标签相同的文本节点会合并为一个片段。
+    """
+    def __init__(self, base_tag=""):
         super().__init__()
-        self.text_widget = text_widget
         self.base_tag = base_tag
         self.tag_stack = []
         self.current_tag = base_tag
+        self.segments = []
+        self._pending_parts = []
+        self._pending_tags = None
+    
+    def _emit(self, text, tags):
+        """追加一个文本片段（与前一个同标签片段合并）"""
+        if self._pending_parts and tags == self._pending_tags:
+            self._pending_parts.append(text)
+        else:
+            self._flush_pending()
+            self._pending_parts = [text]
+            self._pending_tags = tags
+    
+    def _flush_pending(self):
+        """把正在合并的片段写入片段列表"""
+        if self._pending_parts:
+            self.segments.append((''.join(self._pending_parts), self._pending_tags))
+            self._pending_parts = []
+    
+    def close(self):
+        """结束解析"""
+        super().close()
+        self._flush_pending()
     
     def handle_starttag(self, tag, attrs):
         """处理开始标签"""
@@ -84,10 +194,9 @@ class HTMLToTextWidgetParser(html.parser.HTMLParser):
         elif tag == 'li':
             self.current_tag = ("md_list", self.base_tag)
         elif tag == 'hr':
-            self.text_widget.insert(tk.END, "─" * config.SEPARATOR_LENGTH + "\n", 
-                                   ("separator", self.base_tag))
+            self._emit("─" * config.SEPARATOR_LENGTH + "\n", ("separator", self.base_tag))
         elif tag == 'br':
-            self.text_widget.insert(tk.END, "\n", self.base_tag)
+            self._emit("\n", self.base_tag)
         else:
             self.current_tag = self.base_tag
     
@@ -97,9 +206,9 @@ class HTMLToTextWidgetParser(html.parser.HTMLParser):
             self.tag_stack.pop()
         
         if tag in ['h1', 'h2', 'h3', 'p', 'li', 'blockquote']:
-            self.text_widget.insert(tk.END, "\n", self.base_tag)
+            self._emit("\n", self.base_tag)
         elif tag in ['ul', 'ol']:
-            self.text_widget.insert(tk.END, "\n", self.base_tag)
+            self._emit("\n", self.base_tag)
         
         # 恢复为基本标签
         self.current_tag = self.base_tag
@@ -109,5 +218,94 @@ class HTMLToTextWidgetParser(html.parser.HTMLParser):
         if data.strip():
             # 移除HTML实体
             data = html.parser.unescape(data)
-            self.text_widget.insert(tk.END, data, self.current_tag)
+            self._emit(data, self.current_tag)
 
+
+class IncrementalMarkdownStream:
+    """流式增量Markdown渲染
+    
+    流式内容追加在Text widget末尾。已闭合的块（空行结束的段落/列表、
+    闭合的代码块、标题行）立即渲染为Markdown，只有末尾未闭合的块以原始
+    文本显示。raw_mark 标记原始文本的起点，结束时只需渲染最后一个块。
+    """
+    
+    def __init__(self, text_widget, base_tag, raw_mark, renderer=None, on_rewrite=None):
+        """初始化，raw_mark 会被设置在当前末尾
+        
+        on_rewrite: 删除原始文本前以删除起点索引调用（用于使高度缓存失效）
+        """
+        self.text_widget = text_widget
+        self.base_tag = base_tag
+        self.raw_mark = raw_mark
+        self.renderer = renderer or _default_renderer
+        self.on_rewrite = on_rewrite
+        self.pending = ""  # 尚未渲染、以原始文本显示的部分
+        self._scan_pos = 0  # pending 中已扫描到的位置（只扫描完整的行）
+        self._fence = None  # 当前所在代码块的围栏标记
+        self.finished = False
+        
+        text_widget.mark_set(raw_mark, "end-1c")
+        text_widget.mark_gravity(raw_mark, tk.LEFT)
+    
+    def _find_block_boundary(self):
+        """扫描新收到的完整行，返回最后一个已闭合块在 pending 中的结束位置"""
+        boundary = 0
+        pending = self.pending
+        while True:
+            line_end = pending.find('\n', self._scan_pos)
+            if line_end < 0:
+                break
+            line = pending[self._scan_pos:line_end].strip()
+            self._scan_pos = line_end + 1
+            
+            if self._fence:
+                # 代码块内只关心闭合围栏
+                if line.startswith(self._fence):
+                    self._fence = None
+                    boundary = self._scan_pos
+            elif line.startswith('```') or line.startswith('~~~'):
+                self._fence = line[:3]
+            elif line == '' or line.startswith('#'):
+                boundary = self._scan_pos
+        return boundary
+    
+    def _render_pending(self, end):
+        """把 pending[:end] 渲染为Markdown，其余部分继续以原始文本显示"""
+        widget = self.text_widget
+        closed, rest = self.pending[:end], self.pending[end:]
+        
+        # 删除原始文本尾部
+        if self.on_rewrite:
+            self.on_rewrite(widget.index(self.raw_mark))
+        widget.delete(self.raw_mark, "end-1c")
+        
+        # 在raw_mark处渲染已闭合的块，右重力使标记移到渲染内容之后
+        if closed.strip():
+            widget.mark_gravity(self.raw_mark, tk.RIGHT)
+            self.renderer.render(widget, closed, self.base_tag, self.raw_mark)
+            widget.mark_gravity(self.raw_mark, tk.LEFT)
+        
+        self.pending = rest
+        self._scan_pos -= end
+        if rest:
+            widget.insert("end-1c", rest, self.base_tag)
+    
+    def feed(self, chunk):
+        """追加一段流式文本"""
+        if not chunk:
+            return
+        self.pending += chunk
+        boundary = self._find_block_boundary()
+        if boundary:
+            self._render_pending(boundary)
+        else:
+            self.text_widget.insert("end-1c", chunk, self.base_tag)
+    
+    def finish(self):
+        """流结束：渲染最后一个（未闭合的）块"""
+        if self.finished:
+            return
+        if self.pending:
+            self._render_pending(len(self.pending))
+        self.text_widget.mark_unset(self.raw_mark)
+        self.finished = True
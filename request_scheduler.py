@@ -0,0 +1,93 @@
+"""生成请求调度模块
+
+限制同时进行的生成请求数。同一会话的请求依次执行（后一条消息依赖前一条回复），
+不同会话之间按轮转顺序调度，排队请求多的会话不会让其他会话一直等待。
+所有方法都在UI线程中调用。
+"""
+
+from collections import deque
+
+
+class RequestScheduler:
+    """生成请求调度器"""
+
+    def __init__(self, max_in_flight):
+        """初始化"""
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self._queues = {}  # 会话ID -> 等待中的启动函数队列
+        self._order = deque()  # 有等待请求的会话ID（轮转顺序）
+        self._running = set()  # 正在生成的会话ID
+
+    def submit(self, session_id, start):
+        """提交请求，返回等待中的请求总数（0表示已立即开始）
+
+        start: 无参可调用对象，开始请求；请求结束时必须调用 finish(session_id)
+        """
+        queue = self._queues.setdefault(session_id, deque())
+        queue.append(start)
+        if session_id not in self._order:
+            self._order.append(session_id)
+        self._dispatch()
+        if start in self._queues.get(session_id, ()):
+            return sum(len(q) for q in self._queues.values())
+        return 0
+
+    def finish(self, session_id):
+        """会话的当前请求已结束，开始下一个等待的请求"""
+        self._running.discard(session_id)
+        self._dispatch()
+
+    def set_max_in_flight(self, max_in_flight):
+        """修改同时进行的请求数上限"""
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self._dispatch()
+
+    def is_busy(self, session_id):
+        """会话是否有正在执行或等待的请求"""
+        return session_id in self._running or bool(self._queues.get(session_id))
+
+    def is_running(self, session_id):
+        """会话是否有正在执行的请求"""
+        return session_id in self._running
+
+    def pending_count(self, session_id):
+        """会话等待中的请求数"""
+        return len(self._queues.get(session_id, ()))
+
+    @property
+    def in_flight(self):
+        """正在执行的请求数"""
+        return len(self._running)
+
+    def cancel_session(self, session_id):
+        """丢弃会话所有等待中的请求（不影响正在执行的请求）"""
+        self._queues.pop(session_id, None)
+        if session_id in self._order:
+            self._order.remove(session_id)
+
+    def _dispatch(self):
+        """在上限内按轮转顺序启动等待中的请求"""
+        while len(self._running) < self.max_in_flight:
+            session_id = self._next_session()
+            if session_id is None:
+                return
+            queue = self._queues[session_id]
+            start = queue.popleft()
+            if not queue:
+                del self._queues[session_id]
+                self._order.remove(session_id)
+            self._running.add(session_id)
+            try:
+                start()
+            except Exception as e:
+                print(f"启动请求失败: {e}")
+                self._running.discard(session_id)
+
+    def _next_session(self):
+        """取下一个可以开始的会话（没有正在执行的请求），并把它移到轮转队尾"""
+        for _ in range(len(self._order)):
+            session_id = self._order[0]
+            self._order.rotate(-1)
+            if session_id not in self._running:
+                return session_id
+        return None
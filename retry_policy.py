@@ -0,0 +1,171 @@
+"""请求重试和限速模块
+
+暂时性的失败（网络中断、超时、429限流、5xx）按指数退避加随机抖动重试，
+服务器返回 Retry-After 时按其等待。本进程的所有请求（包括重试）先从一个
+共享的令牌桶取令牌，限流时整个桶暂停，其他并发请求也会一起等待。
+"""
+
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+from openai import APIConnectionError
+
+import config
+
+
+class TokenBucket:
+    """令牌桶限速器（线程安全，同步和异步请求共用）"""
+
+    def __init__(self, rate=config.RATE_LIMIT_REQUESTS_PER_SECOND,
+                 capacity=config.RATE_LIMIT_BURST):
+        """初始化，桶一开始是满的"""
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """预订一个令牌，返回需要等待的秒数（令牌可以预支，等待结束时即可使用）"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._paused_until)
+            if start > self._updated:
+                self._tokens = min(self.capacity,
+                                   self._tokens + (start - self._updated) * self.rate)
+                self._updated = start
+            self._tokens -= 1
+            wait = start - now
+            if self._tokens < 0:
+                wait += -self._tokens / self.rate
+            return wait
+
+    def pause(self, seconds):
+        """暂停发放令牌（收到限流响应时调用），已积累的令牌清空"""
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self._paused_until:
+                self._paused_until = until
+                self._tokens = min(self._tokens, 0.0)
+                self._updated = max(self._updated, until)
+
+    def acquire(self):
+        """取一个令牌，必要时阻塞等待"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """取一个令牌，必要时让出事件循环等待"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+# 本进程共享的限速器
+rate_limiter = TokenBucket()
+
+
+def is_retryable(error):
+    """是否为可以重试的暂时性错误"""
+    # 流式读取过程中的网络错误直接以httpx异常抛出，没有被openai包装
+    if isinstance(error, (APIConnectionError, httpx.TransportError)):
+        return True
+    return getattr(error, 'status_code', None) in config.API_RETRY_STATUS_CODES
+
+
+def retry_after(error):
+    """服务器要求的等待秒数（Retry-After 头，秒数或HTTP日期），没有时返回None"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt):
+    """第attempt次重试（从0开始）的等待秒数：指数退避，在 [0, 上限] 中随机取值"""
+    limit = min(config.API_RETRY_MAX_DELAY, config.API_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, limit)
+
+
+def retry_delay(error, attempt):
+    """出错后的等待秒数；不可重试或重试次数已用完时返回None"""
+    if attempt >= config.API_MAX_RETRIES or not is_retryable(error):
+        return None
+
+    server_delay = retry_after(error)
+    if server_delay is not None and server_delay >= 0:
+        # 加上少量抖动，避免多个请求在同一时刻一起重试
+        delay = min(server_delay, config.API_RETRY_AFTER_MAX) + \
+            random.uniform(0, config.API_RETRY_BASE_DELAY)
+        # 限流对本进程的所有请求都有效
+        rate_limiter.pause(delay)
+        return delay
+    return backoff_delay(attempt)
+
+
+def notify_retry(on_retry, attempt, delay, error):
+    """调用重试回调 on_retry(第几次重试, 等待秒数, 错误)；没有回调时打印到控制台"""
+    if on_retry is None:
+        print(f"请求失败，{delay:.1f}秒后第{attempt}次重试: {error}")
+        return
+    try:
+        on_retry(attempt, delay, error)
+    except Exception as e:
+        print(f"重试回调出错: {e}")
+
+
+def call_with_retry(func, on_retry=None):
+    """限速并重试调用 func()，返回其结果"""
+    attempt = 0
+    while True:
+        rate_limiter.acquire()
+        try:
+            return func()
+        except Exception as e:
+            delay = retry_delay(e, attempt)
+            if delay is None:
+                raise
+            attempt += 1
+            notify_retry(on_retry, attempt, delay, e)
+            time.sleep(delay)
+
+
+async def call_with_retry_async(coro_factory, on_retry=None):
+    """限速并重试 await coro_factory()，返回其结果（等待期间可以被取消）"""
+    attempt = 0
+    while True:
+        await rate_limiter.acquire_async()
+        try:
+            return await coro_factory()
+        except Exception as e:
+            delay = retry_delay(e, attempt)
+            if delay is None:
+                raise
+            attempt += 1
+            notify_retry(on_retry, attempt, delay, e)
+            await asyncio.sleep(delay)
@@ -0,0 +1,208 @@
+"""全文搜索索引模块
+
+使用SQLite FTS5为导出的对话建立倒排索引（按消息索引内容和思考过程），
+支持中文子串搜索（trigram分词器）。trigram无法匹配少于3个字符的词（如大多数
+两字的中文词），另有一个二元组表 messages_bigram 为这类查询建立索引。
+索引按文件的修改时间和大小增量更新。
+文件路径在索引中统一规范化（与 ConversationStore 相同），相对路径和
+绝对路径指向同一文件时只有一份索引。
+"""
+
+import re
+import sqlite3
+import threading
+
+import config
+from conversation_store import normalize_path
+
+# 连续的字母、数字和汉字（下划线和标点在unicode61中是分隔符）
+_WORD_RUN_RE = re.compile(r'[^\W_]+')
+
+
+class SearchIndex:
+    """对话全文搜索索引"""
+
+    def __init__(self, db_path):
+        """打开（或创建）索引数据库"""
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # 后台线程建索引、UI线程搜索，共用一个连接，由锁保证串行
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        # WAL模式下提交不需要每次同步整个数据库文件，逐个文件建索引时快得多
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.tokenizer = self._create_tables()
+
+    def _create_tables(self):
+        """建表，返回使用的分词器；trigram不可用时退回unicode61"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, mtime REAL, size INTEGER, title TEXT)")
+            for tokenizer in ("trigram", "unicode61"):
+                try:
+                    self.conn.execute(
+                        "CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+                        "title, content, reasoning, path UNINDEXED, msg_index UNINDEXED, "
+                        f"role UNINDEXED, tokenize='{tokenizer}')")
+                    break
+                except sqlite3.OperationalError:
+                    continue
+            row = self.conn.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'messages'").fetchone()
+
+            # 二元组表：每个位置开始的两个字符为一个词，rowid与messages相同；
+            # 早期版本的索引没有这个表，清空后由同步重建
+            has_bigram = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'messages_bigram'").fetchone()
+            if not has_bigram:
+                self.conn.execute(
+                    "CREATE VIRTUAL TABLE messages_bigram USING fts5("
+                    "title, content, reasoning, tokenize='unicode61', prefix='1')")
+                self.conn.execute("DELETE FROM messages")
+                self.conn.execute("DELETE FROM files")
+        return "trigram" if row and "trigram" in row[0] else "unicode61"
+
+    def is_current(self, path, mtime, size):
+        """文件的索引是否是最新的"""
+        path = normalize_path(path)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT mtime, size FROM files WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] == mtime and row[1] == size
+
+    def indexed_paths(self):
+        """已建立索引的文件路径（规范化后的）"""
+        with self._lock:
+            return {row[0] for row in self.conn.execute("SELECT path FROM files")}
+
+    def retain(self, paths):
+        """只保留指定文件的索引，删除其他文件的索引"""
+        keep = {normalize_path(path) for path in paths}
+        for stale in self.indexed_paths() - keep:
+            self.remove(stale)
+
+    def index_conversation(self, path, mtime, size, title, messages):
+        """为一个对话文件建立（或重建）索引"""
+        path = normalize_path(path)
+        rows = [(title or "", msg.get("content") or "", msg.get("reasoning_content") or "",
+                 path, i, msg.get("role", ""))
+                for i, msg in enumerate(messages)]
+        with self._lock, self.conn:
+            self._delete_messages(path)
+            for row in rows:
+                rowid = self.conn.execute(
+                    "INSERT INTO messages (title, content, reasoning, path, msg_index, role) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", row).lastrowid
+                self.conn.execute(
+                    "INSERT INTO messages_bigram (rowid, title, content, reasoning) "
+                    "VALUES (?, ?, ?, ?)", (rowid,) + tuple(_bigram_text(text) for text in row[:3]))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (path, mtime, size, title) VALUES (?, ?, ?, ?)",
+                (path, mtime, size, title))
+
+    def remove(self, path):
+        """删除文件的索引"""
+        path = normalize_path(path)
+        with self._lock, self.conn:
+            self._delete_messages(path)
+            self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def _delete_messages(self, path):
+        """删除文件的所有消息（调用时已持有锁）"""
+        self.conn.execute(
+            "DELETE FROM messages_bigram WHERE rowid IN "
+            "(SELECT rowid FROM messages WHERE path = ?)", (path,))
+        self.conn.execute("DELETE FROM messages WHERE path = ?", (path,))
+
+    def search(self, query, limit=config.SEARCH_RESULT_LIMIT):
+        """搜索，返回按相关度排序的消息命中列表
+
+        每个结果为 {"path", "title", "msg_index", "role", "snippet"}。
+        """
+        terms = query.split()
+        if not terms:
+            return []
+
+        # trigram分词器无法匹配少于3个字符的词，改用二元组表
+        if self.tokenizer == "trigram" and min(len(term) for term in terms) < 3:
+            return self._search_bigram(terms, limit)
+
+        match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT path, title, msg_index, role, "
+                f"snippet(messages, -1, '[', ']', '…', {config.SEARCH_SNIPPET_TOKENS}) "
+                "FROM messages WHERE messages MATCH ? ORDER BY rank LIMIT ?",
+                (match, limit)).fetchall()
+        return [self._make_hit(*row) for row in rows]
+
+    def _search_bigram(self, terms, limit):
+        """用二元组表搜索（不区分大小写），按相关度排序"""
+        match = " ".join(_bigram_query(term) for term in terms)
+        if not match.strip():
+            return []
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT m.path, m.title, m.msg_index, m.role, m.content, m.reasoning "
+                "FROM messages_bigram b JOIN messages m ON m.rowid = b.rowid "
+                "WHERE messages_bigram MATCH ? ORDER BY b.rank LIMIT ?",
+                (match, limit)).fetchall()
+
+        hits = []
+        for path, title, msg_index, role, content, reasoning in rows:
+            text = next((t for t in (content, reasoning, title)
+                         if terms[0].lower() in t.lower()), content)
+            hits.append(self._make_hit(path, title, msg_index, role,
+                                       _make_snippet(text, terms[0])))
+        return hits
+
+    @staticmethod
+    def _make_hit(path, title, msg_index, role, snippet):
+        """构造搜索结果"""
+        return {
+            "path": path,
+            "title": title,
+            "msg_index": int(msg_index),
+            "role": role,
+            "snippet": ' '.join(snippet.split()),
+        }
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self.conn.close()
+
+
+def _bigram_text(text):
+    """把文本转换为二元组词序列：每个位置开始的两个字符（词尾为单个字符）
+
+    子串在二元组序列中是连续的若干个词，可以用短语查询匹配。
+    """
+    tokens = []
+    for run in _WORD_RUN_RE.findall(text.lower()):
+        tokens.extend(run[i:i + 2] for i in range(len(run)))
+    return " ".join(tokens)
+
+
+def _bigram_query(term):
+    """查询词对应的FTS5表达式：单个字符用前缀查询，更长的用二元组短语"""
+    phrases = []
+    for run in _WORD_RUN_RE.findall(term.lower()):
+        if len(run) == 1:
+            phrases.append(f'"{run}"*')
+        else:
+            phrases.append('"' + " ".join(run[i:i + 2] for i in range(len(run) - 1)) + '"')
+    return " ".join(phrases)
+
+
+def _make_snippet(text, term, context=config.SEARCH_SNIPPET_CHARS):
+    """截取关键词附近的文本，关键词用方括号标出"""
+    pos = text.lower().find(term.lower())
+    if pos < 0:
+        return text[:context * 2]
+    start = max(pos - context, 0)
+    end = min(pos + len(term) + context, len(text))
+    snippet = (text[start:pos] + "[" + text[pos:pos + len(term)] + "]" +
+               text[pos + len(term):end])
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
@@ -0,0 +1,114 @@
+"""会话管理模块
+
+每个会话（标签页）有独立的对话历史、对话对、上下文窗口和显示区域，
+SessionManager 记录所有会话和当前显示的会话。
+"""
+
+import config
+import context_manager
+
+
+class ChatSession:
+    """一个独立的对话会话"""
+
+    def __init__(self, session_id, title):
+        """初始化（显示区域的widget由主程序创建后赋值）"""
+        self.id = session_id
+        self.title = title
+        self.titled = False  # 是否已根据第一条消息设置标题
+
+        # 对话数据
+        self.conversation_history = []
+        self.conversation_pairs = {}  # 存储ConversationPair对象
+        self.conversation_pair_frames = {}
+        self.current_pair_index = -1
+
+        # 上下文窗口（发送前裁剪或摘要较早的对话）
+        self.context_manager = context_manager.ContextManager()
+
+        # 正在执行的请求：流式响应的消费者，或非流式请求的Future
+        self.stream_worker = None
+        self.request_future = None
+        self.stop_requested = False  # 用户已点击停止，尚未开始的请求不再发送
+
+        # 显示区域
+        self.tab_frame = None
+        self.chat_canvas = None
+        self.chat_content_frame = None
+        self.pair_view = None
+
+    def get_message(self, msg_index):
+        """按索引获取对话历史中的消息（供对话对重新渲染使用）"""
+        if msg_index is not None and 0 <= msg_index < len(self.conversation_history):
+            return self.conversation_history[msg_index]
+        return None
+
+    def get_ordered_pairs(self):
+        """按显示顺序返回所有对话对"""
+        return [self.conversation_pairs[idx] for idx in sorted(self.conversation_pairs)]
+
+    def set_title_from_message(self, message):
+        """用第一条消息的开头作为会话标题，返回是否修改了标题"""
+        if self.titled:
+            return False
+        text = ' '.join(message.split())
+        if not text:
+            return False
+        if len(text) > config.SESSION_TITLE_LENGTH:
+            text = text[:config.SESSION_TITLE_LENGTH] + "…"
+        self.title = text
+        self.titled = True
+        return True
+
+
+class SessionManager:
+    """会话管理器"""
+
+    def __init__(self):
+        """初始化"""
+        self.sessions = {}  # 会话ID -> ChatSession（按创建顺序）
+        self.active_id = None
+        self._next_id = 1
+
+    def create(self):
+        """新建会话并设为当前会话"""
+        session = ChatSession(self._next_id, f"会话 {self._next_id}")
+        self._next_id += 1
+        self.sessions[session.id] = session
+        self.active_id = session.id
+        return session
+
+    def get(self, session_id):
+        """按ID获取会话"""
+        return self.sessions.get(session_id)
+
+    @property
+    def active(self):
+        """当前显示的会话"""
+        return self.sessions.get(self.active_id)
+
+    def set_active(self, session_id):
+        """切换当前会话"""
+        if session_id in self.sessions:
+            self.active_id = session_id
+
+    def find_by_tab(self, tab_frame):
+        """按标签页Frame查找会话"""
+        for session in self.sessions.values():
+            if str(session.tab_frame) == str(tab_frame):
+                return session
+        return None
+
+    def remove(self, session_id):
+        """移除会话"""
+        self.sessions.pop(session_id, None)
+        if self.active_id == session_id:
+            self.active_id = next(iter(self.sessions), None)
+
+    def __iter__(self):
+        """按创建顺序遍历会话"""
+        return iter(list(self.sessions.values()))
+
+    def __len__(self):
+        """会话数"""
+        return len(self.sessions)
@@ -0,0 +1,165 @@
+"""流式响应引擎模块"""
+
+import asyncio
+import queue
+import threading
+
+import config
+
+# 队列事件类型
+EVENT_THINKING = "thinking"
+EVENT_ANSWER = "answer"
+EVENT_USAGE = "usage"
+EVENT_DONE = "done"
+EVENT_ERROR = "error"
+EVENT_CANCELLED = "cancelled"
+
+TERMINAL_EVENTS = (EVENT_DONE, EVENT_ERROR, EVENT_CANCELLED)
+
+
+class StreamWorker:
+    """流式响应消费者的基类：通过有界队列把增量交给UI线程
+
+    UI线程通过 drain() 定时取出事件，队列满时生产者等待（背压），
+    因此UI每帧的工作量与模型输出速度无关。子类负责迭代流并放入事件。
+    """
+
+    def __init__(self, stream_factory, maxsize=config.STREAM_QUEUE_MAXSIZE):
+        """初始化
+
+        stream_factory: 无参可调用对象，返回流（具体形式由子类决定）
+        """
+        self.stream_factory = stream_factory
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._cancel_event = threading.Event()
+        self._stream = None
+
+    def cancel(self):
+        """请求取消（生产者会在下一个增量或队列等待时退出）"""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        """是否已请求取消"""
+        return self._cancel_event.is_set()
+
+    @staticmethod
+    def _chunk_events(chunk):
+        """把一个chunk转换为事件列表"""
+        events = []
+        # 启用 include_usage 时最后一个chunk带有用量（choices为空）
+        usage = getattr(chunk, 'usage', None)
+        if usage:
+            events.append((EVENT_USAGE, usage))
+        if chunk.choices:
+            delta = chunk.choices[0].delta
+            reasoning = getattr(delta, 'reasoning_content', None)
+            if reasoning:
+                events.append((EVENT_THINKING, reasoning))
+            content = getattr(delta, 'content', None)
+            if content:
+                events.append((EVENT_ANSWER, content))
+        return events
+
+    def _terminal_event(self, error):
+        """结束事件"""
+        if self._cancel_event.is_set():
+            return (EVENT_CANCELLED, None)
+        if error is not None:
+            return (EVENT_ERROR, error)
+        return (EVENT_DONE, None)
+
+    def drain(self, max_events=config.STREAM_DRAIN_MAX_EVENTS):
+        """取出队列中已有的事件（UI线程调用，不阻塞）
+
+        相邻的同类文本增量会被合并，返回 [(事件类型, 数据), ...]
+        """
+        events = []
+        for _ in range(max_events):
+            try:
+                kind, data = self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind in (EVENT_THINKING, EVENT_ANSWER) and events and events[-1][0] == kind:
+                events[-1][1].append(data)
+            elif kind in (EVENT_THINKING, EVENT_ANSWER):
+                events.append((kind, [data]))
+            else:
+                events.append((kind, data))
+
+            if kind in TERMINAL_EVENTS:
+                break
+
+        return [(kind, ''.join(data) if kind in (EVENT_THINKING, EVENT_ANSWER) else data)
+                for kind, data in events]
+
+
+class AsyncStreamWorker(StreamWorker):
+    """在asyncio事件循环中消费流式响应
+
+    所有异步流共用 async_bridge.AsyncLoopThread 的一个线程，
+    同时进行的多个流不需要各自的线程。
+    """
+
+    def __init__(self, loop_thread, stream_factory, maxsize=config.STREAM_QUEUE_MAXSIZE):
+        """初始化
+
+        stream_factory: 无参可调用对象，返回一个协程，该协程的结果是异步可迭代的流
+        """
+        super().__init__(stream_factory, maxsize)
+        self.loop_thread = loop_thread
+        self._future = None
+
+    def start(self):
+        """在事件循环中启动消费任务"""
+        self._future = self.loop_thread.submit(self._run_async())
+
+    def cancel(self):
+        """取消：除设置标志外还取消任务，使等待中的网络读取立即结束"""
+        self._cancel_event.set()
+        if self._future is not None:
+            self._future.cancel()
+
+    async def _put_async(self, event, force=False):
+        """放入队列，队列满时让出事件循环等待（背压）
+
+        force为True时即使已取消也要放入（用于结束事件）。
+        """
+        while force or not self._cancel_event.is_set():
+            try:
+                self.queue.put_nowait(event)
+                return True
+            except queue.Full:
+                await asyncio.sleep(config.STREAM_PUT_TIMEOUT)
+        return False
+
+    async def _run_async(self):
+        """事件循环中的任务：迭代流并推送增量"""
+        error = None
+        try:
+            self._stream = await self.stream_factory()
+            async for chunk in self._stream:
+                if self._cancel_event.is_set():
+                    break
+                for event in self._chunk_events(chunk):
+                    if not await self._put_async(event):
+                        break
+        except asyncio.CancelledError:
+            self._cancel_event.set()
+        except Exception as e:
+            error = str(e)
+        finally:
+            await self._close_stream_async()
+
+        # 结束事件必须送达，UI线程会一直取到结束事件为止
+        await self._put_async(self._terminal_event(error), force=True)
+
+    async def _close_stream_async(self):
+        """关闭底层异步流（释放HTTP连接），流可以是异步生成器"""
+        close = getattr(self._stream, 'aclose', None) or getattr(self._stream, 'close', None)
+        if close:
+            try:
+                await close()
+            except Exception:
+                pass
@@ -0,0 +1,116 @@
+"""Token计数模块
+
+离线估计文本和消息的token数。默认使用按字符类别估算的启发式方法；
+安装了 tokenizers 且存在 config.TOKENIZER_FILE（DeepSeek 提供的
+tokenizer.json）时使用真实分词器。也可以用 set_tokenizer() 换成其他实现。
+
+每条消息的计数缓存在消息字典的 "_tokens" 键中（下划线开头的键不会被保存）。
+"""
+
+import os
+import threading
+
+import config
+
+_lock = threading.Lock()
+_tokenizer = None  # (名称, 计数函数)，首次使用时加载
+
+
+def heuristic_count(text):
+    """启发式估计：中文等非ASCII字符约0.6个token，英文字符、数字和符号约0.3个token"""
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    ascii_count = len(text) - non_ascii
+    return int(non_ascii * config.TOKENS_PER_CJK_CHAR + ascii_count * config.TOKENS_PER_ASCII_CHAR) + 1
+
+
+def _load_tokenizer_file(path):
+    """加载tokenizer.json，tokenizers未安装或文件不存在时返回None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        from tokenizers import Tokenizer
+    except ImportError:
+        return None
+    try:
+        tokenizer = Tokenizer.from_file(path)
+    except Exception as e:
+        print(f"加载分词器失败，使用估算方法: {e}")
+        return None
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def set_tokenizer(name, count_func):
+    """设置计数函数 count_func(text) -> int；已缓存的消息计数会因名称不同而自动失效"""
+    global _tokenizer
+    with _lock:
+        _tokenizer = (name, count_func)
+
+
+def get_tokenizer():
+    """当前使用的 (名称, 计数函数)"""
+    global _tokenizer
+    with _lock:
+        if _tokenizer is None:
+            count_func = _load_tokenizer_file(config.TOKENIZER_FILE)
+            if count_func is not None:
+                _tokenizer = ("tokenizer", count_func)
+            else:
+                _tokenizer = ("heuristic", heuristic_count)
+        return _tokenizer
+
+
+def count_tokens(text):
+    """计算文本的token数"""
+    if not text:
+        return 0
+    return get_tokenizer()[1](text)
+
+
+def message_tokens(msg):
+    """一条消息发送时占用的token数（只有content会发送，思考过程不发送），结果缓存在消息上"""
+    name, count_func = get_tokenizer()
+    content = msg.get("content") or ""
+    cached = msg.get("_tokens")
+    # 消息内容被替换（如流式回复结束时）或换了分词器时重新计算
+    if cached is not None and cached[0] == name and cached[1] is content:
+        return cached[2]
+    tokens = (count_func(content) if content else 0) + config.CONTEXT_MESSAGE_OVERHEAD_TOKENS
+    msg["_tokens"] = (name, content, tokens)
+    return tokens
+
+
+def messages_tokens(messages):
+    """多条消息的token数之和"""
+    return sum(message_tokens(msg) for msg in messages)
+
+
+def usage_record(usage, estimated_prompt_tokens=None):
+    """把API返回的usage整理为字典，并附上发送前估计的输入token数以便比较"""
+    record = {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "total_tokens": getattr(usage, "total_tokens", None),
+    }
+    # DeepSeek返回的前缀缓存命中情况
+    for key in ("prompt_cache_hit_tokens", "prompt_cache_miss_tokens"):
+        value = getattr(usage, key, None)
+        if value is not None:
+            record[key] = value
+    if estimated_prompt_tokens is not None:
+        record["estimated_prompt_tokens"] = estimated_prompt_tokens
+    return record
+
+
+def format_usage(record):
+    """状态栏显示的用量文本"""
+    text = f"输入 {record.get('prompt_tokens', 'N/A')}"
+    estimated = record.get("estimated_prompt_tokens")
+    if estimated is not None:
+        text += f"（估计 {estimated}）"
+    text += f" | 输出 {record.get('completion_tokens', 'N/A')}"
+    if "prompt_cache_hit_tokens" in record:
+        text += (f" | 缓存命中 {record['prompt_cache_hit_tokens']}"
+                 f" / 未命中 {record.get('prompt_cache_miss_tokens', 'N/A')}")
+    return text
@@ -246,3 +246,127 @@ def create_frame_with_checkbox(parent, label_text, variable, command=None, **kwa
     
     return frame, checkbox
 
+
+
+class VirtualListView:
+    """虚拟化列表：只为可见的行创建widget
+    
+    所有行高度相同，滚动区域按 行数 × 行高 计算。固定数量的行widget
+    组成一个池，滚动时把池中的行移动到新的可见位置并重新绑定数据，
+    因此widget数量只与窗口高度有关，与列表长度无关。
+    """
+    
+    def __init__(self, parent, row_height, create_row, bind_row, bg_color=None):
+        """初始化
+        
+        create_row(parent): 创建一行widget，返回行的Frame
+        bind_row(row_frame, item): 把数据绑定到一行widget上（更新文字等）
+        """
+        theme = config.get_theme()
+        if bg_color is None:
+            bg_color = theme.get('COLOR_BG_CHAT', config.COLOR_BG_CHAT)
+        
+        self.row_height = row_height
+        self.create_row = create_row
+        self.bind_row = bind_row
+        self.items = []
+        self.rows = []  # [(行Frame, canvas窗口ID)]
+        self.row_items = {}  # 行Frame -> 当前绑定的数据索引
+        self._first = None
+        self._refresh_pending = False
+        
+        self.scrollbar = tk.Scrollbar(parent, orient=tk.VERTICAL)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        # 每次滚动一整行
+        self.canvas = tk.Canvas(parent, bg=bg_color, highlightthickness=0,
+                                yscrollincrement=row_height,
+                                yscrollcommand=self._on_yscroll)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.config(command=self.canvas.yview)
+        
+        self.canvas.bind('<Configure>', lambda e: self._on_resize())
+        self.canvas.bind("<MouseWheel>", self._on_mousewheel)
+    
+    def _on_mousewheel(self, event):
+        """滚轮滚动"""
+        self.canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
+        return "break"
+    
+    def _on_yscroll(self, first, last):
+        """视图滚动时更新滚动条并重新排列可见行"""
+        self.scrollbar.set(first, last)
+        self.schedule_refresh()
+    
+    def _on_resize(self):
+        """Canvas大小变化：调整行宽度和行池大小"""
+        width = self.canvas.winfo_width()
+        for _, window_id in self.rows:
+            self.canvas.itemconfig(window_id, width=width)
+        self._update_scroll_region()
+        self.refresh(force=True)
+    
+    def _update_scroll_region(self):
+        """按行数设置滚动区域"""
+        height = len(self.items) * self.row_height
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), height))
+    
+    def _ensure_pool(self, count):
+        """行池中至少有count个行widget"""
+        width = self.canvas.winfo_width()
+        while len(self.rows) < count:
+            row = self.create_row(self.canvas)
+            window_id = self.canvas.create_window(0, -self.row_height, window=row,
+                                                  anchor=tk.NW, width=width,
+                                                  height=self.row_height)
+            _bind_mousewheel_recursive(row, self.canvas)
+            self.rows.append((row, window_id))
+    
+    def set_items(self, items):
+        """设置列表数据并刷新可见行"""
+        self.items = list(items)
+        self._update_scroll_region()
+        if not self.items:
+            self.canvas.yview_moveto(0.0)
+        self.refresh(force=True)
+    
+    def get_item(self, row):
+        """获取行widget当前绑定的数据"""
+        index = self.row_items.get(row)
+        if index is None or index >= len(self.items):
+            return None
+        return self.items[index]
+    
+    def schedule_refresh(self):
+        """在空闲时刷新可见行（合并同一轮事件中的多次滚动）"""
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.canvas.after_idle(self.refresh)
+    
+    def refresh(self, force=False):
+        """把行池中的行移动到当前可见位置并绑定数据"""
+        self._refresh_pending = False
+        visible_count = max(self.canvas.winfo_height(), self.row_height) // self.row_height + 2
+        self._ensure_pool(visible_count)
+        
+        first = max(int(self.canvas.canvasy(0)) // self.row_height, 0)
+        if first == self._first and not force:
+            return
+        self._first = first
+        
+        # 数据索引按行池大小取模映射到固定的行，滚动一行只需重新绑定一行
+        pool_size = len(self.rows)
+        bound = set()
+        for index in range(first, min(first + pool_size, len(self.items))):
+            row, window_id = self.rows[index % pool_size]
+            bound.add(row)
+            if self.row_items.get(row) != index or force:
+                self.row_items[row] = index
+                self.bind_row(row, self.items[index])
+            self.canvas.coords(window_id, 0, index * self.row_height)
+        
+        # 没有数据的行移出可见区域
+        for row, window_id in self.rows:
+            if row not in bound:
+                self.row_items.pop(row, None)
+                self.canvas.coords(window_id, 0, -self.row_height)